@@ -0,0 +1,119 @@
+"""
+Alertes précoces sur l'ensemble du portefeuille.
+
+Toutes les règles sont évaluées pour tous les comptes en une passe
+vectorisée, pour un mois de référence :
+
+- taux d'utilisation moyen du mois supérieur à un niveau (``calculer_portefeuille``) ;
+- nombre de jours du mois au-delà de la limite de crédit (solde > limite),
+  compté sur les lignes de l'index par compte ;
+- durée moyenne de découvert sur les 12 mois précédents supérieure à N
+  mois et absence de Credit Line Overdraft (``historique_decouvert``, une
+  passe par fenêtres glissantes sur tous les comptes).
+
+Une règle dont le paramètre vaut None n'est pas évaluée. Les comptes en
+alerte sont classés par nombre de règles déclenchées puis par gravité
+(taux d'utilisation, durée de découvert, jours au-delà de la limite).
+"""
+import numpy as np
+import pandas as pd
+
+from portefeuille import calculer_portefeuille, historique_decouvert
+
+# Paramètres des règles proposés par défaut
+TAUX_USAGE_ALERTE = 100.0
+JOURS_AU_DELA_ALERTE = 5
+DUREE_DECOUVERT_ALERTE = 3.0
+
+COLONNES_ALERTES = [
+    "RANG", "COMPTE", "NB_ALERTES", "TAUX_USAGE_MOYEN", "TAUX_USAGE_MAX", "NB_JOURS", "NB_JOURS_AU_DELA",
+    "DUREE_MOYENNE_DECOUVERT", "NB_EPISODES_DECOUVERT", "NB_CREDIT_LINE_OVERDRAFT",
+    "ALERTE_USAGE", "ALERTE_JOURS_AU_DELA", "ALERTE_DECOUVERT", "ALERTE_CREDIT_LINE",
+]
+
+
+def _limites(comptes, limite_credit):
+    """Limite de chaque compte (valeur unique ou série indexée par COMPTE), NaN si elle n'est pas positive"""
+    if isinstance(limite_credit, (pd.Series, dict)):
+        limites = pd.Series(comptes).map(limite_credit).to_numpy(dtype=np.float64, copy=True)
+    else:
+        limites = np.full(len(comptes), float(limite_credit) if limite_credit else np.nan)
+    limites[~(limites > 0)] = np.nan
+    return limites
+
+
+def jours_au_dela_limite(df_solde, annee, mois, limite_credit, index=None):
+    """Nombre de jours du mois dont le solde dépasse la limite de crédit, pour chaque compte présent"""
+    debut = np.datetime64(pd.Timestamp(year=annee, month=mois, day=1), "ns")
+    fin = np.datetime64(pd.Timestamp(year=annee, month=mois, day=1) + pd.offsets.MonthBegin(1), "ns")
+    if index is not None:
+        comptes = np.repeat(index.comptes, index.fins - index.debuts)
+        dates, soldes = index.dates, index.df["SOLDE"]
+    else:
+        comptes = df_solde["COMPTE"].to_numpy()
+        dates, soldes = df_solde["DATPOS"].to_numpy(dtype="datetime64[ns]"), df_solde["SOLDE"]
+    dans_mois = (dates >= debut) & (dates < fin)
+    comptes = comptes[dans_mois]
+    soldes = soldes.to_numpy(dtype=np.float64)[dans_mois]
+    with np.errstate(invalid="ignore"):
+        au_dela = soldes > _limites(comptes, limite_credit)
+    return (
+        pd.DataFrame({"COMPTE": comptes, "NB_JOURS_AU_DELA": au_dela})
+        .groupby("COMPTE", sort=True)["NB_JOURS_AU_DELA"]
+        .sum()
+        .astype(np.int64)
+        .reset_index()
+    )
+
+
+def scanner_alertes(df_solde, annee, mois, limite_credit, seuil_decouvert, taux_usage=TAUX_USAGE_ALERTE,
+                    jours_au_dela=JOURS_AU_DELA_ALERTE, duree_decouvert=DUREE_DECOUVERT_ALERTE,
+                    sans_credit_line=True, index=None, cube=None):
+    """
+    Comptes en alerte pour le mois de référence, classés du plus au moins
+    préoccupant (colonnes ``COLONNES_ALERTES``) :
+
+    - ALERTE_USAGE : taux d'utilisation moyen > ``taux_usage`` % ;
+    - ALERTE_JOURS_AU_DELA : plus de ``jours_au_dela`` jours au-delà de la limite ;
+    - ALERTE_DECOUVERT : durée moyenne de découvert > ``duree_decouvert`` mois ;
+    - ALERTE_CREDIT_LINE : aucun Credit Line Overdraft sur une fenêtre d'au
+      moins deux mois (si ``sans_credit_line``).
+    """
+    periode = pd.Period(year=annee, month=mois, freq="M")
+
+    usage = calculer_portefeuille(df_solde, limite_credit, index=index, cube=cube)
+    usage = usage.loc[usage["MOIS"] == periode, ["COMPTE", "NB_JOURS", "TAUX_USAGE_MOYEN", "TAUX_USAGE_MAX"]]
+    jours = jours_au_dela_limite(df_solde, annee, mois, limite_credit, index=index)
+    decouvert = historique_decouvert(df_solde, seuil_decouvert, index=index, cube=cube)
+    decouvert = decouvert.loc[
+        decouvert["MOIS"] == periode,
+        ["COMPTE", "DUREE_MOYENNE_DECOUVERT", "NB_EPISODES_DECOUVERT", "NB_MOIS_FENETRE_CREDIT_LINE",
+         "NB_CREDIT_LINE_OVERDRAFT"]
+    ]
+
+    scan = usage.merge(jours, on="COMPTE", how="outer").merge(decouvert, on="COMPTE", how="outer")
+    if scan.empty:
+        return pd.DataFrame(columns=COLONNES_ALERTES)
+
+    faux = np.zeros(len(scan), dtype=bool)
+    with np.errstate(invalid="ignore"):
+        scan["ALERTE_USAGE"] = (scan["TAUX_USAGE_MOYEN"] > taux_usage).to_numpy() if taux_usage is not None \
+            else faux
+        scan["ALERTE_JOURS_AU_DELA"] = (scan["NB_JOURS_AU_DELA"] > jours_au_dela).to_numpy() \
+            if jours_au_dela is not None else faux
+        scan["ALERTE_DECOUVERT"] = (scan["DUREE_MOYENNE_DECOUVERT"] > duree_decouvert).to_numpy() \
+            if duree_decouvert is not None else faux
+        scan["ALERTE_CREDIT_LINE"] = (
+            (scan["NB_MOIS_FENETRE_CREDIT_LINE"] >= 2) & (scan["NB_CREDIT_LINE_OVERDRAFT"] == 0)
+        ).to_numpy() if sans_credit_line else faux
+    alertes = ["ALERTE_USAGE", "ALERTE_JOURS_AU_DELA", "ALERTE_DECOUVERT", "ALERTE_CREDIT_LINE"]
+    scan["NB_ALERTES"] = scan[alertes].sum(axis=1).astype(np.int64)
+
+    scan = scan[scan["NB_ALERTES"] > 0].sort_values(
+        ["NB_ALERTES", "TAUX_USAGE_MOYEN", "DUREE_MOYENNE_DECOUVERT", "NB_JOURS_AU_DELA", "COMPTE"],
+        ascending=[False, False, False, False, True], na_position="last", kind="mergesort"
+    )
+    scan["RANG"] = np.arange(1, len(scan) + 1)
+    for colonne in ["NB_JOURS", "NB_JOURS_AU_DELA", "NB_EPISODES_DECOUVERT", "NB_CREDIT_LINE_OVERDRAFT"]:
+        scan[colonne] = scan[colonne].astype("Int64")
+    return scan[COLONNES_ALERTES].reset_index(drop=True)
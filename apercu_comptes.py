@@ -0,0 +1,170 @@
+"""
+Aperçu rapide des comptes d'un fichier importé.
+
+Pour choisir le compte et la période à analyser, la liste des comptes et
+les dates couvertes suffisent : inutile d'attendre la lecture complète et
+typée du fichier, qui prend plusieurs dizaines de secondes pour un gros
+classeur Excel. L'aperçu ne lit que la colonne COMPTE et la colonne de
+date :
+
+- CSV et Parquet : lecteurs Arrow limités aux deux colonnes ;
+- .xlsx : la première feuille est parcourue en mode lecture seule
+  d'openpyxl et seules les valeurs des deux colonnes sont conservées
+  (numéros de série sans format date convertis en dates) ;
+- .xls : ``pd.read_excel`` limité aux deux colonnes.
+
+Le résultat compte une ligne par compte (COMPTE, NB_LIGNES, DATE_MIN,
+DATE_MAX) et est conservé dans le cache Parquet comme les fichiers lus. La
+lecture complète se poursuit en arrière-plan (voir chargement.py).
+"""
+import datetime
+
+import openpyxl
+import pandas as pd
+from openpyxl.utils.datetime import CALENDAR_MAC_1904
+
+from cache_fichiers import empreinte_schema, lire_avec_cache
+from calculs import dates_mvt, dates_solde, types_solde
+from lecture_arrow import format_fichier, lire_arrow
+
+COLONNES_APERCU = ["COMPTE", "NB_LIGNES", "DATE_MIN", "DATE_MAX"]
+
+# Empreintes des aperçus dans le cache Parquet
+schema_apercu_solde = empreinte_schema({"COMPTE": types_solde["COMPTE"]}, dates_solde, variante="apercu")
+schema_apercu_mvt = empreinte_schema({"COMPTE": types_solde["COMPTE"]}, dates_mvt, variante="apercu")
+
+# Origine des numéros de série des dates Excel (calendriers 1900 et 1904)
+ORIGINE_1900 = pd.Timestamp("1899-12-30")
+ORIGINE_1904 = pd.Timestamp("1904-01-01")
+
+
+def _en_dates(valeurs, origine):
+    """
+    Dates d'une colonne lue par openpyxl : dates des cellules au format
+    date, numéros de série des cellules numériques sans format, textes
+    convertis par pandas ; NaT pour les autres valeurs
+    """
+    valeurs = pd.Series(valeurs, dtype=object)
+    types = valeurs.map(type)
+    nombres = pd.to_numeric(valeurs.where(types.isin([int, float])), errors="coerce")
+    dates = pd.to_datetime(nombres, unit="D", origin=origine, errors="coerce").dt.round("s")
+    horodatees = types.map(lambda t: issubclass(t, datetime.date))
+    if horodatees.any():
+        dates[horodatees] = pd.to_datetime(valeurs[horodatees])
+    textes = types == str
+    if textes.any():
+        dates[textes] = pd.to_datetime(valeurs[textes], errors="coerce")
+    return dates
+
+
+def lire_colonnes_xlsx(source, colonne_date):
+    """
+    COMPTE et la colonne de date de la première feuille d'un .xlsx, lus en
+    mode lecture seule d'openpyxl (comme lecture_streaming.py) ; seules les
+    valeurs des deux colonnes sont conservées. Une ValueError est levée si
+    une des deux colonnes est absente de l'en-tête.
+    """
+    classeur = openpyxl.load_workbook(source, read_only=True, data_only=True)
+    try:
+        origine = ORIGINE_1904 if classeur.epoch == CALENDAR_MAC_1904 else ORIGINE_1900
+        feuille = classeur.active
+        # La dimension déclarée par le fichier peut être fausse : toutes les lignes sont lues
+        feuille.reset_dimensions()
+        lignes = feuille.iter_rows(values_only=True)
+        entete = next(lignes, None)
+        if entete is None:
+            return pd.DataFrame({"COMPTE": pd.Series([], dtype="float64"), colonne_date: pd.to_datetime([])})
+        entete = [str(c).strip() if c is not None else None for c in entete]
+        manquantes = [c for c in ("COMPTE", colonne_date) if c not in entete]
+        if manquantes:
+            raise ValueError(f"Colonnes absentes du fichier : {', '.join(manquantes)}")
+
+        position_compte, position_date = entete.index("COMPTE"), entete.index(colonne_date)
+        comptes, dates = [], []
+        for ligne in lignes:
+            if ligne is None:
+                continue
+            comptes.append(ligne[position_compte] if position_compte < len(ligne) else None)
+            dates.append(ligne[position_date] if position_date < len(ligne) else None)
+    finally:
+        classeur.close()
+
+    comptes = pd.to_numeric(pd.Series(comptes, dtype=object), errors="coerce").astype("float64")
+    return pd.DataFrame({"COMPTE": comptes, colonne_date: _en_dates(dates, origine)})
+
+
+def lire_colonnes(source, colonne_date):
+    """COMPTE et la colonne de date d'un fichier Excel, CSV ou Parquet"""
+    format_source = format_fichier(source)
+    if format_source != "excel":
+        return lire_arrow(source, {"COMPTE": "float64"}, [colonne_date], colonnes=["COMPTE", colonne_date])
+    nom = source if isinstance(source, str) else getattr(source, "name", "") or ""
+    if nom.lower().endswith(".xls"):
+        return pd.read_excel(source, usecols=["COMPTE", colonne_date], parse_dates=[colonne_date])
+    return lire_colonnes_xlsx(source, colonne_date)
+
+
+def resumer_comptes(df, colonne_date):
+    """Nombre de lignes et première / dernière date de chaque compte"""
+    df = df[df["COMPTE"].notna()]
+    resume = (
+        df.groupby("COMPTE")[colonne_date]
+        .agg(NB_LIGNES="size", DATE_MIN="min", DATE_MAX="max")
+        .reset_index()
+    )
+    resume["COMPTE"] = resume["COMPTE"].astype("int64")
+    return resume[COLONNES_APERCU]
+
+
+def lire_apercu(source, colonne_date, cle_contenu=None):
+    """Aperçu des comptes d'un fichier, via le cache Parquet pour les fichiers Excel et CSV"""
+    def lecteur(s):
+        return resumer_comptes(lire_colonnes(s, colonne_date), colonne_date)
+
+    if format_fichier(source) == "parquet":
+        return lecteur(source)
+    schema = schema_apercu_solde if colonne_date in dates_solde else schema_apercu_mvt
+    return lire_avec_cache(source, schema, lecteur, cle_contenu=cle_contenu)
+
+
+def apercu_depuis_index(index):
+    """Aperçu des comptes de données déjà chargées, tiré des plages de l'index par compte"""
+    if not len(index.comptes):
+        return pd.DataFrame(columns=COLONNES_APERCU)
+    return pd.DataFrame({
+        "COMPTE": index.comptes.astype("int64"),
+        "NB_LIGNES": index.fins - index.debuts,
+        "DATE_MIN": index.dates[index.debuts],
+        "DATE_MAX": index.dates[index.fins - 1],
+    })
+
+
+def fusionner_apercus(apercu_solde, apercu_mvt=None):
+    """
+    Comptes présents dans les soldes ou dans les mouvements, avec le nombre
+    de lignes de chaque fichier et les dates extrêmes des deux
+    """
+    apercu = apercu_solde.rename(columns={"NB_LIGNES": "NB_SOLDES"})
+    if apercu_mvt is None:
+        apercu["NB_MOUVEMENTS"] = 0
+    else:
+        apercu = apercu.merge(
+            apercu_mvt.rename(columns={"NB_LIGNES": "NB_MOUVEMENTS"}),
+            on="COMPTE", how="outer", suffixes=("", "_MVT")
+        )
+        apercu["DATE_MIN"] = apercu[["DATE_MIN", "DATE_MIN_MVT"]].min(axis=1)
+        apercu["DATE_MAX"] = apercu[["DATE_MAX", "DATE_MAX_MVT"]].max(axis=1)
+    apercu[["NB_SOLDES", "NB_MOUVEMENTS"]] = apercu[["NB_SOLDES", "NB_MOUVEMENTS"]].fillna(0).astype("int64")
+    return apercu[["COMPTE", "NB_SOLDES", "NB_MOUVEMENTS", "DATE_MIN", "DATE_MAX"]].sort_values(
+        "COMPTE", ignore_index=True
+    )
+
+
+def periode_apercu(apercu, compte=None):
+    """Première et dernière date d'un compte, ou de tous les comptes ; (None, None) sans date"""
+    if compte is not None:
+        apercu = apercu[apercu["COMPTE"] == compte]
+    debut, fin = apercu["DATE_MIN"].min(), apercu["DATE_MAX"].max()
+    if pd.isna(debut) or pd.isna(fin):
+        return None, None
+    return pd.Timestamp(debut), pd.Timestamp(fin)
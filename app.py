@@ -1,10 +1,52 @@
 import streamlit as st
 import pandas as pd
 from datetime import datetime
+from functools import partial
 import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import numpy as np
+import os
+import tempfile
+
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from alertes import DUREE_DECOUVERT_ALERTE, JOURS_AU_DELA_ALERTE, TAUX_USAGE_ALERTE, scanner_alertes
+from apercu_comptes import (
+    apercu_depuis_index,
+    fusionner_apercus,
+    periode_apercu,
+    schema_apercu_mvt,
+    schema_apercu_solde,
+)
+from cache_fichiers import empreinte_contenu, invalider_cache, purger_schemas_obsoletes, statistiques_cache
+from cache_resultats import TAILLE_CACHE_RESULTATS, CacheResultats
+from calculs import (
+    analyser_decouvert_et_credit_line_overdraft,
+    calculer_turnover_utilisation,
+    lire_mouvements,
+    lire_soldes,
+    schema_mvt,
+    schema_mvt_streaming,
+    schema_solde,
+)
+from chargement import MOUVEMENTS, SOLDES, ChargeurArrierePlan
+from compaction import bilan_compaction
+from donnees_partagees import bilan_memoire
+from entrepot import Entrepot
+from export_rapport import FORMATS_RAPPORT, exporter_rapport
+from graphiques import SEUIL_WEBGL, figure_serie
+from instrumentation import JournalPerformance, configurer_journal_fichier
+from lecture_streaming import COLONNES_ANALYSE_MVT
+from portefeuille import (
+    analyser_duree_decouvert_portefeuille,
+    calculer_portefeuille,
+    exporter_table,
+    historique_decouvert,
+    historique_turnover,
+    historique_turnover_portefeuille,
+)
+from sensibilite import NB_POINTS_SENSIBILITE, calculer_sensibilite
 
 # Configuration de la page
 st.set_page_config(
@@ -113,201 +155,206 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# --- Définition des types ---
-types_solde = {
-    "COMPTE": "int64",
-    "SOLDE": "int64"
-}
-dates_solde = ["DATPOS"]
-
-types_mvt = {
-    "COMPTE": "int64",
-    "MNTDEV": "int64",
-    "LIBELLE": "string",
-    "CODOPSC": "string",
-    "EXPL": "string",
-    "NATOP": "object",
-    "REFREL": "object",
-    "NOOPER": "string",
-    "DATHGEN": "float64",
-    "NOREF": "float64",
-    "DATECH": "float64",
-    "XCASH": "float64"
-}
-dates_mvt = ["DATOPER"]
-
 # --- Fonctions utilitaires ---
-@st.cache_data
-def lire_fichier_solde(uploaded_file):
-    try:
-        df = pd.read_excel(uploaded_file, dtype=types_solde, parse_dates=dates_solde)
-        return df, None
-    except Exception as e:
-        return None, str(e)
-
-@st.cache_data
-def lire_fichier_mvt(uploaded_file):
-    try:
-        df = pd.read_excel(uploaded_file, dtype=types_mvt, parse_dates=dates_mvt)
-        if 'DATVAL' in df.columns:
-            df = df.drop(columns=['DATVAL'])
-        return df, None
-    except Exception as e:
-        return None, str(e)
-
-def obtenir_comptes_disponibles(df_solde, df_mvt):
-    comptes_solde = df_solde['COMPTE'].dropna().unique() if df_solde is not None else []
-    comptes_mvt = df_mvt['COMPTE'].dropna().unique() if df_mvt is not None else []
-    comptes = set(comptes_solde).union(set(comptes_mvt))
-    return sorted(comptes)
-
-def filtrer_par_compte_mois_annee(df_solde, df_mvt, compte, annee, mois):
-    df_solde_filtre = df_solde[
-        (df_solde["COMPTE"] == compte) &
-        (df_solde["DATPOS"].dt.year == annee) &
-        (df_solde["DATPOS"].dt.month == mois)
-    ] if df_solde is not None else pd.DataFrame()
-
-    df_mvt_filtre = df_mvt[
-        (df_mvt["COMPTE"] == compte) &
-        (df_mvt["DATOPER"].dt.year == annee) &
-        (df_mvt["DATOPER"].dt.month == mois)
-    ] if df_mvt is not None else pd.DataFrame()
-
-    return df_solde_filtre, df_mvt_filtre
-
-def calculer_usage_rate_mensuel(df_solde_filtre, limite_credit):
-    if df_solde_filtre.empty:
-        return None, None
-    
-    df_result = df_solde_filtre.copy()
-    df_result['TAUX_USAGE'] = (df_result['SOLDE'] / limite_credit) * 100
-    moyenne_taux = df_result['TAUX_USAGE'].mean()
-    
-    return moyenne_taux, df_result
-
-def calculer_turnover_routed_depuis_solde(df_solde, compte, annee, mois):
-    date_ref = pd.Timestamp(year=annee, month=mois, day=1)
-    debut_periode = date_ref - pd.DateOffset(months=2)
-    fin_periode = date_ref + pd.DateOffset(months=1) - pd.Timedelta(days=1)
-
-    df_filtre = df_solde[
-        (df_solde['COMPTE'] == compte) &
-        (df_solde['DATPOS'] >= debut_periode) &
-        (df_solde['DATPOS'] <= fin_periode)
-    ].sort_values(by='DATPOS').reset_index(drop=True)
-
-    if df_filtre.empty or len(df_filtre) < 2:
-        return None, None
-
-    df_filtre['VARIATION'] = df_filtre['SOLDE'].diff()
-    df_filtre['FLUX_CREDITEUR'] = df_filtre['VARIATION'].apply(lambda x: x if x > 0 else 0)
-    total_flux_crediteur = df_filtre['FLUX_CREDITEUR'].sum()
-    moyenne_solde = df_filtre['SOLDE'].mean()
-
-    if moyenne_solde == 0:
-        return None, None
-
-    turnover = (total_flux_crediteur / moyenne_solde) * 100
-    return turnover, df_filtre
-
-# --- Nouvelles fonctions pour l'analyse de découvert ---
-def moyenne_duree_decouvert(groupe):
-    """Calcule la durée moyenne des périodes de découvert consécutives"""
-    a_decouvert = groupe['A_DECOUVERT'].values
-    if not a_decouvert.any():
-        return 0
-    durees = []
-    count = 0
-    for val in a_decouvert:
-        if val:
-            count += 1
+@st.cache_resource
+def purger_cache_obsolete():
+    """Supprime une fois par processus les entrées du cache produites avec d'anciens schémas"""
+    return purger_schemas_obsoletes(
+        [schema_solde, schema_mvt, schema_mvt_streaming, schema_apercu_solde, schema_apercu_mvt]
+    )
+
+@st.cache_resource
+def activer_journal_fichier():
+    """Active une fois par processus l'écriture des mesures dans le fichier BOA_JOURNAL_PERF"""
+    return configurer_journal_fichier()
+
+@st.cache_resource
+def obtenir_cache_resultats():
+    """Cache LRU des résultats d'analyse, partagé par toutes les sessions"""
+    return CacheResultats(TAILLE_CACHE_RESULTATS)
+
+def id_session():
+    """Identifiant de la session Streamlit courante, None hors exécution Streamlit"""
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else None
+
+def empreinte_import(fichier, cle):
+    """
+    Empreinte du contenu d'un fichier importé, calculée une fois par import
+    et gardée dans la session : les réexécutions du script ne relisent pas
+    tout le fichier
+    """
+    identifiant = getattr(fichier, "file_id", None) or (fichier.name, fichier.size)
+    memoire = st.session_state.get(cle)
+    if memoire is None or memoire[0] != identifiant:
+        memoire = (identifiant, empreinte_contenu(fichier))
+        st.session_state[cle] = memoire
+    return memoire[1]
+
+@st.cache_resource
+def obtenir_chargeur():
+    """Pool de chargement des fichiers, partagé par toutes les sessions"""
+    return ChargeurArrierePlan()
+
+@st.cache_resource
+def obtenir_entrepot():
+    """Entrepôt local des soldes et des mouvements, partagé par toutes les sessions"""
+    return Entrepot()
+
+@st.cache_resource(max_entries=2)
+def charger_entrepot(version, compacte=False, colonnes_utiles=False):
+    """Données de l'entrepôt pour une version donnée, relues une seule fois par processus"""
+    return obtenir_entrepot().charger(compacte=compacte, colonnes_utiles=colonnes_utiles)
+
+def gerer_entrepot(entrepot):
+    """Statistiques de l'entrepôt local et ajout d'un nouvel extrait"""
+    with st.sidebar.expander("🗄️ Entrepôt local", expanded=entrepot.est_vide()):
+        stats = entrepot.statistiques()
+        if stats['DATES_SOLDES']:
+            debut, fin = (pd.Timestamp(d).strftime('%d/%m/%Y') for d in stats['DATES_SOLDES'])
+            st.caption(
+                f"Version {stats['VERSION']} - {stats['NB_MOIS']} mois du {debut} au {fin} - "
+                f"{stats['LIGNES_SOLDES']:,} soldes, {stats['LIGNES_MOUVEMENTS']:,} mouvements - "
+                f"{stats['TAILLE_OCTETS'] / 1024 / 1024:,.1f} Mo"
+            )
         else:
-            if count > 0:
-                durees.append(count)
-                count = 0
-    if count > 0:
-        durees.append(count)
-    return sum(durees) / len(durees) if durees else 0
-
-def analyser_decouvert_et_credit_line_overdraft(df_solde, compte, date_position, seuil_utilisateur):
+            st.caption("Entrepôt vide : ajoutez un premier extrait (historique complet)")
+
+        extrait_solde = st.file_uploader(
+            "Extrait des soldes à ajouter", type=['xlsx', 'xls', 'csv', 'parquet'], key="extrait_solde"
+        )
+        extrait_mvt = st.file_uploader(
+            "Extrait des mouvements à ajouter", type=['xlsx', 'xls', 'csv', 'parquet'], key="extrait_mvt"
+        )
+        if st.button("➕ Intégrer l'extrait", disabled=extrait_solde is None and extrait_mvt is None):
+            with st.spinner("Intégration de l'extrait..."):
+                try:
+                    df_solde = lire_soldes(extrait_solde) if extrait_solde is not None else None
+                    df_mvt = lire_mouvements(extrait_mvt) if extrait_mvt is not None else None
+                    libelle = ", ".join(f.name for f in (extrait_solde, extrait_mvt) if f is not None)
+                    bilan = entrepot.ajouter_extrait(df_solde, df_mvt, libelle=libelle)
+                except Exception as e:
+                    st.error(f"Erreur d'intégration: {e}")
+                    return
+            st.success(
+                f"✅ {bilan['SOLDES_AJOUTES']:,} soldes et {bilan['MOUVEMENTS_AJOUTES']:,} mouvements ajoutés"
+                + (f" ({', '.join(bilan['MOIS_MODIFIES'])})" if bilan['MOIS_MODIFIES'] else " (aucune date nouvelle)")
+            )
+
+def donnees_chargees(tache):
+    """(données, None) d'un chargement terminé, enregistrées pour la session ; (None, message) en cas d'erreur"""
+    donnees, erreur = tache.resultat()
+    if donnees is not None:
+        donnees.enregistrer_session(id_session())
+    return donnees, erreur
+
+def attendre_chargement(tache, libelle):
+    """Attend la fin d'un chargement en affichant le temps écoulé"""
+    if tache.terminee():
+        return
+    suivi = st.sidebar.empty()
+    with st.spinner(f"{libelle}..."):
+        while not tache.attendre(0.5):
+            suivi.caption(f"⏳ {libelle} : {tache.duree():.0f} s")
+    suivi.empty()
+
+def afficher_compaction(nom, rapport):
+    """Mémoire d'un jeu de données avant et après compaction, colonne par colonne"""
+    bilan = bilan_compaction(rapport)
+    st.caption(
+        f"{nom} compactés : {bilan['OCTETS_AVANT'] / 1024 / 1024:,.1f} Mo → "
+        f"{bilan['OCTETS_APRES'] / 1024 / 1024:,.1f} Mo (-{bilan['PART_ECONOMISEE']:.0%})"
+    )
+    st.dataframe(
+        pd.DataFrame({
+            "Colonne": rapport["COLONNE"],
+            "Type avant": rapport["TYPE_AVANT"],
+            "Type après": rapport["TYPE_APRES"],
+            "Mo avant": rapport["OCTETS_AVANT"] / 1024 / 1024,
+            "Mo après": rapport["OCTETS_APRES"] / 1024 / 1024,
+        }).round(2),
+        use_container_width=True, hide_index=True
+    )
+
+def apercu_fichiers(tache_solde, tache_mvt):
+    """Aperçu fusionné des comptes des fichiers importés, None si celui des soldes est illisible"""
+    apercus = []
+    for tache in (tache_solde, tache_mvt):
+        if tache is None:
+            apercus.append(None)
+            continue
+        attendre_chargement(tache, "Recherche des comptes")
+        apercu, _ = tache.resultat()
+        apercus.append(apercu)
+    if apercus[0] is None:
+        return None
+    return fusionner_apercus(*apercus)
+
+def _fragment(fonction):
+    """Fragment Streamlit (réexécuté seul lorsqu'un de ses widgets change) si la version le permet"""
+    return st.fragment(fonction) if hasattr(st, "fragment") else fonction
+
+def ouvrir_compte(compte, type_analyse, annee, mois, limite_credit, seuil_decouvert):
     """
-    Analyse complète du découvert et des Credit Line Overdraft
+    Demande l'ouverture de l'analyse d'un compte à la prochaine exécution :
+    les paramètres reprennent les valeurs demandées et l'analyse est lancée
     """
-    if df_solde is None or df_solde.empty:
-        return None, None, None, None
-    
-    # Filtrer pour le compte spécifique
-    dfS2 = df_solde[df_solde['COMPTE'] == compte].copy()
-    
-    if dfS2.empty:
-        return None, None, None, None
-    
-    # === Partie 1 : Durée moyenne à découvert sur les 12 mois avant le mois sélectionné ===
-    start_date_decouvert = date_position - pd.DateOffset(months=12)
-    end_date_decouvert = date_position - pd.offsets.MonthBegin(1)
-    
-    # Filtrer données pour période découvert
-    dfS2_periode_decouvert = dfS2[(dfS2['DATPOS'] >= start_date_decouvert) & (dfS2['DATPOS'] <= end_date_decouvert)].copy()
-    dfS2_periode_decouvert['MOIS'] = dfS2_periode_decouvert['DATPOS'].dt.to_period('M')
-    
-    # Calcul solde moyen mensuel
-    solde_moyen_mensuel_decouvert = dfS2_periode_decouvert.groupby(['COMPTE', 'MOIS'])['SOLDE'].mean().reset_index()
-    solde_moyen_mensuel_decouvert = solde_moyen_mensuel_decouvert.rename(columns={'SOLDE': 'SOLDE_MOYEN'})
-    
-    # Appliquer règle découvert
-    solde_moyen_mensuel_decouvert['A_DECOUVERT'] = solde_moyen_mensuel_decouvert['SOLDE_MOYEN'] <= seuil_utilisateur
-    
-    # Trier
-    solde_moyen_mensuel_decouvert = solde_moyen_mensuel_decouvert.sort_values(['COMPTE', 'MOIS'])
-    
-    # Calcul durée moyenne découvert
-    duree_moyenne_decouvert_val = 0
-    if not solde_moyen_mensuel_decouvert.empty:
-        duree_moyenne_decouvert_val = moyenne_duree_decouvert(solde_moyen_mensuel_decouvert)
-    
-    # === Partie 2 : Analyse des "Credit Line Overdraft" sur les 12 mois incluant le mois sélectionné ===
-    start_date_overdraft = date_position - pd.DateOffset(months=11)
-    end_date_overdraft = date_position + pd.offsets.MonthEnd(0)
-    
-    # Filtrer données pour période overdraft
-    dfS2_periode_overdraft = dfS2[(dfS2['DATPOS'] >= start_date_overdraft) & (dfS2['DATPOS'] <= end_date_overdraft)].copy()
-    dfS2_periode_overdraft['MOIS'] = dfS2_periode_overdraft['DATPOS'].dt.to_period('M')
-    
-    # Calcul solde moyen mensuel
-    solde_moyen_mensuel_overdraft = dfS2_periode_overdraft.groupby(['COMPTE', 'MOIS'])['SOLDE'].mean().reset_index()
-    solde_moyen_mensuel_overdraft = solde_moyen_mensuel_overdraft.rename(columns={'SOLDE': 'SOLDE_MOYEN'})
-    
-    # Identifier le mois pic (solde moyen max) par compte
-    pics = None
-    solde_moyen_complet = None
-    nb_credit_line_overdraft = 0
-    
-    if not solde_moyen_mensuel_overdraft.empty:
-        pics = solde_moyen_mensuel_overdraft.loc[
-            solde_moyen_mensuel_overdraft.groupby('COMPTE')['SOLDE_MOYEN'].idxmax()
-        ].rename(columns={'MOIS': 'MOIS_PIC', 'SOLDE_MOYEN': 'SOLDE_MAXI'})
-        
-        # Jointure pour calcul écart au pic
-        solde_moyen_complet = solde_moyen_mensuel_overdraft.merge(pics[['COMPTE', 'SOLDE_MAXI']], on='COMPTE', how='left')
-        solde_moyen_complet['ECART_AU_PIC'] = solde_moyen_complet['SOLDE_MAXI'] - solde_moyen_complet['SOLDE_MOYEN']
-        
-        # Tri et calcul solde précédent
-        solde_moyen_complet = solde_moyen_complet.sort_values(['COMPTE', 'MOIS'])
-        solde_moyen_complet['SOLDE_PRECEDENT'] = solde_moyen_complet.groupby('COMPTE')['SOLDE_MOYEN'].shift(1)
-        
-        # Détection "Credit Line Overdraft" = solde moyen qui s'améliore mois à mois
-        solde_moyen_complet['CREDIT_LINE_OVERDRAFT'] = (
-            solde_moyen_complet['SOLDE_MOYEN'] > solde_moyen_complet['SOLDE_PRECEDENT']
-        ).astype(int)
-        
-        # Compter le nombre de Credit Line Overdraft
-        nb_credit_line_overdraft = solde_moyen_complet['CREDIT_LINE_OVERDRAFT'].sum()
-    
-    return duree_moyenne_decouvert_val, solde_moyen_mensuel_decouvert, solde_moyen_complet, nb_credit_line_overdraft
+    for cle in ("type_analyse", "compte", "annee", "mois", "limite_credit", "seuil_decouvert"):
+        st.session_state.pop(cle, None)
+    st.session_state["ouvrir_compte"] = {
+        "COMPTE": compte,
+        "TYPE_ANALYSE": type_analyse,
+        "ANNEE": annee,
+        "MOIS": mois,
+        "LIMITE_CREDIT": limite_credit,
+        "SEUIL_DECOUVERT": seuil_decouvert,
+    }
+
+def suivre_chargement(tache, libelle):
+    """
+    Affiche l'avancement d'un chargement sans bloquer la page et relance le
+    script à la fin du chargement ; sans fragments Streamlit, attend la fin
+    """
+    if not hasattr(st, "fragment"):
+        attendre_chargement(tache, libelle)
+        return
+
+    @st.fragment(run_every=1)
+    def suivi():
+        if tache.terminee():
+            st.rerun()
+        st.caption(f"⏳ {libelle} : {tache.duree():.0f} s")
+
+    with st.sidebar:
+        suivi()
+
+@_fragment
+def afficher_serie(df, x, y, cle, type_graphique="ligne", allege=True, personnaliser=None, **options):
+    """
+    Graphique d'une série journalière. En mode allégé, au-delà du seuil la
+    série est réduite et tracée en WebGL ; un curseur de zoom retrace la
+    plage choisie, en pleine résolution dès qu'elle repasse sous le seuil.
+    """
+    if allege and len(df) > SEUIL_WEBGL and hasattr(st, "fragment"):
+        dates = df[x]
+        debut, fin = dates.min().to_pydatetime(), dates.max().to_pydatetime()
+        plage = st.slider("🔍 Zoom", min_value=debut, max_value=fin, value=(debut, fin),
+                          format="DD/MM/YYYY", key=cle)
+        df = df[(dates >= plage[0]) & (dates <= plage[1])]
+    fig = figure_serie(df, x, y, type_graphique, seuil=SEUIL_WEBGL if allege else len(df), **options)
+    if personnaliser is not None:
+        personnaliser(fig)
+    st.plotly_chart(fig, use_container_width=True)
 
 # --- Interface principale ---
 def main():
+    # Mesures de performance de cette exécution
+    activer_journal_fichier()
+    journal = JournalPerformance(id_session())
+
+    # Compte ouvert depuis la table des alertes : analyse lancée directement
+    demande = st.session_state.pop("ouvrir_compte", None)
+
     # En-tête BOA
     st.markdown("""
     <div class="main-header">
@@ -320,106 +367,378 @@ def main():
     st.sidebar.markdown('<div class="sidebar-header">📋 Configuration BOA</div>', unsafe_allow_html=True)
     
     # Sélection du type d'analyse
+    types_analyse = ["🔄 Turnover & Utilisation", "📉 Découvert & Credit Line", "📦 Portefeuille (batch)",
+                     "🎚️ Sensibilité (what-if)", "🚨 Alertes (portefeuille)"]
     type_analyse = st.sidebar.radio(
         "Type d'analyse:",
-        ["🔄 Turnover & Utilisation", "📉 Découvert & Credit Line"],
-        help="Choisissez le type d'analyse à effectuer"
+        types_analyse,
+        index=types_analyse.index(demande["TYPE_ANALYSE"]) if demande else 0,
+        help="Choisissez le type d'analyse à effectuer",
+        key="type_analyse"
     )
     
     # Upload des fichiers
     st.sidebar.subheader("📁 Chargement des fichiers")
     
-    fichier_solde = st.sidebar.file_uploader(
-        "Fichier des soldes journaliers",
-        type=['xlsx', 'xls'],
-        help="Fichier Excel contenant les soldes journaliers"
+    source_donnees = st.sidebar.radio(
+        "Source des données:",
+        ["📁 Fichiers importés", "🗄️ Entrepôt local"],
+        horizontal=True,
+        help="L'entrepôt local conserve l'historique ; seuls les nouveaux extraits sont à importer"
     )
+    entrepot = obtenir_entrepot() if source_donnees == "🗄️ Entrepôt local" else None
+    
+    fichier_solde, fichier_mvt = None, None
+    if entrepot is not None:
+        gerer_entrepot(entrepot)
+    else:
+        fichier_solde = st.sidebar.file_uploader(
+            "Fichier des soldes journaliers",
+            type=['xlsx', 'xls', 'csv', 'parquet'],
+            help="Fichier Excel, CSV ou Parquet contenant les soldes journaliers"
+        )
     
-    fichier_mvt = None
-    if type_analyse == "🔄 Turnover & Utilisation":
+    if entrepot is None and type_analyse == "🔄 Turnover & Utilisation":
         fichier_mvt = st.sidebar.file_uploader(
             "Fichier des mouvements (optionnel)",
-            type=['xlsx', 'xls'],
-            help="Fichier Excel contenant les mouvements"
+            type=['xlsx', 'xls', 'csv', 'parquet'],
+            help="Fichier Excel, CSV ou Parquet contenant les mouvements"
         )
+        lecture_par_blocs = st.sidebar.checkbox(
+            "Lecture par blocs (gros fichiers)",
+            help=f"Ne garde que les colonnes {', '.join(COLONNES_ANALYSE_MVT)} afin de limiter la mémoire "
+                 "consommée ; les fichiers .xlsx sont lus par blocs"
+        )
+
+    # Compaction des données chargées
+    compacte = st.sidebar.checkbox(
+        "🗜️ Compacter les données en mémoire",
+        help="Textes peu variés en catégories, entiers et réels dans le plus petit type qui conserve "
+             "les valeurs ; le rapport avant / après figure dans « Mémoire partagée »"
+    )
+    colonnes_utiles = compacte and st.sidebar.checkbox(
+        "Ne garder que les colonnes analysées",
+        help=f"Soldes : COMPTE, DATPOS, SOLDE ; mouvements : {', '.join(COLONNES_ANALYSE_MVT)}"
+    )
+
+    # Cache local des fichiers déjà lus
+    purger_cache_obsolete()
+    with st.sidebar.expander("🗄️ Cache des fichiers"):
+        nb_entrees, taille_cache = statistiques_cache()
+        st.caption(f"{nb_entrees} fichier(s) en cache - {taille_cache / 1024 / 1024:,.1f} Mo")
+        cache_resultats = obtenir_cache_resultats()
+        taux_succes = cache_resultats.taux_succes()
+        st.caption(
+            f"{len(cache_resultats)} résultat(s) d'analyse en mémoire"
+            + (f" - {taux_succes:.0%} de réutilisation" if taux_succes is not None else "")
+        )
+        if st.button("Vider le cache"):
+            invalider_cache()
+            cache_resultats.vider()
+            st.rerun()
+
+    # Mode de rendu des graphiques
+    graphiques_alleges = st.sidebar.checkbox(
+        "Graphiques allégés (grands volumes)",
+        value=True,
+        help=f"Au-delà de {SEUIL_WEBGL:,} points, les séries sont réduites en conservant leur allure "
+             "et tracées en WebGL ; le zoom rétablit la pleine résolution"
+    )
+
+    # Indicateurs sur tous les jours calendaires
+    base_calendaire = st.sidebar.checkbox(
+        "📅 Base calendaire (matrice dense)",
+        help="Calcule aussi les moyennes sur tous les jours du calendrier, le dernier solde connu étant "
+             "reporté sur les week-ends et jours fériés ; la matrice comptes × jours est construite une fois"
+    )
+
+    # Panneau des mesures de performance, rempli en fin d'exécution
+    afficher_performance = st.sidebar.checkbox("⏱️ Panneau performance")
+    panneau_performance = st.sidebar.container()
 
     # Variables d'état
-    df_solde, df_mvt = None, None
+    donnees_solde, donnees_mvt = None, None
     
-    # Chargement des fichiers
+    # Chargement des fichiers : les deux fichiers sont lus en parallèle dès leur import,
+    # avec un aperçu des comptes (colonnes COMPTE et date seulement) lu en quelques secondes
+    chargeur = obtenir_chargeur()
+    tache_solde, tache_mvt = None, None
+    apercu = None
+    empreinte_solde = empreinte_import(fichier_solde, "empreinte_solde") if fichier_solde is not None else None
+    empreinte_mvt = empreinte_import(fichier_mvt, "empreinte_mvt") if fichier_mvt is not None else None
     if fichier_solde is not None:
-        with st.spinner("Chargement du fichier de solde..."):
-            df_solde, error_solde = lire_fichier_solde(fichier_solde)
-            if error_solde:
-                st.sidebar.error(f"Erreur solde: {error_solde}")
-            else:
-                st.sidebar.success(f"✅ Solde chargé ({len(df_solde)} lignes)")
-
+        tache_solde = chargeur.soumettre(SOLDES, fichier_solde, compacte=compacte, colonnes_utiles=colonnes_utiles,
+                                         empreinte=empreinte_solde)
+        with journal.etape("apercu_comptes") as mesure:
+            apercu = apercu_fichiers(
+                chargeur.apercu(SOLDES, fichier_solde, empreinte_solde),
+                chargeur.apercu(MOUVEMENTS, fichier_mvt, empreinte_mvt) if fichier_mvt is not None else None
+            )
+            if apercu is not None:
+                mesure["LIGNES"] = int(apercu["NB_SOLDES"].sum() + apercu["NB_MOUVEMENTS"].sum())
     if fichier_mvt is not None:
-        with st.spinner("Chargement du fichier de mouvements..."):
-            df_mvt, error_mvt = lire_fichier_mvt(fichier_mvt)
-            if error_mvt:
-                st.sidebar.error(f"Erreur mouvement: {error_mvt}")
-            else:
-                st.sidebar.success(f"✅ Mouvements chargés ({len(df_mvt)} lignes)")
+        par_blocs = lecture_par_blocs and not fichier_mvt.name.lower().endswith('.xls')
+        tache_mvt = chargeur.soumettre(
+            MOUVEMENTS, fichier_mvt, par_blocs, compacte=compacte, colonnes_utiles=colonnes_utiles,
+            empreinte=empreinte_mvt
+        )
+
+    # Les soldes se chargent pendant le choix du compte et de la période : on attend
+    # la fin de leur chargement au lancement de l'analyse, ou d'emblée faute d'aperçu
+    if tache_solde is not None:
+        if tache_solde.terminee() or apercu is None or st.session_state.get("lancer_analyse") \
+                or demande is not None:
+            with journal.etape("chargement_soldes") as mesure:
+                attendre_chargement(tache_solde, "Chargement du fichier de solde")
+                donnees_solde, error_solde = donnees_chargees(tache_solde)
+                if error_solde:
+                    st.sidebar.error(f"Erreur solde: {error_solde}")
+                else:
+                    mesure["LIGNES"] = len(donnees_solde)
+                    st.sidebar.success(
+                        f"✅ Solde chargé ({len(donnees_solde)} lignes, {tache_solde.duree():.1f} s)"
+                    )
+        else:
+            suivre_chargement(tache_solde, "Chargement du fichier de solde")
+
+    # Les mouvements peuvent finir de se charger pendant le choix des paramètres
+    if tache_mvt is not None:
+        if tache_mvt.terminee():
+            with journal.etape("chargement_mouvements") as mesure:
+                donnees_mvt, error_mvt = donnees_chargees(tache_mvt)
+                if error_mvt:
+                    st.sidebar.error(f"Erreur mouvement: {error_mvt}")
+                else:
+                    mesure["LIGNES"] = len(donnees_mvt)
+                    st.sidebar.success(
+                        f"✅ Mouvements chargés ({len(donnees_mvt)} lignes, {tache_mvt.duree():.1f} s)"
+                    )
+        else:
+            suivre_chargement(tache_mvt, "Chargement du fichier de mouvements")
+
+    # Données de l'entrepôt local, rechargées à chaque nouvelle version
+    if entrepot is not None and not entrepot.est_vide():
+        with journal.etape("chargement_entrepot") as mesure:
+            with st.spinner("Chargement de l'entrepôt..."):
+                donnees_solde, donnees_mvt = charger_entrepot(entrepot.version, compacte, colonnes_utiles)
+            for donnees in (donnees_solde, donnees_mvt):
+                if donnees is not None:
+                    donnees.enregistrer_session(id_session())
+            mesure["LIGNES"] = sum(len(d) for d in (donnees_solde, donnees_mvt) if d is not None)
+
+    # Sans aperçu lu dans les fichiers, les comptes et les dates viennent de l'index des données chargées
+    if apercu is None and donnees_solde is not None:
+        apercu = fusionner_apercus(
+            apercu_depuis_index(donnees_solde.index),
+            apercu_depuis_index(donnees_mvt.index) if donnees_mvt is not None else None
+        )
+
+    # Données partagées entre sessions : DataFrame trié, index par compte et cube mensuel
+    df_solde = donnees_solde.df if donnees_solde is not None else None
+    df_mvt = donnees_mvt.df if donnees_mvt is not None else None
+    index_solde = donnees_solde.index if donnees_solde is not None else None
+    index_mvt = donnees_mvt.index if donnees_mvt is not None else None
+    credits = donnees_mvt.credits if donnees_mvt is not None else None
+    cube = donnees_solde.cube if donnees_solde is not None else None
+    # Empreinte des données analysées, première partie de la clé du cache des résultats
+    cle_donnees = None
+    if donnees_solde is not None:
+        cle_donnees = (donnees_solde.empreinte, donnees_mvt.empreinte if donnees_mvt is not None else None)
+
+    # Matrice dense comptes × jours, construite une fois par jeu de soldes
+    matrice = None
+    if base_calendaire and donnees_solde is not None:
+        with journal.etape("matrice_dense") as mesure:
+            try:
+                matrice = donnees_solde.matrice()
+                mesure["LIGNES"] = matrice.soldes.size
+            except ValueError as e:
+                st.sidebar.warning(f"⚠️ Base calendaire indisponible : {e}")
+
+    bilan = bilan_memoire([donnees_solde, donnees_mvt])
+    if bilan["NB_JEUX"]:
+        with st.sidebar.expander("🧠 Mémoire partagée"):
+            st.caption(
+                f"{bilan['MEMOIRE_PARTAGEE'] / 1024 / 1024:,.1f} Mo partagés entre les sessions - "
+                f"{bilan['MEMOIRE_ECONOMISEE'] / 1024 / 1024:,.1f} Mo économisés"
+            )
+            for nom, donnees in (("Soldes", donnees_solde), ("Mouvements", donnees_mvt)):
+                if donnees is not None:
+                    st.caption(f"{nom} : {donnees.sessions_actives()} session(s) active(s)")
+                    if donnees.rapport_compaction is not None:
+                        afficher_compaction(nom, donnees.rapport_compaction)
 
     # Interface principale
-    if df_solde is not None:
-        comptes = obtenir_comptes_disponibles(df_solde, df_mvt)
+    if apercu is not None:
+        with journal.etape("comptes_disponibles") as mesure:
+            comptes = apercu["COMPTE"].tolist()
+            mesure["LIGNES"] = len(apercu)
         
         if comptes:
             # Sélection des paramètres
             st.sidebar.subheader("⚙️ Paramètres d'analyse")
             
-            compte_selectionne = st.sidebar.selectbox(
-                "Compte à analyser:",
-                comptes,
-                format_func=lambda x: f"Compte {x}"
-            )
+            # Les modes portefeuille et alertes portent sur tous les comptes
+            compte_selectionne = None
+            if type_analyse not in ("📦 Portefeuille (batch)", "🚨 Alertes (portefeuille)"):
+                compte_selectionne = st.sidebar.selectbox(
+                    "Compte à analyser:",
+                    comptes,
+                    index=comptes.index(demande["COMPTE"]) if demande and demande["COMPTE"] in comptes else 0,
+                    format_func=lambda x: f"Compte {x}",
+                    key="compte"
+                )
+                ligne = apercu[apercu["COMPTE"] == compte_selectionne].iloc[0]
+                st.sidebar.caption(
+                    f"{ligne['NB_SOLDES']:,} soldes, {ligne['NB_MOUVEMENTS']:,} mouvements"
+                    + (f" du {ligne['DATE_MIN']:%d/%m/%Y} au {ligne['DATE_MAX']:%d/%m/%Y}"
+                       if pd.notna(ligne['DATE_MIN']) else "")
+                )
             
+            # Années couvertes par les données, dernier mois disponible par défaut
+            debut, fin = periode_apercu(apercu, compte_selectionne)
+            if fin is not None:
+                annees = range(debut.year, fin.year + 1)
+                index_annee, index_mois = len(annees) - 1, fin.month - 1
+            else:
+                annees = range(2020, datetime.now().year + 2)
+                index_annee, index_mois = min(datetime.now().year - 2020, 4), datetime.now().month - 1
+            if demande and demande["ANNEE"] in annees:
+                index_annee, index_mois = annees.index(demande["ANNEE"]), demande["MOIS"] - 1
             col1, col2 = st.sidebar.columns(2)
             with col1:
                 annee = st.selectbox(
                     "Année:",
-                    range(2020, datetime.now().year + 2),
-                    index=min(datetime.now().year - 2020, 4)
+                    annees,
+                    index=index_annee,
+                    key="annee"
                 )
             with col2:
                 mois = st.selectbox(
                     "Mois:",
                     range(1, 13),
-                    index=datetime.now().month - 1,
-                    format_func=lambda x: f"{x:02d}"
+                    index=index_mois,
+                    format_func=lambda x: f"{x:02d}",
+                    key="mois"
                 )
             
             # Paramètres spécifiques selon le type d'analyse
-            if type_analyse == "🔄 Turnover & Utilisation":
+            limite_credit, seuil_decouvert = None, None
+            if type_analyse in ("🔄 Turnover & Utilisation", "📦 Portefeuille (batch)", "🚨 Alertes (portefeuille)"):
                 limite_credit = st.sidebar.number_input(
                     "Limite de crédit:",
                     min_value=0.0,
-                    value=1000000.0,
+                    value=demande["LIMITE_CREDIT"] if demande and demande["LIMITE_CREDIT"] is not None
+                    else 1000000.0,
                     step=10000.0,
-                    format="%.2f"
+                    format="%.2f",
+                    key="limite_credit"
                 )
-                seuil_decouvert = None
-            else:
-                limite_credit = None
+            if type_analyse in ("📉 Découvert & Credit Line", "📦 Portefeuille (batch)", "🚨 Alertes (portefeuille)"):
                 seuil_decouvert = st.sidebar.number_input(
                     "Seuil de découvert:",
                     min_value=-1000000.0,
                     max_value=0.0,
-                    value=0.0,
+                    value=demande["SEUIL_DECOUVERT"] if demande and demande["SEUIL_DECOUVERT"] is not None
+                    else 0.0,
                     step=1000.0,
                     format="%.2f",
-                    help="Valeur seuil en dessous de laquelle le compte est considéré à découvert"
+                    help="Valeur seuil en dessous de laquelle le compte est considéré à découvert",
+                    key="seuil_decouvert"
+                )
+            if type_analyse == "🚨 Alertes (portefeuille)":
+                regles = st.sidebar.multiselect(
+                    "Règles d'alerte:",
+                    ["Taux d'utilisation", "Jours au-delà de la limite", "Durée de découvert",
+                     "Aucun Credit Line Overdraft"],
+                    default=["Taux d'utilisation", "Jours au-delà de la limite", "Durée de découvert",
+                             "Aucun Credit Line Overdraft"]
+                )
+                taux_usage_alerte = st.sidebar.number_input(
+                    "Taux d'utilisation moyen au-delà de (%):",
+                    min_value=0.0,
+                    value=TAUX_USAGE_ALERTE,
+                    step=10.0,
+                    disabled="Taux d'utilisation" not in regles
+                )
+                jours_au_dela_alerte = st.sidebar.number_input(
+                    "Jours au-delà de la limite, plus de:",
+                    min_value=0,
+                    max_value=31,
+                    value=JOURS_AU_DELA_ALERTE,
+                    disabled="Jours au-delà de la limite" not in regles
+                )
+                duree_decouvert_alerte = st.sidebar.number_input(
+                    "Durée moyenne de découvert au-delà de (mois):",
+                    min_value=0.0,
+                    max_value=12.0,
+                    value=DUREE_DECOUVERT_ALERTE,
+                    step=0.5,
+                    disabled="Durée de découvert" not in regles
+                )
+                regles_alerte = {
+                    "taux_usage": taux_usage_alerte if "Taux d'utilisation" in regles else None,
+                    "jours_au_dela": jours_au_dela_alerte if "Jours au-delà de la limite" in regles else None,
+                    "duree_decouvert": duree_decouvert_alerte if "Durée de découvert" in regles else None,
+                    "sans_credit_line": "Aucun Credit Line Overdraft" in regles,
+                }
+            if type_analyse == "🎚️ Sensibilité (what-if)":
+                plage_limites = st.sidebar.slider(
+                    "Plage de limites de crédit:",
+                    min_value=0.0,
+                    max_value=20000000.0,
+                    value=(100000.0, 5000000.0),
+                    step=50000.0,
+                    format="%.0f"
+                )
+                plage_seuils = st.sidebar.slider(
+                    "Plage de seuils de découvert:",
+                    min_value=-5000000.0,
+                    max_value=5000000.0,
+                    value=(-1000000.0, 0.0),
+                    step=10000.0,
+                    format="%.0f"
+                )
+                nb_points = st.sidebar.slider(
+                    "Nombre de valeurs par plage:", min_value=10, max_value=2000, value=NB_POINTS_SENSIBILITE
                 )
 
             # Bouton d'analyse
-            if st.sidebar.button("🚀 Lancer l'analyse", type="primary"):
+            lancer = st.sidebar.button("🚀 Lancer l'analyse", type="primary", key="lancer_analyse")
+            if (lancer or demande is not None) and df_solde is not None:
                 if type_analyse == "🔄 Turnover & Utilisation":
-                    analyser_turnover_utilisation(df_solde, df_mvt, compte_selectionne, annee, mois, limite_credit)
+                    with journal.etape("analyse_turnover"):
+                        analyser_turnover_utilisation(
+                            df_solde, df_mvt, compte_selectionne, annee, mois, limite_credit,
+                            index_solde=index_solde, index_mvt=index_mvt, cube=cube, journal=journal,
+                            cle_donnees=cle_donnees, graphiques_alleges=graphiques_alleges, matrice=matrice,
+                            credits=credits
+                        )
+                elif type_analyse == "📉 Découvert & Credit Line":
+                    with journal.etape("analyse_decouvert"):
+                        analyser_decouvert_credit_line(
+                            df_solde, compte_selectionne, annee, mois, seuil_decouvert,
+                            index_solde=index_solde, cube=cube, journal=journal, cle_donnees=cle_donnees
+                        )
+                elif type_analyse == "🎚️ Sensibilité (what-if)":
+                    with journal.etape("analyse_sensibilite"):
+                        analyser_sensibilite(
+                            df_solde, compte_selectionne, annee, mois, plage_limites, plage_seuils, nb_points,
+                            index_solde=index_solde, cube=cube, journal=journal, cle_donnees=cle_donnees
+                        )
+                elif type_analyse == "🚨 Alertes (portefeuille)":
+                    with journal.etape("analyse_alertes"):
+                        analyser_alertes(
+                            df_solde, annee, mois, limite_credit, seuil_decouvert, regles_alerte,
+                            index_solde=index_solde, cube=cube, journal=journal, cle_donnees=cle_donnees
+                        )
                 else:
-                    analyser_decouvert_credit_line(df_solde, compte_selectionne, annee, mois, seuil_decouvert)
+                    with journal.etape("analyse_portefeuille"):
+                        analyser_portefeuille(
+                            df_solde, annee, mois, limite_credit, seuil_decouvert,
+                            index_solde=index_solde, cube=cube, matrice=matrice, index_mvt=index_mvt,
+                            credits=credits
+                        )
 
     else:
         # Page d'accueil BOA
@@ -445,23 +764,75 @@ def main():
                     Évolution des soldes mensuels
                 
                 
+                📦 Portefeuille (batch):
+                
+                    Tous les comptes × tous les mois
+                    Export CSV / Parquet
+                
+                
+                🎚️ Sensibilité (what-if):
+                
+                    Plages de limites de crédit et de seuils de découvert
+                    Courbes d'utilisation et de découvert
+                
+                
+                🚨 Alertes (portefeuille):
+                
+                    Règles d'utilisation et de découvert sur tous les comptes
+                    Comptes classés, ouverts d'un clic dans leur analyse
+                
+                
                🚀 Pour commencer:
                 
                     Choisissez le type d'analyse
-                    Chargez votre fichier Excel des soldes
+                    Chargez votre fichier Excel des soldes (ou utilisez l'entrepôt local)
                     Sélectionnez le compte et la période
                     Configurez les paramètres
                     Lancez l'analyse
                 
             """, unsafe_allow_html=True)
 
-def analyser_turnover_utilisation(df_solde, df_mvt, compte, annee, mois, limite_credit):
+    if afficher_performance:
+        with panneau_performance:
+            afficher_mesures_performance(journal)
+
+def afficher_mesures_performance(journal):
+    """Tableau des étapes mesurées pendant l'exécution et export JSON lines"""
+    df_mesures = journal.tableau()
+    if df_mesures.empty:
+        st.caption("Aucune étape mesurée")
+        return
+    st.dataframe(
+        df_mesures[['ETAPE', 'SECONDES', 'LIGNES', 'DELTA_MEMOIRE_MO']],
+        use_container_width=True,
+        hide_index=True
+    )
+    st.download_button(
+        "📥 Exporter les mesures (JSON lines)",
+        journal.exporter_jsonl(),
+        file_name=f"performance_{journal.execution}.jsonl",
+        mime="application/x-ndjson"
+    )
+
+def analyser_turnover_utilisation(df_solde, df_mvt, compte, annee, mois, limite_credit,
+                                  index_solde=None, index_mvt=None, cube=None, journal=None, cle_donnees=None,
+                                  graphiques_alleges=True, matrice=None, credits=None):
     """Fonction d'analyse du turnover et de l'utilisation"""
+    journal = journal or JournalPerformance()
     
-    # Filtrage des données
-    df_solde_filtre, df_mvt_filtre = filtrer_par_compte_mois_annee(
-        df_solde, df_mvt, compte, annee, mois
-    )
+    # Calculs, repris du cache des résultats si la combinaison a déjà été analysée
+    cle = (cle_donnees, "turnover", compte, annee, mois, limite_credit, matrice is not None) if cle_donnees else None
+    with journal.etape("cache_resultats"):
+        resultat = obtenir_cache_resultats().obtenir(cle) if cle else None
+    if resultat is None:
+        with journal.etape("calculs"):
+            resultat = calculer_turnover_utilisation(
+                df_solde, df_mvt, compte, annee, mois, limite_credit,
+                index_solde=index_solde, index_mvt=index_mvt, cube=cube, journal=journal, matrice=matrice,
+                credits=credits
+            )
+        if cle:
+            obtenir_cache_resultats().enregistrer(cle, resultat)
     
     # En-tête des résultats
     st.header(f"📊 Analyse Turnover & Utilisation - Compte {compte}")
@@ -470,97 +841,492 @@ def analyser_turnover_utilisation(df_solde, df_mvt, compte, annee, mois, limite_
     # Métriques générales
     col1, col2, col3 = st.columns(3)
     with col1:
-        st.metric("Lignes de solde", len(df_solde_filtre))
+        st.metric("Lignes de solde", resultat['NB_LIGNES_SOLDE'])
     with col2:
-        st.metric("Lignes de mouvement", len(df_mvt_filtre) if df_mvt_filtre is not None else 0)
+        st.metric("Lignes de mouvement", resultat['NB_LIGNES_MVT'])
     with col3:
         st.metric("Limite de crédit", f"{limite_credit:,.0f}")
 
     # Analyse du taux d'utilisation
-    if not df_solde_filtre.empty and limite_credit > 0:
+    if resultat['NB_LIGNES_SOLDE'] and limite_credit > 0:
         st.subheader("📈 Analyse du Taux d'Utilisation")
         
-        taux_moyen, df_usage = calculer_usage_rate_mensuel(df_solde_filtre, limite_credit)
-        
-        if taux_moyen is not None:
-            # Métriques du taux d'utilisation
+        if resultat['USAGE'] is not None:
             col1, col2, col3 = st.columns(3)
             with col1:
-                st.metric("Taux moyen", f"{taux_moyen:.2f}%")
+                st.metric("Taux moyen", f"{resultat['TAUX_USAGE_MOYEN']:.2f}%")
             with col2:
-                taux_max = df_usage['TAUX_USAGE'].max()
-                st.metric("Taux maximum", f"{taux_max:.2f}%")
+                st.metric("Taux maximum", f"{resultat['TAUX_USAGE_MAX']:.2f}%")
             with col3:
-                solde_moyen = df_usage['SOLDE'].mean()
-                st.metric("Solde moyen", f"{solde_moyen:,.0f}")
+                st.metric("Solde moyen", f"{resultat['SOLDE_MOYEN']:,.0f}")
 
             # Graphique du taux d'utilisation
-            fig_usage = px.line(
-                df_usage, 
-                x='DATPOS', 
-                y='TAUX_USAGE',
-                title="Évolution du Taux d'Utilisation",
-                labels={'TAUX_USAGE': 'Taux d\'Utilisation (%)', 'DATPOS': 'Date'},
-                color_discrete_sequence=['#00B050']
-            )
-            fig_usage.add_hline(y=100, line_dash="dash", line_color="#dc2626", 
-                              annotation_text="Limite de crédit (100%)")
-            fig_usage.update_layout(
-                height=400,
-                plot_bgcolor='rgba(240, 253, 244, 0.3)',
-                paper_bgcolor='white'
+            def personnaliser_usage(fig_usage):
+                fig_usage.add_hline(y=100, line_dash="dash", line_color="#dc2626", 
+                                  annotation_text="Limite de crédit (100%)")
+                fig_usage.update_layout(
+                    height=400,
+                    plot_bgcolor='rgba(240, 253, 244, 0.3)',
+                    paper_bgcolor='white'
+                )
+
+            with journal.etape("graphique_usage"):
+                afficher_serie(
+                    resultat['USAGE'], 
+                    'DATPOS', 
+                    'TAUX_USAGE',
+                    cle="zoom_usage",
+                    allege=graphiques_alleges,
+                    personnaliser=personnaliser_usage,
+                    title="Évolution du Taux d'Utilisation",
+                    labels={'TAUX_USAGE': 'Taux d\'Utilisation (%)', 'DATPOS': 'Date'},
+                    color_discrete_sequence=['#00B050']
+                )
+
+    # Mêmes indicateurs sur tous les jours calendaires
+    calendaire = resultat['CALENDAIRE']
+    if calendaire is not None:
+        st.subheader("📅 Base calendaire")
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            if calendaire.get('TAUX_USAGE_MOYEN') is not None:
+                st.metric(
+                    "Taux moyen (calendaire)", f"{calendaire['TAUX_USAGE_MOYEN']:.2f}%",
+                    delta=(f"{calendaire['TAUX_USAGE_MOYEN'] - resultat['TAUX_USAGE_MOYEN']:+.2f} pts"
+                           if resultat['TAUX_USAGE_MOYEN'] is not None else None),
+                    delta_color="off"
+                )
+        with col2:
+            if calendaire.get('SOLDE_MOYEN') is not None:
+                st.metric("Solde moyen (calendaire)", f"{calendaire['SOLDE_MOYEN']:,.0f}")
+        with col3:
+            if calendaire.get('TURNOVER_ROUTED') is not None:
+                st.metric("Turnover Routed (calendaire)", f"{calendaire['TURNOVER_ROUTED']:.2f}%")
+        if calendaire.get('NB_JOURS_CALENDAIRES'):
+            st.caption(
+                f"{calendaire['NB_JOURS_OBSERVES']} jours de position sur {calendaire['NB_JOURS_CALENDAIRES']} "
+                "jours calendaires ; le dernier solde connu est reporté sur les jours sans position"
             )
-            st.plotly_chart(fig_usage, use_container_width=True)
 
     # Analyse du Turnover
-    if df_solde is not None:
-        st.subheader("🔄 Analyse du Turnover Routed")
-        
-        turnover, df_turnover = calculer_turnover_routed_depuis_solde(
-            df_solde, compte, annee, mois
-        )
-        
-        if turnover is not None and df_turnover is not None:
-            # Métriques du turnover
+    st.subheader("🔄 Analyse du Turnover Routed")
+    
+    df_turnover = resultat['TURNOVER']
+    if df_turnover is not None:
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Turnover Routed", f"{resultat['TURNOVER_ROUTED']:.2f}%")
+        with col2:
+            st.metric("Total flux créditeurs", f"{resultat['TOTAL_FLUX_CREDITEUR']:,.0f}")
+        with col3:
+            st.metric("Moyenne solde (3 mois)", f"{resultat['MOYENNE_SOLDE_3M']:,.0f}")
+
+        # Même fenêtre calculée sur les crédits réels du fichier des mouvements
+        mouvements = resultat['MOUVEMENTS']
+        if mouvements is not None:
             col1, col2, col3 = st.columns(3)
             with col1:
-                st.metric("Turnover Routed", f"{turnover:.2f}%")
+                st.metric(
+                    "Turnover (mouvements)",
+                    f"{mouvements['TURNOVER_MOUVEMENTS']:.2f}%" if mouvements['TURNOVER_MOUVEMENTS'] is not None
+                    else "N/A",
+                    delta=(f"{mouvements['TURNOVER_MOUVEMENTS'] - resultat['TURNOVER_ROUTED']:+.2f} pts"
+                           if mouvements['TURNOVER_MOUVEMENTS'] is not None else None),
+                    delta_color="off"
+                )
             with col2:
-                total_flux = df_turnover['FLUX_CREDITEUR'].sum()
-                st.metric("Total flux créditeurs", f"{total_flux:,.0f}")
+                st.metric("Total crédits (mouvements)", f"{mouvements['TOTAL_CREDITS_MOUVEMENTS']:,.0f}")
             with col3:
-                moyenne_solde = df_turnover['SOLDE'].mean()
-                st.metric("Moyenne solde (3 mois)", f"{moyenne_solde:,.0f}")
+                st.metric("Nombre de crédits", mouvements['NB_CREDITS_MOUVEMENTS'])
+            st.caption(
+                "Les crédits réels incluent les opérations compensées dans la journée, "
+                "invisibles dans les variations de solde"
+            )
 
-            # Graphiques du turnover
+        # Graphiques du turnover
+        with journal.etape("graphiques_turnover"):
             col1, col2 = st.columns(2)
-            
+        
             with col1:
-                fig_solde = px.line(
+                afficher_serie(
                     df_turnover, 
-                    x='DATPOS', 
-                    y='SOLDE',
+                    'DATPOS', 
+                    'SOLDE',
+                    cle="zoom_solde",
+                    allege=graphiques_alleges,
+                    personnaliser=lambda fig: fig.update_layout(height=350, plot_bgcolor='rgba(240, 253, 244, 0.3)'),
                     title="Évolution des Soldes (3 derniers mois)",
                     color_discrete_sequence=['#00B050']
                 )
-                fig_solde.update_layout(height=350, plot_bgcolor='rgba(240, 253, 244, 0.3)')
-                st.plotly_chart(fig_solde, use_container_width=True)
-            
+        
             with col2:
                 df_flux_positif = df_turnover[df_turnover['FLUX_CREDITEUR'] > 0]
                 if not df_flux_positif.empty:
-                    fig_flux = px.bar(
+                    afficher_serie(
                         df_flux_positif, 
-                        x='DATPOS', 
-                        y='FLUX_CREDITEUR',
+                        'DATPOS', 
+                        'FLUX_CREDITEUR',
+                        cle="zoom_flux",
+                        type_graphique="barres",
+                        allege=graphiques_alleges,
+                        personnaliser=lambda fig: fig.update_layout(height=350, plot_bgcolor='rgba(240, 253, 244, 0.3)'),
                         title="Flux Créditeurs Journaliers",
                         color_discrete_sequence=['#228B22']
                     )
-                    fig_flux.update_layout(height=350, plot_bgcolor='rgba(240, 253, 244, 0.3)')
-                    st.plotly_chart(fig_flux, use_container_width=True)
 
-def analyser_decouvert_credit_line(df_solde, compte, annee, mois, seuil_decouvert):
+    # Historique du turnover sur tous les mois du compte
+    df_historique = resultat['HISTORIQUE']
+    if len(df_historique) > 1:
+        with journal.etape("graphique_historique"):
+            df_historique = df_historique.assign(MOIS=df_historique['MOIS'].dt.to_timestamp())
+            fig_historique = px.line(
+                df_historique,
+                x='MOIS',
+                y='TURNOVER_ROUTED_3M',
+                markers=True,
+                title="Historique du Turnover Routed (fenêtre glissante de 3 mois)",
+                labels={'TURNOVER_ROUTED_3M': 'Turnover Routed (%)', 'MOIS': 'Mois'},
+                color_discrete_sequence=['#00B050']
+            )
+            fig_historique.add_vline(
+                x=pd.Timestamp(year=annee, month=mois, day=1), line_dash="dash", line_color="#f59e0b"
+            )
+            fig_historique.update_layout(height=350, plot_bgcolor='rgba(240, 253, 244, 0.3)')
+            st.plotly_chart(fig_historique, use_container_width=True)
+
+    # Soldes journaliers sur tout l'historique du compte, réduits au-delà du seuil WebGL
+    if index_solde is not None:
+        df_soldes_compte = index_solde.lignes_compte(compte)
+    else:
+        df_soldes_compte = df_solde[df_solde['COMPTE'] == compte].sort_values('DATPOS')
+    if len(df_soldes_compte) > 1:
+        with journal.etape("graphique_soldes_compte") as mesure:
+            mesure["LIGNES"] = len(df_soldes_compte)
+            afficher_serie(
+                df_soldes_compte[['DATPOS', 'SOLDE']],
+                'DATPOS',
+                'SOLDE',
+                cle="zoom_soldes_compte",
+                allege=graphiques_alleges,
+                personnaliser=lambda fig: fig.add_vline(
+                    x=pd.Timestamp(year=annee, month=mois, day=1), line_dash="dash", line_color="#f59e0b"
+                ).update_layout(height=350, plot_bgcolor='rgba(240, 253, 244, 0.3)'),
+                title="Historique des Soldes Journaliers",
+                labels={'SOLDE': 'Solde', 'DATPOS': 'Date'},
+                color_discrete_sequence=['#00B050']
+            )
+
+def analyser_portefeuille(df_solde, annee, mois, limite_credit, seuil_decouvert, index_solde=None, cube=None,
+                          matrice=None, index_mvt=None, credits=None):
+    """Fonction d'analyse de l'ensemble du portefeuille (tous comptes, tous mois)"""
+    
+    st.header("📦 Analyse du Portefeuille")
+    
+    with st.spinner("Calcul du portefeuille..."):
+        df_portefeuille = calculer_portefeuille(df_solde, limite_credit, index=index_solde, cube=cube)
+        if matrice is not None and not df_portefeuille.empty:
+            # Taux d'utilisation moyen sur tous les jours calendaires du mois
+            df_calendaire = matrice.usage_portefeuille(limite_credit)[['COMPTE', 'MOIS', 'TAUX_USAGE_MOYEN']]
+            df_portefeuille = df_portefeuille.merge(
+                df_calendaire.rename(columns={'TAUX_USAGE_MOYEN': 'TAUX_USAGE_CALENDAIRE'}),
+                on=['COMPTE', 'MOIS'], how='left'
+            )
+    
+    if df_portefeuille.empty:
+        st.warning("⚠️ Aucune donnée disponible pour le portefeuille.")
+        return
+    
+    # Métriques générales
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Comptes", df_portefeuille['COMPTE'].nunique())
+    with col2:
+        st.metric("Mois", df_portefeuille['MOIS'].nunique())
+    with col3:
+        st.metric("Comptes-mois au-delà de 100%", int((df_portefeuille['TAUX_USAGE_MOYEN'] > 100).sum()))
+    
+    st.dataframe(df_portefeuille, use_container_width=True)
+    
+    # Turnover routed du portefeuille mois par mois
+    df_historique = historique_turnover_portefeuille(historique_turnover(df_solde, index=index_solde, cube=cube))
+    if len(df_historique) > 1:
+        fig_historique = px.line(
+            df_historique.assign(MOIS=df_historique['MOIS'].dt.to_timestamp()),
+            x='MOIS',
+            y='TURNOVER_ROUTED_3M',
+            markers=True,
+            title="Turnover Routed du portefeuille (fenêtre glissante de 3 mois)",
+            labels={'TURNOVER_ROUTED_3M': 'Turnover Routed (%)', 'MOIS': 'Mois'},
+            color_discrete_sequence=['#00B050']
+        )
+        fig_historique.update_layout(height=350, plot_bgcolor='rgba(240, 253, 244, 0.3)')
+        st.plotly_chart(fig_historique, use_container_width=True)
+    
+    # Export de la table complète
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button(
+            "📥 Télécharger (CSV)",
+            exporter_table(df_portefeuille, "csv"),
+            file_name="portefeuille.csv",
+            mime="text/csv"
+        )
+    with col2:
+        st.download_button(
+            "📥 Télécharger (Parquet)",
+            exporter_table(df_portefeuille, "parquet"),
+            file_name="portefeuille.parquet",
+            mime="application/octet-stream"
+        )
+    
+    if index_solde is not None:
+        exporter_rapport_portefeuille(index_solde, annee, mois, limite_credit, seuil_decouvert,
+                                      index_mvt=index_mvt, credits=credits)
+    
+    # Durées de découvert de tous les comptes sur les 12 mois avant le mois de référence
+    st.subheader(f"📉 Durées de découvert - Référence {mois:02d}/{annee}")
+    date_position = pd.to_datetime(f"{annee}-{mois:02d}-01")
+    with st.spinner("Calcul des durées de découvert..."):
+        df_durees = analyser_duree_decouvert_portefeuille(
+            df_solde, date_position, seuil_decouvert, index=index_solde
+        )
+    
+    if df_durees.empty:
+        st.warning("⚠️ Aucune donnée disponible sur les 12 mois précédant la date de référence.")
+        return
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Comptes ayant connu un découvert", int((df_durees['NB_EPISODES_DECOUVERT'] > 0).sum()))
+    with col2:
+        st.metric("Durée moyenne découvert", f"{df_durees['DUREE_MOYENNE_DECOUVERT'].mean():.1f} mois")
+    with col3:
+        st.metric("Durée maximale découvert", f"{df_durees['DUREE_MAX_DECOUVERT'].max():.0f} mois")
+    
+    st.dataframe(df_durees, use_container_width=True)
+    st.download_button(
+        "📥 Télécharger les durées de découvert (CSV)",
+        exporter_table(df_durees, "csv"),
+        file_name="durees_decouvert.csv",
+        mime="text/csv"
+    )
+
+@_fragment
+def exporter_rapport_portefeuille(index_solde, annee, mois, limite_credit, seuil_decouvert, index_mvt=None,
+                                  credits=None):
+    """Rapport multi-comptes du mois (synthèse et détails par compte) écrit lot par lot en Excel ou Parquet"""
+    st.subheader(f"🗂️ Rapport multi-comptes - {mois:02d}/{annee}")
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        comptes = st.multiselect("Comptes (tous si vide):", index_solde.comptes.tolist(), key="comptes_rapport")
+    with col2:
+        format_export = st.radio("Format:", ["xlsx", "zip"], key="format_rapport",
+                                 format_func={"xlsx": "Excel (.xlsx)", "zip": "Parquet (.zip)"}.get)
+    st.caption("Feuilles SYNTHESE, USAGE, TURNOVER et SOLDES_MENSUELS, calculées et écrites par lots de comptes")
+
+    if not st.button("🗂️ Générer le rapport", key="generer_rapport"):
+        return
+    barre = st.progress(0.0, text="Écriture du rapport...")
+    with tempfile.TemporaryDirectory() as repertoire:
+        chemin = os.path.join(repertoire, f"rapport.{format_export}")
+        nb_comptes = exporter_rapport(
+            chemin, index_solde, annee, mois, limite_credit, seuil_decouvert, comptes=comptes or None,
+            index_mvt=index_mvt, credits=credits, format_export=format_export,
+            progression=lambda part: barre.progress(part, text=f"Écriture du rapport... {part:.0%}")
+        )
+        with open(chemin, "rb") as fichier:
+            contenu = fichier.read()
+    barre.empty()
+    st.success(f"✅ Rapport de {nb_comptes} comptes prêt ({len(contenu) / 1024:,.0f} Ko)")
+    st.download_button(
+        "📥 Télécharger le rapport",
+        contenu,
+        file_name=f"rapport_{annee}{mois:02d}.{format_export}",
+        mime=FORMATS_RAPPORT[format_export]
+    )
+
+def analyser_alertes(df_solde, annee, mois, limite_credit, seuil_decouvert, regles, index_solde=None, cube=None,
+                     journal=None, cle_donnees=None):
+    """Fonction de détection des comptes en alerte sur l'ensemble du portefeuille"""
+    journal = journal or JournalPerformance()
+
+    st.header("🚨 Alertes du Portefeuille")
+    st.subheader(f"📅 Mois de référence: {mois:02d}/{annee}")
+
+    # Toutes les règles sur tous les comptes en une passe, reprise du cache des résultats si possible
+    cle = (cle_donnees, "alertes", annee, mois, limite_credit, seuil_decouvert,
+           tuple(sorted(regles.items()))) if cle_donnees else None
+    with journal.etape("cache_resultats"):
+        df_alertes = obtenir_cache_resultats().obtenir(cle) if cle else None
+    if df_alertes is None:
+        with journal.etape("scan_alertes") as mesure:
+            df_alertes = scanner_alertes(
+                df_solde, annee, mois, limite_credit, seuil_decouvert, index=index_solde, cube=cube, **regles
+            )
+            mesure["LIGNES"] = len(df_alertes)
+        if cle:
+            obtenir_cache_resultats().enregistrer(cle, df_alertes)
+
+    if df_alertes.empty:
+        st.success("✅ Aucun compte en alerte sur ce mois.")
+        return
+
+    # Nombre de comptes par règle déclenchée
+    col1, col2, col3, col4, col5 = st.columns(5)
+    with col1:
+        st.metric("Comptes en alerte", len(df_alertes))
+    with col2:
+        st.metric("Taux d'utilisation", int(df_alertes['ALERTE_USAGE'].sum()))
+    with col3:
+        st.metric("Jours au-delà de la limite", int(df_alertes['ALERTE_JOURS_AU_DELA'].sum()))
+    with col4:
+        st.metric("Découvert prolongé", int(df_alertes['ALERTE_DECOUVERT'].sum()))
+    with col5:
+        st.metric("Sans Credit Line Overdraft", int(df_alertes['ALERTE_CREDIT_LINE'].sum()))
+
+    afficher_alertes(df_alertes, annee, mois, limite_credit, seuil_decouvert)
+
+    st.download_button(
+        "📥 Télécharger les alertes (CSV)",
+        exporter_table(df_alertes, "csv"),
+        file_name=f"alertes_{annee}{mois:02d}.csv",
+        mime="text/csv"
+    )
+
+@_fragment
+def afficher_alertes(df_alertes, annee, mois, limite_credit, seuil_decouvert):
+    """Table paginée des comptes en alerte ; un clic sur une ligne ouvre l'analyse du compte"""
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        taille_page = st.selectbox("Comptes par page:", [25, 50, 100, 250], index=1, key="taille_page_alertes")
+    nb_pages = -(-len(df_alertes) // taille_page)
+    if st.session_state.get("page_alertes", 1) > nb_pages:
+        st.session_state["page_alertes"] = nb_pages
+    with col2:
+        # Sans ``value`` : la page est portée par st.session_state (ramenée ci-dessus dans les bornes)
+        page = st.number_input(f"Page (sur {nb_pages}):", min_value=1, max_value=nb_pages, key="page_alertes")
+    with col3:
+        vue = st.selectbox(
+            "Ouvrir dans:",
+            ["Selon l'alerte", "🔄 Turnover & Utilisation", "📉 Découvert & Credit Line", "🎚️ Sensibilité (what-if)"],
+            key="vue_alertes"
+        )
+
+    debut = (page - 1) * taille_page
+    df_page = df_alertes.iloc[debut:debut + taille_page]
+    if hasattr(st, "fragment"):
+        cle = f"table_alertes_{page}_{taille_page}"
+        st.dataframe(
+            df_page, use_container_width=True, hide_index=True, key=cle, selection_mode="single-row",
+            on_select=partial(selection_alerte, df_page, cle, vue, annee, mois, limite_credit, seuil_decouvert)
+        )
+        st.caption(f"Comptes {debut + 1} à {debut + len(df_page)} sur {len(df_alertes)} - "
+                   "cliquez sur une ligne pour ouvrir l'analyse du compte")
+        # Le fragment seul ne suffit pas : la page entière s'ouvre sur le compte sélectionné
+        if "ouvrir_compte" in st.session_state:
+            st.rerun()
+    else:
+        st.dataframe(df_page, use_container_width=True, hide_index=True)
+
+def selection_alerte(df_page, cle, vue, annee, mois, limite_credit, seuil_decouvert):
+    """Ouvre l'analyse du compte de la ligne sélectionnée dans la table des alertes"""
+    lignes = st.session_state[cle]["selection"]["rows"]
+    if not lignes:
+        return
+    ligne = df_page.iloc[lignes[0]]
+    if vue == "Selon l'alerte":
+        # Utilisation de la limite d'abord, découvert ensuite
+        vue = "🔄 Turnover & Utilisation" if ligne['ALERTE_USAGE'] or ligne['ALERTE_JOURS_AU_DELA'] \
+            else "📉 Découvert & Credit Line"
+    ouvrir_compte(int(ligne['COMPTE']), vue, annee, mois, limite_credit, seuil_decouvert)
+
+def analyser_sensibilite(df_solde, compte, annee, mois, plage_limites, plage_seuils, nb_points,
+                         index_solde=None, cube=None, journal=None, cle_donnees=None):
+    """Fonction d'analyse de la sensibilité à la limite de crédit et au seuil de découvert"""
+    journal = journal or JournalPerformance()
+    
+    st.header(f"🎚️ Sensibilité - Compte {compte}")
+    st.subheader(f"📅 Période: {mois:02d}/{annee}")
+    
+    # Toutes les valeurs des plages en un seul calcul, repris du cache des résultats si possible
+    cle = (cle_donnees, "sensibilite", compte, annee, mois, plage_limites, plage_seuils, nb_points) if cle_donnees else None
+    with journal.etape("cache_resultats"):
+        resultat = obtenir_cache_resultats().obtenir(cle) if cle else None
+    if resultat is None:
+        with journal.etape("balayage") as mesure:
+            resultat = calculer_sensibilite(
+                df_solde, compte, annee, mois,
+                np.linspace(*plage_limites, nb_points), np.linspace(*plage_seuils, nb_points),
+                index=index_solde, cube=cube
+            )
+            mesure["LIGNES"] = 2 * nb_points
+        if cle:
+            obtenir_cache_resultats().enregistrer(cle, resultat)
+    
+    df_limites, df_seuils = resultat['LIMITES'], resultat['SEUILS']
+    if df_limites is None and df_seuils is None:
+        st.warning("⚠️ Aucune donnée disponible pour ce compte sur la période sélectionnée.")
+        return
+    
+    # Valeurs de bascule
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric(
+            "Limite à 100% d'utilisation",
+            f"{resultat['LIMITE_100']:,.0f}" if resultat['LIMITE_100'] is not None else "N/A",
+            help="En dessous de cette limite, le taux d'utilisation moyen du mois dépasse 100%"
+        )
+    with col2:
+        st.metric(
+            "Seuil du premier mois à découvert",
+            f"{resultat['SEUIL_PREMIER_DECOUVERT']:,.0f}" if resultat['SEUIL_PREMIER_DECOUVERT'] is not None else "N/A",
+            help="À partir de ce seuil, au moins un des 12 mois précédents est à découvert"
+        )
+    with col3:
+        st.metric("Jours / mois analysés", f"{resultat['NB_JOURS']} j / {resultat['NB_MOIS']} m")
+    
+    # Courbes en fonction du paramètre
+    fig = make_subplots(
+        rows=2, cols=2,
+        subplot_titles=(
+            "Taux d'utilisation moyen (%)", "Jours au-delà de la limite",
+            "Mois à découvert (12 mois)", "Durée moyenne découvert (mois)"
+        ),
+        vertical_spacing=0.15
+    )
+    if df_limites is not None:
+        fig.add_trace(go.Scatter(x=df_limites['LIMITE_CREDIT'], y=df_limites['TAUX_USAGE_MOYEN'],
+                                 name="Taux moyen", line=dict(color='#00B050')), row=1, col=1)
+        fig.add_hline(y=100, line_dash="dash", line_color="#dc2626", row=1, col=1)
+        fig.add_trace(go.Scatter(x=df_limites['LIMITE_CREDIT'], y=df_limites['NB_JOURS_AU_DELA'],
+                                 name="Jours au-delà", line=dict(color='#228B22', shape='hv')), row=1, col=2)
+    if df_seuils is not None:
+        fig.add_trace(go.Scatter(x=df_seuils['SEUIL_DECOUVERT'], y=df_seuils['NB_MOIS_DECOUVERT'],
+                                 name="Mois à découvert", line=dict(color='#dc2626', shape='hv')), row=2, col=1)
+        fig.add_trace(go.Scatter(x=df_seuils['SEUIL_DECOUVERT'], y=df_seuils['DUREE_MOYENNE_DECOUVERT'],
+                                 name="Durée moyenne", line=dict(color='#f59e0b', shape='hv')), row=2, col=2)
+    fig.update_xaxes(title_text="Limite de crédit", row=1, col=1)
+    fig.update_xaxes(title_text="Limite de crédit", row=1, col=2)
+    fig.update_xaxes(title_text="Seuil de découvert", row=2, col=1)
+    fig.update_xaxes(title_text="Seuil de découvert", row=2, col=2)
+    fig.update_layout(height=700, showlegend=False, plot_bgcolor='rgba(240, 253, 244, 0.3)')
+    st.plotly_chart(fig, use_container_width=True)
+    
+    # Tables détaillées
+    col1, col2 = st.columns(2)
+    with col1:
+        if df_limites is not None:
+            with st.expander("📋 Détail par limite de crédit"):
+                st.dataframe(df_limites, use_container_width=True, hide_index=True)
+    with col2:
+        if df_seuils is not None:
+            with st.expander("📋 Détail par seuil de découvert"):
+                st.dataframe(df_seuils, use_container_width=True, hide_index=True)
+
+def analyser_decouvert_credit_line(df_solde, compte, annee, mois, seuil_decouvert, index_solde=None, cube=None,
+                                   journal=None, cle_donnees=None):
     """Fonction d'analyse du découvert et des Credit Line Overdraft"""
+    journal = journal or JournalPerformance()
     
     # Date de référence
     date_position = pd.to_datetime(f"{annee}-{mois:02d}-01")
@@ -569,10 +1335,19 @@ def analyser_decouvert_credit_line(df_solde, compte, annee, mois, seuil_decouver
     st.header(f"📉 Analyse Découvert & Credit Line - Compte {compte}")
     st.subheader(f"📅 Date de référence: {mois:02d}/{annee}")
     
-    # Analyse complète
-    duree_moyenne, solde_decouvert, solde_complet, nb_credit_line = analyser_decouvert_et_credit_line_overdraft(
-        df_solde, compte, date_position, seuil_decouvert
-    )
+    # Analyse complète, reprise du cache des résultats si la combinaison a déjà été analysée
+    cle = (cle_donnees, "decouvert", compte, annee, mois, seuil_decouvert) if cle_donnees else None
+    with journal.etape("cache_resultats"):
+        resultat = obtenir_cache_resultats().obtenir(cle) if cle else None
+    if resultat is None:
+        with journal.etape("decouvert_credit_line") as mesure:
+            resultat = analyser_decouvert_et_credit_line_overdraft(
+                df_solde, compte, date_position, seuil_decouvert, index=index_solde, cube=cube
+            )
+            mesure["LIGNES"] = len(resultat[2]) if resultat[2] is not None else 0
+        if cle:
+            obtenir_cache_resultats().enregistrer(cle, resultat)
+    duree_moyenne, solde_decouvert, solde_complet, nb_credit_line = resultat
     
     if duree_moyenne is not None or solde_complet is not None:
         # Métriques principales
@@ -592,6 +1367,40 @@ def analyser_decouvert_credit_line(df_solde, compte, annee, mois, seuil_decouver
         with col3:
             st.metric("Seuil découvert", f"{seuil_decouvert:,.0f}")
 
+        # Historique des deux indicateurs pour tous les mois de référence du compte
+        cle_historique = (cle_donnees, "historique_decouvert", compte, seuil_decouvert) if cle_donnees else None
+        df_historique = obtenir_cache_resultats().obtenir(cle_historique) if cle_historique else None
+        if df_historique is None:
+            with journal.etape("historique_decouvert") as mesure:
+                df_historique = historique_decouvert(
+                    df_solde, seuil_decouvert, compte, index=index_solde, cube=cube
+                )
+                mesure["LIGNES"] = len(df_historique)
+            if cle_historique:
+                obtenir_cache_resultats().enregistrer(cle_historique, df_historique)
+        if len(df_historique) > 1:
+            mois_reference = df_historique['MOIS'].dt.to_timestamp()
+            fig_historique = make_subplots(specs=[[{"secondary_y": True}]])
+            fig_historique.add_trace(go.Bar(
+                x=mois_reference, y=df_historique['NB_CREDIT_LINE_OVERDRAFT'],
+                name="Credit Line Overdraft", marker_color='#228B22', opacity=0.5
+            ), secondary_y=True)
+            fig_historique.add_trace(go.Scatter(
+                x=mois_reference, y=df_historique['DUREE_MOYENNE_DECOUVERT'],
+                name="Durée moyenne découvert", mode='lines+markers', line=dict(color='#dc2626', width=3)
+            ), secondary_y=False)
+            fig_historique.add_vline(x=date_position, line_dash="dash", line_color="#f59e0b")
+            fig_historique.update_yaxes(title_text="Durée moyenne (mois)", secondary_y=False)
+            fig_historique.update_yaxes(title_text="Credit Line Overdraft", secondary_y=True)
+            fig_historique.update_layout(
+                title="Historique par mois de référence (fenêtres glissantes de 12 mois)",
+                height=400,
+                plot_bgcolor='rgba(240, 253, 244, 0.3)',
+                paper_bgcolor='white',
+                hovermode='x unified'
+            )
+            st.plotly_chart(fig_historique, use_container_width=True)
+
         # # Analyse du découvert
         # if solde_decouvert is not None and not solde_decouvert.empty:
         #     st.subheader("📊 Analyse du Découvert (12 mois précédents)")
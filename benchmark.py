@@ -0,0 +1,257 @@
+"""
+Banc de mesure des performances sur données synthétiques.
+
+Pour chaque volume demandé (nombre de comptes), les données sont produites
+par generateur.py puis chaque étape est mesurée : lecture Excel, aperçu
+des comptes (colonnes COMPTE et date seulement) et relecture depuis le
+cache Parquet, compaction des mouvements, construction de l'index, du
+cube, de la matrice dense et du cumul des crédits des mouvements, filtrage
+d'un compte, taux d'utilisation, turnover (sur les soldes et sur les
+mouvements), analyse du découvert et historique du découvert sur tous les
+mois de référence (sur un échantillon de comptes), calcul du portefeuille,
+détection des alertes et export du rapport multi-comptes (Parquet) sur
+tous les comptes. Chaque mesure donne le temps écoulé (meilleur de
+plusieurs répétitions) et le pic de mémoire allouée pendant l'étape
+(tracemalloc).
+
+Le rapport JSON peut être comparé à celui d'une version précédente :
+les étapes dont le temps dépasse la référence de plus de la tolérance sont
+signalées comme des régressions.
+
+Exemple :
+    python benchmark.py --comptes 1000 10000 --sortie rapport.json --reference rapport_v1.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from alertes import scanner_alertes
+from apercu_comptes import lire_colonnes, resumer_comptes
+from cache_fichiers import lire_avec_cache
+from calculs import (
+    _lire_excel_solde,
+    analyser_decouvert_et_credit_line_overdraft,
+    calculer_turnover_routed_depuis_solde,
+    calculer_usage_rate_mensuel,
+    filtrer_par_compte_mois_annee,
+    schema_solde,
+)
+from compaction import compacter
+from credits_mouvements import IndexCredits, fenetre_turnover
+from cube_mensuel import CubeMensuel
+from export_rapport import exporter_rapport
+from generateur import LIGNES_MAX_EXCEL, ecrire, generer_mouvements, generer_soldes
+from index_comptes import IndexComptes
+from matrice_dense import CELLULES_MAX_MATRICE, MatriceSoldes
+from portefeuille import calculer_portefeuille, historique_decouvert
+
+LIMITE_CREDIT = 1_000_000
+SEUIL_DECOUVERT = 0
+
+
+def mesurer(fonction, repetitions=3):
+    """
+    Exécute ``fonction`` une fois sous tracemalloc pour le pic mémoire puis
+    ``repetitions`` fois pour le temps ; renvoie (secondes, pic en octets, résultat)
+    """
+    tracemalloc.start()
+    try:
+        resultat = fonction()
+        _, pic = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    durees = []
+    for _ in range(repetitions):
+        debut = time.perf_counter()
+        fonction()
+        durees.append(time.perf_counter() - debut)
+    return min(durees), pic, resultat
+
+
+def _ligne(etape, nb_comptes, nb_lignes, nb_appels, secondes, pic):
+    return {
+        "ETAPE": etape,
+        "NB_COMPTES": nb_comptes,
+        "NB_LIGNES": nb_lignes,
+        "NB_APPELS": nb_appels,
+        "SECONDES": secondes,
+        "SECONDES_PAR_APPEL": secondes / nb_appels,
+        "PIC_MEMOIRE_MO": pic / 1024 / 1024,
+    }
+
+
+def mesurer_volume(nb_comptes, debut, fin, mouvements_par_compte=20, echantillon=50,
+                   repetitions=3, lecture_excel=True, graine=0):
+    """Mesure toutes les étapes pour un volume donné ; renvoie une liste d'enregistrements"""
+    df_solde = generer_soldes(nb_comptes, debut, fin, graine=graine)
+    df_mvt = generer_mouvements(nb_comptes, nb_comptes * mouvements_par_compte, debut, fin, graine=graine)
+    nb_lignes = len(df_solde)
+    lignes = []
+
+    def ajouter(etape, fonction, nb_appels=1, repetitions=repetitions):
+        secondes, pic, resultat = mesurer(fonction, repetitions)
+        lignes.append(_ligne(etape, nb_comptes, nb_lignes, nb_appels, secondes, pic))
+        return resultat
+
+    # Lecture du fichier Excel puis relecture depuis le cache Parquet
+    if lecture_excel and nb_lignes < LIGNES_MAX_EXCEL:
+        with tempfile.TemporaryDirectory() as repertoire:
+            chemin = f"{repertoire}/soldes.xlsx"
+            ecrire(df_solde, chemin)
+            ajouter("lecture_excel_soldes", lambda: _lire_excel_solde(chemin), repetitions=1)
+            ajouter("apercu_excel_soldes", lambda: resumer_comptes(lire_colonnes(chemin, "DATPOS"), "DATPOS"),
+                    repetitions=1)
+            lire_avec_cache(chemin, schema_solde, _lire_excel_solde, repertoire=repertoire)
+            ajouter("lecture_cache_soldes",
+                    lambda: lire_avec_cache(chemin, schema_solde, _lire_excel_solde, repertoire=repertoire))
+
+    ajouter("compaction_mouvements", lambda: compacter(df_mvt))
+    index_solde = ajouter("index_soldes", lambda: IndexComptes(df_solde, "DATPOS"))
+    index_mvt = ajouter("index_mouvements", lambda: IndexComptes(df_mvt, "DATOPER"))
+    credits = ajouter("credits_mouvements", lambda: IndexCredits(index_mvt))
+    cube = ajouter("cube_mensuel", lambda: CubeMensuel(index_solde))
+    matrice = None
+    if len(index_solde.comptes) * (pd.Timestamp(fin) - pd.Timestamp(debut)).days < CELLULES_MAX_MATRICE:
+        matrice = ajouter("matrice_dense", lambda: MatriceSoldes(index_solde))
+
+    # Analyses par compte sur un échantillon, pour le dernier mois de la période
+    rng = np.random.default_rng(graine)
+    comptes = rng.choice(index_solde.comptes, min(echantillon, len(index_solde.comptes)), replace=False)
+    date_position = pd.Timestamp(fin).normalize()
+    annee, mois = date_position.year, date_position.month
+    n = len(comptes)
+
+    def boucle(calcul):
+        return lambda: [calcul(compte) for compte in comptes]
+
+    ajouter("filtrage", boucle(
+        lambda c: filtrer_par_compte_mois_annee(df_solde, df_mvt, c, annee, mois)), n)
+    ajouter("filtrage_indexe", boucle(
+        lambda c: filtrer_par_compte_mois_annee(df_solde, df_mvt, c, annee, mois, index_solde, index_mvt)), n)
+    ajouter("taux_utilisation", boucle(
+        lambda c: calculer_usage_rate_mensuel(index_solde.lignes_mois(c, annee, mois), LIMITE_CREDIT)), n)
+    ajouter("taux_utilisation_cube", boucle(
+        lambda c: cube.usage(c, annee, mois, LIMITE_CREDIT)), n)
+    if matrice is not None:
+        ajouter("taux_utilisation_matrice", boucle(
+            lambda c: matrice.usage(c, annee, mois, LIMITE_CREDIT)), n)
+    ajouter("turnover", boucle(
+        lambda c: calculer_turnover_routed_depuis_solde(df_solde, c, annee, mois)), n)
+    ajouter("turnover_cube", boucle(
+        lambda c: cube.turnover(c, annee, mois)), n)
+    if matrice is not None:
+        ajouter("turnover_matrice", boucle(
+            lambda c: matrice.turnover(c, annee, mois)), n)
+    ajouter("turnover_mouvements", boucle(
+        lambda c: credits.credits_periode(c, *fenetre_turnover(annee, mois))), n)
+    ajouter("decouvert", boucle(
+        lambda c: analyser_decouvert_et_credit_line_overdraft(df_solde, c, date_position, SEUIL_DECOUVERT)), n)
+    ajouter("decouvert_cube", boucle(
+        lambda c: analyser_decouvert_et_credit_line_overdraft(
+            df_solde, c, date_position, SEUIL_DECOUVERT, index=index_solde, cube=cube)), n)
+    ajouter("historique_decouvert_cube", boucle(
+        lambda c: historique_decouvert(df_solde, SEUIL_DECOUVERT, c, index=index_solde, cube=cube)), n)
+
+    ajouter("portefeuille", lambda: calculer_portefeuille(df_solde, LIMITE_CREDIT, index=index_solde, cube=cube))
+    if matrice is not None:
+        ajouter("portefeuille_matrice", lambda: (
+            matrice.usage_portefeuille(LIMITE_CREDIT), matrice.turnover_portefeuille(annee, mois)))
+    ajouter("alertes_portefeuille", lambda: scanner_alertes(
+        df_solde, annee, mois, LIMITE_CREDIT, SEUIL_DECOUVERT, index=index_solde, cube=cube))
+    with tempfile.TemporaryDirectory() as repertoire:
+        ajouter("export_rapport", lambda: exporter_rapport(
+            f"{repertoire}/rapport.zip", index_solde, annee, mois, LIMITE_CREDIT, SEUIL_DECOUVERT,
+            index_mvt=index_mvt, credits=credits, format_export="zip"), repetitions=1)
+    return lignes
+
+
+def version_code():
+    """Révision git du code mesuré, None hors dépôt git"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def comparer(resultats, reference, tolerance=0.2):
+    """
+    Compare deux listes de mesures étape par étape et volume par volume ;
+    une étape est en régression si elle est plus lente que la référence de
+    plus de ``tolerance`` (20 % par défaut)
+    """
+    cles = ["ETAPE", "NB_COMPTES"]
+    actuel = pd.DataFrame(resultats)[cles + ["SECONDES", "PIC_MEMOIRE_MO"]]
+    ancien = pd.DataFrame(reference)[cles + ["SECONDES", "PIC_MEMOIRE_MO"]]
+    comparaison = ancien.merge(actuel, on=cles, suffixes=("_REF", ""))
+    comparaison["RATIO_TEMPS"] = comparaison["SECONDES"] / comparaison["SECONDES_REF"]
+    comparaison["RATIO_MEMOIRE"] = comparaison["PIC_MEMOIRE_MO"] / comparaison["PIC_MEMOIRE_MO_REF"]
+    comparaison["REGRESSION"] = comparaison["RATIO_TEMPS"] > 1 + tolerance
+    return comparaison
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mesure les performances des analyses sur données synthétiques")
+    parser.add_argument("--comptes", type=int, nargs="+", default=[1_000, 10_000],
+                        help="Volumes mesurés, en nombre de comptes")
+    parser.add_argument("--debut", default="2024-01-01", help="Première date des soldes")
+    parser.add_argument("--fin", default="2024-12-31", help="Dernière date des soldes")
+    parser.add_argument("--mouvements-par-compte", type=int, default=20, help="Nombre moyen de mouvements par compte")
+    parser.add_argument("--echantillon", type=int, default=50, help="Nombre de comptes analysés un par un")
+    parser.add_argument("--repetitions", type=int, default=3, help="Répétitions par mesure (meilleur temps retenu)")
+    parser.add_argument("--sans-excel", action="store_true", help="Ne pas mesurer la lecture des fichiers Excel")
+    parser.add_argument("--sortie", help="Fichier JSON du rapport")
+    parser.add_argument("--reference", help="Rapport JSON d'une version précédente à comparer")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Ralentissement toléré (0.2 = 20 %%)")
+    args = parser.parse_args(argv)
+
+    resultats = []
+    for nb_comptes in args.comptes:
+        print(f"Mesure pour {nb_comptes} comptes...", file=sys.stderr)
+        resultats.extend(mesurer_volume(
+            nb_comptes, args.debut, args.fin,
+            mouvements_par_compte=args.mouvements_par_compte, echantillon=args.echantillon,
+            repetitions=args.repetitions, lecture_excel=not args.sans_excel
+        ))
+
+    rapport = {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "version": version_code(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "periode": [args.debut, args.fin],
+        "resultats": resultats,
+    }
+    print(pd.DataFrame(resultats).to_string(index=False, float_format=lambda x: f"{x:.4f}"))
+    if args.sortie:
+        with open(args.sortie, "w", encoding="utf-8") as f:
+            json.dump(rapport, f, indent=2, ensure_ascii=False)
+
+    if args.reference:
+        with open(args.reference, encoding="utf-8") as f:
+            reference = json.load(f)
+        comparaison = comparer(resultats, reference["resultats"], args.tolerance)
+        print(f"\nComparaison avec la version {reference.get('version')} du {reference.get('date')} :")
+        print(comparaison.to_string(index=False, float_format=lambda x: f"{x:.3f}"))
+        if comparaison["REGRESSION"].any():
+            print(f"{int(comparaison['REGRESSION'].sum())} régression(s) détectée(s)", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,188 @@
+"""
+Cache local des fichiers importés, au format Parquet.
+
+Chaque entrée est identifiée par l'empreinte SHA-256 du contenu du fichier
+et par l'empreinte du schéma de lecture (dictionnaire des types, colonnes de
+dates). Un même extrait importé à nouveau, par le même analyste ou par un
+autre, est relu depuis le cache au lieu de repasser par ``pd.read_excel``.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Incrémenter pour invalider toutes les entrées après un changement du format de stockage
+VERSION_CACHE = 1
+
+REPERTOIRE_CACHE = os.environ.get(
+    "BOA_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "boa_analyse")
+)
+TAILLE_MAX_CACHE = int(float(os.environ.get("BOA_CACHE_TAILLE_MAX_MO", "2048")) * 1024 * 1024)
+
+EXTENSION = ".parquet"
+TAILLE_BLOC_LECTURE = 1024 * 1024
+
+
+def empreinte_schema(types, dates, variante=""):
+    """Empreinte du schéma de lecture (types, dates et traitements propres au lecteur)"""
+    description = json.dumps(
+        {
+            "version": VERSION_CACHE,
+            "types": sorted(types.items()),
+            "dates": sorted(dates),
+            "variante": variante,
+        },
+        sort_keys=True
+    )
+    return hashlib.sha256(description.encode("utf-8")).hexdigest()[:16]
+
+
+def empreinte_contenu(source):
+    """Empreinte SHA-256 du contenu d'un fichier (chemin ou objet fichier importé)"""
+    h = hashlib.sha256()
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            for bloc in iter(lambda: f.read(TAILLE_BLOC_LECTURE), b""):
+                h.update(bloc)
+        return h.hexdigest()
+
+    position = source.tell()
+    source.seek(0)
+    try:
+        for bloc in iter(lambda: source.read(TAILLE_BLOC_LECTURE), b""):
+            h.update(bloc)
+    finally:
+        source.seek(position)
+    return h.hexdigest()
+
+
+def _chemin_entree(cle_schema, cle_contenu, repertoire):
+    return os.path.join(repertoire, f"{cle_schema}_{cle_contenu}{EXTENSION}")
+
+
+def _entrees(repertoire):
+    """Liste (chemin, taille, date d'accès) des entrées du cache"""
+    if not os.path.isdir(repertoire):
+        return []
+    entrees = []
+    for nom in os.listdir(repertoire):
+        if not nom.endswith(EXTENSION):
+            continue
+        chemin = os.path.join(repertoire, nom)
+        try:
+            stat = os.stat(chemin)
+        except FileNotFoundError:
+            continue
+        entrees.append((chemin, stat.st_size, stat.st_mtime))
+    return entrees
+
+
+def charger_depuis_cache(cle_schema, cle_contenu, repertoire=None):
+    """Relit une entrée du cache, ou None si elle est absente ou illisible"""
+    chemin = _chemin_entree(cle_schema, cle_contenu, repertoire or REPERTOIRE_CACHE)
+    if not os.path.exists(chemin):
+        return None
+    try:
+        df = pd.read_parquet(chemin)
+    except Exception as e:
+        logger.warning("Entrée de cache illisible %s : %s", chemin, e)
+        _supprimer(chemin)
+        return None
+    # Marquer l'entrée comme récemment utilisée pour l'éviction
+    try:
+        os.utime(chemin)
+    except OSError:
+        pass
+    return df
+
+
+def enregistrer_dans_cache(cle_schema, cle_contenu, df, repertoire=None, taille_max=None):
+    """Écrit une entrée dans le cache puis applique l'éviction par taille"""
+    repertoire = repertoire or REPERTOIRE_CACHE
+    try:
+        os.makedirs(repertoire, exist_ok=True)
+        # Écriture atomique : fichier temporaire puis renommage
+        descripteur, chemin_tmp = tempfile.mkstemp(dir=repertoire, suffix=".tmp")
+        os.close(descripteur)
+        try:
+            df.to_parquet(chemin_tmp, index=False)
+            os.replace(chemin_tmp, _chemin_entree(cle_schema, cle_contenu, repertoire))
+        finally:
+            _supprimer(chemin_tmp)
+    except Exception as e:
+        # Colonnes object hétérogènes, disque plein... : on continue sans cache
+        logger.warning("Impossible de mettre en cache le fichier %s : %s", cle_contenu, e)
+        return False
+    evincer_cache(taille_max, repertoire)
+    return True
+
+
+def evincer_cache(taille_max=None, repertoire=None):
+    """Supprime les entrées les moins récemment utilisées au-delà de la taille maximale"""
+    taille_max = TAILLE_MAX_CACHE if taille_max is None else taille_max
+    entrees = sorted(_entrees(repertoire or REPERTOIRE_CACHE), key=lambda e: e[2])
+    taille_totale = sum(taille for _, taille, _ in entrees)
+    supprimees = 0
+    for chemin, taille, _ in entrees:
+        if taille_totale <= taille_max:
+            break
+        if _supprimer(chemin):
+            taille_totale -= taille
+            supprimees += 1
+    return supprimees
+
+
+def invalider_cache(cle_schema=None, repertoire=None):
+    """Supprime toutes les entrées du cache, ou seulement celles d'un schéma"""
+    supprimees = 0
+    for chemin, _, _ in _entrees(repertoire or REPERTOIRE_CACHE):
+        if cle_schema is None or os.path.basename(chemin).startswith(f"{cle_schema}_"):
+            supprimees += _supprimer(chemin)
+    return supprimees
+
+
+def purger_schemas_obsoletes(schemas_actifs, repertoire=None):
+    """Supprime les entrées produites avec un dictionnaire de types qui n'est plus en vigueur"""
+    schemas_actifs = set(schemas_actifs)
+    supprimees = 0
+    for chemin, _, _ in _entrees(repertoire or REPERTOIRE_CACHE):
+        if os.path.basename(chemin).split("_", 1)[0] not in schemas_actifs:
+            supprimees += _supprimer(chemin)
+    return supprimees
+
+
+def statistiques_cache(repertoire=None):
+    """Nombre d'entrées et taille totale (octets) du cache"""
+    entrees = _entrees(repertoire or REPERTOIRE_CACHE)
+    return len(entrees), sum(taille for _, taille, _ in entrees)
+
+
+def lire_avec_cache(source, cle_schema, lecteur, repertoire=None, cle_contenu=None):
+    """
+    Lit un fichier en passant par le cache : relecture Parquet si le même
+    contenu a déjà été lu avec le même schéma, sinon appel de ``lecteur(source)``
+    puis mise en cache du résultat. L'empreinte du contenu peut être fournie
+    si l'appelant l'a déjà calculée.
+    """
+    if cle_contenu is None:
+        cle_contenu = empreinte_contenu(source)
+    df = charger_depuis_cache(cle_schema, cle_contenu, repertoire)
+    if df is not None:
+        return df
+    df = lecteur(source)
+    enregistrer_dans_cache(cle_schema, cle_contenu, df, repertoire)
+    return df
+
+
+def _supprimer(chemin):
+    try:
+        os.remove(chemin)
+        return True
+    except FileNotFoundError:
+        return False
@@ -0,0 +1,61 @@
+"""
+Cache en mémoire des résultats d'analyse, à éviction LRU.
+
+Les résultats d'une analyse (métriques et petites tables) sont conservés
+sous une clé composée de l'empreinte des données et des paramètres :
+(empreintes, type d'analyse, compte, année, mois, limite ou seuil).
+Revenir sur une combinaison récente, y compris depuis une autre session,
+ne refait aucun calcul. Au-delà de ``taille_max`` entrées, la moins
+récemment utilisée est supprimée.
+
+Les résultats conservés sont partagés : ils ne doivent pas être modifiés
+par l'appelant.
+"""
+import threading
+from collections import OrderedDict
+
+# Nombre de résultats conservés en mémoire
+TAILLE_CACHE_RESULTATS = 256
+
+
+class CacheResultats:
+    """Dictionnaire borné à éviction LRU, utilisable depuis plusieurs sessions"""
+
+    def __init__(self, taille_max=TAILLE_CACHE_RESULTATS):
+        self.taille_max = taille_max
+        self._entrees = OrderedDict()
+        self._verrou = threading.Lock()
+        self.succes = 0
+        self.echecs = 0
+
+    def __len__(self):
+        return len(self._entrees)
+
+    def obtenir(self, cle):
+        """Résultat associé à la clé, None s'il n'est pas en cache"""
+        with self._verrou:
+            if cle not in self._entrees:
+                self.echecs += 1
+                return None
+            self._entrees.move_to_end(cle)
+            self.succes += 1
+            return self._entrees[cle]
+
+    def enregistrer(self, cle, resultat):
+        """Conserve un résultat et supprime les plus anciens au-delà de la taille maximale"""
+        with self._verrou:
+            self._entrees[cle] = resultat
+            self._entrees.move_to_end(cle)
+            while len(self._entrees) > self.taille_max:
+                self._entrees.popitem(last=False)
+
+    def vider(self):
+        with self._verrou:
+            self._entrees.clear()
+            self.succes = 0
+            self.echecs = 0
+
+    def taux_succes(self):
+        """Part des recherches satisfaites par le cache, None avant la première recherche"""
+        total = self.succes + self.echecs
+        return self.succes / total if total else None
@@ -0,0 +1,413 @@
+"""
+Calculs des indicateurs bancaires : taux d'utilisation, turnover routed,
+découvert et Credit Line Overdraft.
+
+Ce module ne dépend pas de Streamlit : il est partagé par l'application
+(app.py) et par l'exécution en ligne de commande (cli.py).
+"""
+import numpy as np
+import pandas as pd
+
+from cache_fichiers import empreinte_schema, lire_avec_cache
+from credits_mouvements import turnover_mouvements
+from instrumentation import JournalPerformance
+from lecture_arrow import format_fichier, lire_arrow
+from lecture_streaming import COLONNES_ANALYSE_MVT, COLONNES_EXCLUES, lire_mvt_streaming
+from portefeuille import episodes_decouvert, historique_turnover
+
+# --- Définition des types ---
+types_solde = {
+    "COMPTE": "int64",
+    "SOLDE": "int64"
+}
+dates_solde = ["DATPOS"]
+
+types_mvt = {
+    "COMPTE": "int64",
+    "MNTDEV": "int64",
+    "LIBELLE": "string",
+    "CODOPSC": "string",
+    "EXPL": "string",
+    "NATOP": "object",
+    "REFREL": "object",
+    "NOOPER": "string",
+    "DATHGEN": "float64",
+    "NOREF": "float64",
+    "DATECH": "float64",
+    "XCASH": "float64"
+}
+dates_mvt = ["DATOPER"]
+
+# Empreintes des schémas de lecture : toute modification des dictionnaires
+# ci-dessus invalide les entrées correspondantes du cache Parquet
+schema_solde = empreinte_schema(types_solde, dates_solde)
+schema_mvt = empreinte_schema(types_mvt, dates_mvt, variante="sans DATVAL")
+schema_mvt_streaming = empreinte_schema(
+    types_mvt, dates_mvt, variante="streaming:" + ",".join(COLONNES_ANALYSE_MVT)
+)
+
+# --- Fonctions utilitaires ---
+def _lire_excel_solde(source):
+    return pd.read_excel(source, dtype=types_solde, parse_dates=dates_solde)
+
+def _lire_excel_mvt(source):
+    df = pd.read_excel(source, dtype=types_mvt, parse_dates=dates_mvt)
+    if 'DATVAL' in df.columns:
+        df = df.drop(columns=['DATVAL'])
+    return df
+
+def _lire_excel_mvt_streaming(source):
+    return lire_mvt_streaming(source, types_mvt, dates_mvt, colonnes=COLONNES_ANALYSE_MVT)
+
+def _lire_arrow_solde(source):
+    return lire_arrow(source, types_solde, dates_solde)
+
+def _lire_arrow_mvt(source):
+    return lire_arrow(source, types_mvt, dates_mvt, exclues=COLONNES_EXCLUES)
+
+def _lire_arrow_mvt_streaming(source):
+    return lire_arrow(source, types_mvt, dates_mvt, colonnes=COLONNES_ANALYSE_MVT)
+
+def _lire(source, cle_schema, lecteur_excel, lecteur_arrow, cle_contenu):
+    """Lecture Excel ou CSV via le cache Parquet ; un fichier Parquet est lu directement"""
+    format_source = format_fichier(source)
+    if format_source == "parquet":
+        return lecteur_arrow(source)
+    lecteur = lecteur_arrow if format_source == "csv" else lecteur_excel
+    return lire_avec_cache(source, cle_schema, lecteur, cle_contenu=cle_contenu)
+
+def lire_soldes(source, cle_contenu=None):
+    """Lit un fichier de soldes journaliers (Excel, CSV ou Parquet ; chemin ou fichier importé)"""
+    return _lire(source, schema_solde, _lire_excel_solde, _lire_arrow_solde, cle_contenu)
+
+def lire_mouvements(source, par_blocs=False, cle_contenu=None):
+    """Lit un fichier de mouvements (Excel, CSV ou Parquet), éventuellement limité aux colonnes utiles"""
+    if par_blocs:
+        return _lire(source, schema_mvt_streaming, _lire_excel_mvt_streaming, _lire_arrow_mvt_streaming, cle_contenu)
+    return _lire(source, schema_mvt, _lire_excel_mvt, _lire_arrow_mvt, cle_contenu)
+
+def obtenir_comptes_disponibles(df_solde, df_mvt):
+    comptes_solde = df_solde['COMPTE'].dropna().unique() if df_solde is not None else []
+    comptes_mvt = df_mvt['COMPTE'].dropna().unique() if df_mvt is not None else []
+    comptes = set(comptes_solde).union(set(comptes_mvt))
+    return sorted(comptes)
+
+def filtrer_par_compte_mois_annee(df_solde, df_mvt, compte, annee, mois, index_solde=None, index_mvt=None):
+    if index_solde is not None:
+        df_solde_filtre = index_solde.lignes_mois(compte, annee, mois)
+    else:
+        df_solde_filtre = df_solde[
+            (df_solde["COMPTE"] == compte) &
+            (df_solde["DATPOS"].dt.year == annee) &
+            (df_solde["DATPOS"].dt.month == mois)
+        ] if df_solde is not None else pd.DataFrame()
+
+    if index_mvt is not None:
+        df_mvt_filtre = index_mvt.lignes_mois(compte, annee, mois)
+    else:
+        df_mvt_filtre = df_mvt[
+            (df_mvt["COMPTE"] == compte) &
+            (df_mvt["DATOPER"].dt.year == annee) &
+            (df_mvt["DATOPER"].dt.month == mois)
+        ] if df_mvt is not None else pd.DataFrame()
+
+    return df_solde_filtre, df_mvt_filtre
+
+def nb_lignes_mois(df, colonne_date, compte, annee, mois, index=None):
+    """Nombre de lignes d'un compte pour un mois, compté dans l'index s'il existe"""
+    if index is not None:
+        return index.nb_lignes_mois(compte, annee, mois)
+    if df is None:
+        return 0
+    return int((
+        (df["COMPTE"] == compte) &
+        (df[colonne_date].dt.year == annee) &
+        (df[colonne_date].dt.month == mois)
+    ).sum())
+
+def calculer_usage_rate_mensuel(df_solde_filtre, limite_credit):
+    if df_solde_filtre.empty:
+        return None, None
+    
+    df_result = df_solde_filtre.copy()
+    df_result['TAUX_USAGE'] = (df_result['SOLDE'] / limite_credit) * 100
+    moyenne_taux = df_result['TAUX_USAGE'].mean()
+    
+    return moyenne_taux, df_result
+
+def calculer_turnover_routed_depuis_solde(df_solde, compte, annee, mois, index=None):
+    date_ref = pd.Timestamp(year=annee, month=mois, day=1)
+    debut_periode = date_ref - pd.DateOffset(months=2)
+    fin_periode = date_ref + pd.DateOffset(months=1) - pd.Timedelta(days=1)
+
+    if index is not None:
+        # Lignes déjà triées par date dans l'index
+        df_filtre = index.lignes_periode(compte, debut_periode, fin_periode).reset_index(drop=True)
+    else:
+        df_filtre = df_solde[
+            (df_solde['COMPTE'] == compte) &
+            (df_solde['DATPOS'] >= debut_periode) &
+            (df_solde['DATPOS'] <= fin_periode)
+        ].sort_values(by='DATPOS').reset_index(drop=True)
+
+    if df_filtre.empty or len(df_filtre) < 2:
+        return None, None
+
+    df_filtre['VARIATION'] = df_filtre['SOLDE'].diff()
+    df_filtre['FLUX_CREDITEUR'] = df_filtre['VARIATION'].apply(lambda x: x if x > 0 else 0)
+    total_flux_crediteur = df_filtre['FLUX_CREDITEUR'].sum()
+    moyenne_solde = df_filtre['SOLDE'].mean()
+
+    if moyenne_solde == 0:
+        return None, None
+
+    turnover = (total_flux_crediteur / moyenne_solde) * 100
+    return turnover, df_filtre
+
+# --- Nouvelles fonctions pour l'analyse de découvert ---
+def moyenne_duree_decouvert(groupe):
+    """Calcule la durée moyenne des périodes de découvert consécutives"""
+    a_decouvert = groupe['A_DECOUVERT'].values
+    if not a_decouvert.any():
+        return 0
+    # Les lignes du groupe forment une seule séquence
+    _, durees = episodes_decouvert(np.zeros(len(a_decouvert)), a_decouvert)
+    return durees.sum() / len(durees)
+
+def analyser_decouvert_et_credit_line_overdraft(df_solde, compte, date_position, seuil_utilisateur, index=None,
+                                                cube=None):
+    """
+    Analyse complète du découvert et des Credit Line Overdraft
+    """
+    if df_solde is None or df_solde.empty:
+        return None, None, None, None
+    
+    # Filtrer pour le compte spécifique
+    if cube is not None:
+        dfS2 = cube.lignes_compte(compte)
+    elif index is not None:
+        dfS2 = index.lignes_compte(compte)
+    else:
+        dfS2 = df_solde[df_solde['COMPTE'] == compte].copy()
+    
+    if dfS2.empty:
+        return None, None, None, None
+    
+    # === Partie 1 : Durée moyenne à découvert sur les 12 mois avant le mois sélectionné ===
+    start_date_decouvert = date_position - pd.DateOffset(months=12)
+    end_date_decouvert = date_position - pd.offsets.MonthBegin(1)
+    
+    if cube is not None:
+        # Solde moyen mensuel lu dans le cube
+        solde_moyen_mensuel_decouvert = cube.moyennes_mensuelles(compte, start_date_decouvert, end_date_decouvert)
+    else:
+        # Filtrer données pour période découvert
+        if index is not None:
+            dfS2_periode_decouvert = index.lignes_periode(compte, start_date_decouvert, end_date_decouvert).copy()
+        else:
+            dfS2_periode_decouvert = dfS2[(dfS2['DATPOS'] >= start_date_decouvert) & (dfS2['DATPOS'] <= end_date_decouvert)].copy()
+        dfS2_periode_decouvert['MOIS'] = dfS2_periode_decouvert['DATPOS'].dt.to_period('M')
+        
+        # Calcul solde moyen mensuel
+        solde_moyen_mensuel_decouvert = dfS2_periode_decouvert.groupby(['COMPTE', 'MOIS'])['SOLDE'].mean().reset_index()
+        solde_moyen_mensuel_decouvert = solde_moyen_mensuel_decouvert.rename(columns={'SOLDE': 'SOLDE_MOYEN'})
+    
+    # Appliquer règle découvert
+    solde_moyen_mensuel_decouvert['A_DECOUVERT'] = solde_moyen_mensuel_decouvert['SOLDE_MOYEN'] <= seuil_utilisateur
+    
+    # Trier
+    solde_moyen_mensuel_decouvert = solde_moyen_mensuel_decouvert.sort_values(['COMPTE', 'MOIS'])
+    
+    # Calcul durée moyenne découvert
+    duree_moyenne_decouvert_val = 0
+    if not solde_moyen_mensuel_decouvert.empty:
+        duree_moyenne_decouvert_val = moyenne_duree_decouvert(solde_moyen_mensuel_decouvert)
+    
+    # === Partie 2 : Analyse des "Credit Line Overdraft" sur les 12 mois incluant le mois sélectionné ===
+    start_date_overdraft = date_position - pd.DateOffset(months=11)
+    end_date_overdraft = date_position + pd.offsets.MonthEnd(0)
+    
+    if cube is not None:
+        # Solde moyen mensuel lu dans le cube
+        solde_moyen_mensuel_overdraft = cube.moyennes_mensuelles(compte, start_date_overdraft, end_date_overdraft)
+    else:
+        # Filtrer données pour période overdraft
+        if index is not None:
+            dfS2_periode_overdraft = index.lignes_periode(compte, start_date_overdraft, end_date_overdraft).copy()
+        else:
+            dfS2_periode_overdraft = dfS2[(dfS2['DATPOS'] >= start_date_overdraft) & (dfS2['DATPOS'] <= end_date_overdraft)].copy()
+        dfS2_periode_overdraft['MOIS'] = dfS2_periode_overdraft['DATPOS'].dt.to_period('M')
+        
+        # Calcul solde moyen mensuel
+        solde_moyen_mensuel_overdraft = dfS2_periode_overdraft.groupby(['COMPTE', 'MOIS'])['SOLDE'].mean().reset_index()
+        solde_moyen_mensuel_overdraft = solde_moyen_mensuel_overdraft.rename(columns={'SOLDE': 'SOLDE_MOYEN'})
+    
+    # Identifier le mois pic (solde moyen max) par compte
+    pics = None
+    solde_moyen_complet = None
+    nb_credit_line_overdraft = 0
+    
+    if not solde_moyen_mensuel_overdraft.empty:
+        pics = solde_moyen_mensuel_overdraft.loc[
+            solde_moyen_mensuel_overdraft.groupby('COMPTE')['SOLDE_MOYEN'].idxmax()
+        ].rename(columns={'MOIS': 'MOIS_PIC', 'SOLDE_MOYEN': 'SOLDE_MAXI'})
+        
+        # Jointure pour calcul écart au pic
+        solde_moyen_complet = solde_moyen_mensuel_overdraft.merge(pics[['COMPTE', 'SOLDE_MAXI']], on='COMPTE', how='left')
+        solde_moyen_complet['ECART_AU_PIC'] = solde_moyen_complet['SOLDE_MAXI'] - solde_moyen_complet['SOLDE_MOYEN']
+        
+        # Tri et calcul solde précédent
+        solde_moyen_complet = solde_moyen_complet.sort_values(['COMPTE', 'MOIS'])
+        solde_moyen_complet['SOLDE_PRECEDENT'] = solde_moyen_complet.groupby('COMPTE')['SOLDE_MOYEN'].shift(1)
+        
+        # Détection "Credit Line Overdraft" = solde moyen qui s'améliore mois à mois
+        solde_moyen_complet['CREDIT_LINE_OVERDRAFT'] = (
+            solde_moyen_complet['SOLDE_MOYEN'] > solde_moyen_complet['SOLDE_PRECEDENT']
+        ).astype(int)
+        
+        # Compter le nombre de Credit Line Overdraft
+        nb_credit_line_overdraft = solde_moyen_complet['CREDIT_LINE_OVERDRAFT'].sum()
+    
+    return duree_moyenne_decouvert_val, solde_moyen_mensuel_decouvert, solde_moyen_complet, nb_credit_line_overdraft
+
+def calculer_metriques_compte(df_solde, df_mvt, compte, annee, mois, limite_credit=None,
+                              seuil_decouvert=None, index_solde=None, index_mvt=None, cube=None, credits=None):
+    """
+    Indicateurs d'un compte pour une période, sous forme de dictionnaire :
+    taux d'utilisation (si limite_credit), turnover routed, turnover sur les
+    mouvements créditeurs (si credits), durée moyenne de découvert et Credit
+    Line Overdraft (si seuil_decouvert). Avec le cube mensuel, aucune ligne
+    journalière n'est extraite : les indicateurs sont lus dans le cube et
+    les nombres de lignes du mois comptés dans les index.
+    """
+    resultat = {
+        "COMPTE": compte,
+        "ANNEE": annee,
+        "MOIS": mois,
+        "NB_LIGNES_SOLDE": nb_lignes_mois(df_solde, "DATPOS", compte, annee, mois, index=index_solde),
+        "NB_LIGNES_MVT": nb_lignes_mois(df_mvt, "DATOPER", compte, annee, mois, index=index_mvt),
+    }
+
+    if limite_credit is not None and limite_credit > 0:
+        if cube is not None:
+            taux_moyen, taux_max, solde_moyen = cube.usage(compte, annee, mois, limite_credit)
+        else:
+            df_solde_filtre, _ = filtrer_par_compte_mois_annee(
+                df_solde, None, compte, annee, mois, index_solde=index_solde
+            )
+            taux_moyen, df_usage = calculer_usage_rate_mensuel(df_solde_filtre, limite_credit)
+            taux_max = df_usage['TAUX_USAGE'].max() if df_usage is not None else None
+            solde_moyen = df_usage['SOLDE'].mean() if df_usage is not None else None
+        resultat["TAUX_USAGE_MOYEN"] = taux_moyen
+        resultat["TAUX_USAGE_MAX"] = taux_max
+        resultat["SOLDE_MOYEN"] = solde_moyen
+
+    if cube is not None:
+        turnover, total_flux, moyenne_solde = cube.turnover(compte, annee, mois)
+    else:
+        turnover, df_turnover = calculer_turnover_routed_depuis_solde(
+            df_solde, compte, annee, mois, index=index_solde
+        )
+        total_flux = df_turnover['FLUX_CREDITEUR'].sum() if df_turnover is not None else None
+        moyenne_solde = df_turnover['SOLDE'].mean() if df_turnover is not None else None
+    resultat["TURNOVER_ROUTED"] = turnover
+    resultat["TOTAL_FLUX_CREDITEUR"] = total_flux
+    resultat["MOYENNE_SOLDE_3M"] = moyenne_solde
+
+    if credits is not None:
+        resultat.update(turnover_mouvements(credits, compte, annee, mois, moyenne_solde))
+
+    if seuil_decouvert is not None:
+        date_position = pd.Timestamp(year=annee, month=mois, day=1)
+        duree_moyenne, _, _, nb_credit_line = analyser_decouvert_et_credit_line_overdraft(
+            df_solde, compte, date_position, seuil_decouvert, index=index_solde, cube=cube
+        )
+        resultat["DUREE_MOYENNE_DECOUVERT"] = duree_moyenne
+        resultat["NB_CREDIT_LINE_OVERDRAFT"] = nb_credit_line
+
+    return resultat
+
+def calculer_turnover_utilisation(df_solde, df_mvt, compte, annee, mois, limite_credit,
+                                  index_solde=None, index_mvt=None, cube=None, journal=None, matrice=None,
+                                  credits=None):
+    """
+    Résultats de l'analyse turnover & utilisation d'un compte pour un mois :
+    métriques et tables à afficher (USAGE, TURNOVER, HISTORIQUE), None pour
+    les parties sans données. Avec la matrice dense des soldes, CALENDAIRE
+    donne les mêmes indicateurs sur tous les jours calendaires du mois ;
+    avec les crédits cumulés des mouvements, MOUVEMENTS donne le turnover
+    calculé sur les crédits réels.
+    """
+    journal = journal or JournalPerformance()
+
+    with journal.etape("filtrage") as mesure:
+        df_solde_filtre, df_mvt_filtre = filtrer_par_compte_mois_annee(
+            df_solde, df_mvt, compte, annee, mois, index_solde=index_solde, index_mvt=index_mvt
+        )
+        mesure["LIGNES"] = len(df_solde_filtre) + (len(df_mvt_filtre) if df_mvt_filtre is not None else 0)
+    resultat = {
+        "NB_LIGNES_SOLDE": len(df_solde_filtre),
+        "NB_LIGNES_MVT": len(df_mvt_filtre) if df_mvt_filtre is not None else 0,
+        "TAUX_USAGE_MOYEN": None,
+        "TAUX_USAGE_MAX": None,
+        "SOLDE_MOYEN": None,
+        "USAGE": None,
+        "TURNOVER_ROUTED": None,
+        "TOTAL_FLUX_CREDITEUR": None,
+        "MOYENNE_SOLDE_3M": None,
+        "TURNOVER": None,
+        "HISTORIQUE": None,
+        "CALENDAIRE": None,
+        "MOUVEMENTS": None,
+    }
+
+    # Taux d'utilisation, métriques lues dans le cube mensuel s'il existe
+    if not df_solde_filtre.empty and limite_credit > 0:
+        with journal.etape("taux_utilisation", lignes=len(df_solde_filtre)):
+            taux_moyen, df_usage = calculer_usage_rate_mensuel(df_solde_filtre, limite_credit)
+            if taux_moyen is not None:
+                if cube is not None:
+                    taux_moyen, taux_max, solde_moyen = cube.usage(compte, annee, mois, limite_credit)
+                else:
+                    taux_max = df_usage['TAUX_USAGE'].max()
+                    solde_moyen = df_usage['SOLDE'].mean()
+                resultat.update(TAUX_USAGE_MOYEN=taux_moyen, TAUX_USAGE_MAX=taux_max,
+                                SOLDE_MOYEN=solde_moyen, USAGE=df_usage)
+
+    # Turnover routed sur 3 mois
+    with journal.etape("turnover") as mesure:
+        turnover, df_turnover = calculer_turnover_routed_depuis_solde(
+            df_solde, compte, annee, mois, index=index_solde
+        )
+        mesure["LIGNES"] = len(df_turnover) if df_turnover is not None else 0
+        if turnover is not None and df_turnover is not None:
+            if cube is not None:
+                turnover, total_flux, moyenne_solde = cube.turnover(compte, annee, mois)
+            else:
+                total_flux = df_turnover['FLUX_CREDITEUR'].sum()
+                moyenne_solde = df_turnover['SOLDE'].mean()
+            resultat.update(TURNOVER_ROUTED=turnover, TOTAL_FLUX_CREDITEUR=total_flux,
+                            MOYENNE_SOLDE_3M=moyenne_solde, TURNOVER=df_turnover)
+
+    # Turnover sur les crédits réels, deux recherches dans le cumul des crédits du compte
+    if credits is not None:
+        with journal.etape("turnover_mouvements"):
+            resultat["MOUVEMENTS"] = turnover_mouvements(
+                credits, compte, annee, mois, resultat["MOYENNE_SOLDE_3M"]
+            )
+
+    # Historique du turnover sur tous les mois du compte
+    with journal.etape("historique_turnover") as mesure:
+        df_historique = historique_turnover(df_solde, compte, index=index_solde, cube=cube)
+        resultat["HISTORIQUE"] = df_historique[df_historique['TURNOVER_ROUTED_3M'].notna()]
+        mesure["LIGNES"] = len(resultat["HISTORIQUE"])
+
+    # Indicateurs sur base calendaire, soldes reportés sur les jours sans position
+    if matrice is not None:
+        with journal.etape("base_calendaire"):
+            usage = matrice.usage(compte, annee, mois, limite_credit) if limite_credit > 0 else None
+            turnover = matrice.turnover(compte, annee, mois)
+            if usage is not None or turnover is not None:
+                resultat["CALENDAIRE"] = {**(usage or {}), **(turnover or {})}
+
+    return resultat
@@ -0,0 +1,164 @@
+"""
+Test de charge du service HTTP des indicateurs (voir service.py).
+
+Des requêtes ``GET /metriques`` sur des comptes et des mois tirés au hasard
+parmi ceux du service (ou ``POST /metriques/lot`` avec ``--lot``) sont
+envoyées par plusieurs clients en parallèle, chacun sur sa propre connexion
+maintenue ouverte. Le rapport donne le débit, les latences (médiane, 95e et
+99e centiles, maximum) et le nombre d'erreurs ; il peut être écrit en JSON.
+
+Exemple (service lancé sur la machine) :
+    python charge_service.py --url http://127.0.0.1:8502 --periode 2024-01:2024-12 \\
+        --requetes 5000 --concurrence 16 --limite-credit 1000000 --seuil-decouvert 0
+"""
+import argparse
+import http.client
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, urlsplit
+
+import numpy as np
+
+from cli import lire_periodes
+
+
+class Client:
+    """Connexion HTTP persistante vers le service, rouverte après une erreur"""
+
+    def __init__(self, url, delai=30):
+        adresse = urlsplit(url)
+        self.hote, self.port = adresse.hostname, adresse.port or 80
+        self.delai = delai
+        self.connexion = None
+
+    def envoyer(self, methode, chemin, corps=None):
+        """Statut et contenu JSON de la réponse"""
+        if self.connexion is None:
+            self.connexion = http.client.HTTPConnection(self.hote, self.port, timeout=self.delai)
+        entetes = {"Content-Type": "application/json"} if corps is not None else {}
+        try:
+            self.connexion.request(methode, chemin, body=json.dumps(corps) if corps is not None else None,
+                                   headers=entetes)
+            reponse = self.connexion.getresponse()
+            contenu = json.loads(reponse.read() or b"{}")
+        except Exception:
+            self.fermer()
+            raise
+        if reponse.getheader("Connection", "").lower() == "close":
+            self.fermer()
+        return reponse.status, contenu
+
+    def fermer(self):
+        if self.connexion is not None:
+            self.connexion.close()
+            self.connexion = None
+
+
+def requetes_aleatoires(comptes, periodes, nb_requetes, taille_lot=None, limite_credit=None,
+                        seuil_decouvert=None, graine=0):
+    """Requêtes (méthode, chemin, corps) sur des comptes et des mois tirés au hasard"""
+    rng = np.random.default_rng(graine)
+    parametres = {nom: valeur for nom, valeur in
+                  (("limite_credit", limite_credit), ("seuil_decouvert", seuil_decouvert)) if valeur is not None}
+    requetes = []
+    for _ in range(nb_requetes):
+        annee, mois = periodes[rng.integers(len(periodes))]
+        periode = f"{annee}-{mois:02d}"
+        if taille_lot:
+            lot = rng.choice(comptes, min(taille_lot, len(comptes)), replace=False)
+            requetes.append(("POST", "/metriques/lot",
+                             {"comptes": [int(c) for c in lot], "periode": periode, **parametres}))
+        else:
+            compte = int(comptes[rng.integers(len(comptes))])
+            requetes.append(("GET", "/metriques?" + urlencode({"compte": compte, "periode": periode, **parametres}),
+                             None))
+    return requetes
+
+
+def executer_charge(url, requetes, concurrence):
+    """Envoie les requêtes avec ``concurrence`` clients ; renvoie latences (s), statuts et durée totale"""
+    tranches = [requetes[i::concurrence] for i in range(concurrence)]
+
+    def client(tranche):
+        connexion = Client(url)
+        mesures = []
+        for methode, chemin, corps in tranche:
+            debut = time.perf_counter()
+            try:
+                statut, _ = connexion.envoyer(methode, chemin, corps)
+            except Exception:
+                statut = None
+            mesures.append((time.perf_counter() - debut, statut))
+        connexion.fermer()
+        return mesures
+
+    debut = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrence) as executeur:
+        mesures = [m for tranche in executeur.map(client, tranches) for m in tranche]
+    duree = time.perf_counter() - debut
+    latences = np.array([latence for latence, _ in mesures])
+    statuts = [statut for _, statut in mesures]
+    return latences, statuts, duree
+
+
+def bilan_charge(latences, statuts, duree):
+    """Débit, latences en millisecondes et erreurs d'une série de requêtes"""
+    centiles = np.percentile(latences, [50, 95, 99]) * 1000 if len(latences) else [None] * 3
+    return {
+        "NB_REQUETES": len(latences),
+        "NB_ERREURS": sum(1 for statut in statuts if statut != 200),
+        "DUREE_SECONDES": round(duree, 3),
+        "REQUETES_PAR_SECONDE": round(len(latences) / duree, 1) if duree else None,
+        "LATENCE_MEDIANE_MS": round(float(centiles[0]), 2) if len(latences) else None,
+        "LATENCE_P95_MS": round(float(centiles[1]), 2) if len(latences) else None,
+        "LATENCE_P99_MS": round(float(centiles[2]), 2) if len(latences) else None,
+        "LATENCE_MAX_MS": round(float(latences.max()) * 1000, 2) if len(latences) else None,
+    }
+
+
+def construire_parser():
+    parser = argparse.ArgumentParser(description="Test de charge du service HTTP des indicateurs BOA")
+    parser.add_argument("--url", default="http://127.0.0.1:8502", help="Adresse du service")
+    parser.add_argument("--periode", type=lire_periodes,
+                        help="Mois interrogés, AAAA-MM ou AAAA-MM:AAAA-MM (défaut : 2024-01:2024-12)")
+    parser.add_argument("--requetes", type=int, default=1000, help="Nombre de requêtes")
+    parser.add_argument("--concurrence", type=int, default=8, help="Nombre de clients simultanés")
+    parser.add_argument("--lot", type=int, help="Comptes par requête POST /metriques/lot (GET par compte sinon)")
+    parser.add_argument("--limite-credit", type=float, help="Limite de crédit pour le taux d'utilisation")
+    parser.add_argument("--seuil-decouvert", type=float,
+                        help="Seuil en dessous duquel le compte est considéré à découvert")
+    parser.add_argument("--graine", type=int, default=0, help="Graine du tirage des comptes et des mois")
+    parser.add_argument("--sortie", help="Fichier JSON du bilan")
+    return parser
+
+
+def main(argv=None):
+    args = construire_parser().parse_args(argv)
+    try:
+        statut, contenu = Client(args.url).envoyer("GET", "/comptes")
+    except OSError as e:
+        print(f"Service injoignable ({args.url}) : {e}", file=sys.stderr)
+        return 1
+    comptes = contenu.get("COMPTES") or []
+    if statut != 200 or not comptes:
+        print(f"Aucun compte servi par {args.url}", file=sys.stderr)
+        return 1
+
+    periodes = args.periode or lire_periodes("2024-01:2024-12")
+    requetes = requetes_aleatoires(comptes, periodes, args.requetes, taille_lot=args.lot,
+                                   limite_credit=args.limite_credit, seuil_decouvert=args.seuil_decouvert,
+                                   graine=args.graine)
+    bilan = bilan_charge(*executer_charge(args.url, requetes, max(1, args.concurrence)))
+    bilan.update({"CONCURRENCE": args.concurrence, "TAILLE_LOT": args.lot})
+    for nom, valeur in bilan.items():
+        print(f"{nom:>22} {valeur}")
+    if args.sortie:
+        with open(args.sortie, "w", encoding="utf-8") as f:
+            json.dump(bilan, f, indent=2)
+    return 1 if bilan["NB_ERREURS"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
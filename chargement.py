@@ -0,0 +1,210 @@
+"""
+Chargement en arrière-plan des fichiers importés.
+
+Dès qu'un fichier est importé, sa lecture est confiée à un pool : les
+soldes et les mouvements sont lus en parallèle, dans des processus séparés
+pour que l'analyse d'un fichier Excel n'occupe pas l'interpréteur de
+l'application. Un fichier déjà présent dans le cache Parquet, ou un
+extrait CSV ou Parquet (lu par Arrow sur plusieurs threads), est lu
+directement, sans passer par un processus.
+
+Chaque chargement est une ``TacheChargement`` identifiée par (type de
+fichier, empreinte du contenu, lecture par blocs) ; une session qui importe
+un fichier déjà chargé ou en cours de chargement, ou une nouvelle exécution
+du script, retrouve la même tâche. Le résultat est un ``DonneesPartagees``
+commun à toutes les sessions.
+
+En parallèle, un aperçu des comptes (colonnes COMPTE et date seulement, voir
+apercu_comptes.py) est lu sur un thread : il alimente le choix du compte et
+de la période en quelques secondes, pendant que la lecture complète se
+poursuit.
+"""
+import io
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from apercu_comptes import lire_apercu
+from cache_fichiers import charger_depuis_cache, empreinte_contenu
+from calculs import dates_mvt, dates_solde, lire_mouvements, lire_soldes, schema_mvt, schema_mvt_streaming, schema_solde
+from donnees_partagees import MAX_JEUX_PARTAGES, DonneesPartagees
+from lecture_arrow import format_fichier
+
+SOLDES = "soldes"
+MOUVEMENTS = "mouvements"
+
+# Processus de lecture : un par fichier importé (soldes et mouvements)
+NB_PROCESSUS_CHARGEMENT = 2
+
+
+def schema_lecture(type_fichier, par_blocs=False):
+    """Empreinte du schéma sous laquelle le fichier est conservé dans le cache Parquet"""
+    if type_fichier == SOLDES:
+        return schema_solde
+    return schema_mvt_streaming if par_blocs else schema_mvt
+
+
+def _source(contenu, nom):
+    """Chemin du fichier, ou fichier en mémoire portant le nom du fichier importé"""
+    if isinstance(contenu, bytes):
+        source = io.BytesIO(contenu)
+        source.name = nom
+        return source
+    return contenu
+
+
+def lire_contenu(type_fichier, contenu, nom, empreinte, par_blocs=False):
+    """Lit un fichier à partir de son chemin ou de son contenu en octets (exécuté dans un processus du pool)"""
+    source = _source(contenu, nom)
+    if type_fichier == SOLDES:
+        return lire_soldes(source, cle_contenu=empreinte)
+    return lire_mouvements(source, par_blocs=par_blocs, cle_contenu=empreinte)
+
+
+def lire_apercu_contenu(type_fichier, contenu, nom, empreinte):
+    """Aperçu des comptes d'un fichier (COMPTE, NB_LIGNES, DATE_MIN, DATE_MAX)"""
+    colonne_date = dates_solde[0] if type_fichier == SOLDES else dates_mvt[0]
+    return lire_apercu(_source(contenu, nom), colonne_date, cle_contenu=empreinte)
+
+
+class TacheChargement:
+    """Chargement d'un fichier en cours ou terminé"""
+
+    def __init__(self, cle, nom, futur):
+        self.cle = cle
+        self.nom = nom
+        self.futur = futur
+        self.debut = time.monotonic()
+        self.fin = None
+        futur.add_done_callback(self._terminer)
+
+    def _terminer(self, futur):
+        self.fin = time.monotonic()
+
+    @property
+    def type_fichier(self):
+        return self.cle[0]
+
+    def terminee(self):
+        return self.futur.done()
+
+    def attendre(self, delai=None):
+        """Attend la fin du chargement au plus ``delai`` secondes ; renvoie True s'il est terminé"""
+        termines, _ = wait([self.futur], timeout=delai)
+        return bool(termines)
+
+    def duree(self):
+        """Secondes écoulées depuis le début du chargement, ou durée totale s'il est terminé"""
+        return (self.fin or time.monotonic()) - self.debut
+
+    def resultat(self):
+        """(données, None) si le chargement a réussi, (None, message) sinon"""
+        erreur = self.futur.exception()
+        if erreur is not None:
+            return None, str(erreur)
+        return self.futur.result(), None
+
+
+class ChargeurArrierePlan:
+    """Pool de chargement partagé par toutes les sessions, avec les tâches des derniers fichiers"""
+
+    def __init__(self, nb_processus=NB_PROCESSUS_CHARGEMENT, max_jeux=MAX_JEUX_PARTAGES):
+        self.nb_processus = nb_processus
+        self.max_jeux = max_jeux
+        self._threads = ThreadPoolExecutor(max_workers=2 * nb_processus, thread_name_prefix="chargement")
+        self._processus = None
+        self._taches = OrderedDict()
+        self._apercus = OrderedDict()
+        self._verrou = threading.Lock()
+
+    def _pool_processus(self):
+        with self._verrou:
+            if self._processus is None:
+                # spawn : pas de fork d'un serveur multi-thread
+                self._processus = ProcessPoolExecutor(
+                    max_workers=self.nb_processus, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._processus
+
+    def _lancer(self, taches, cle, fichier, fonction, *arguments):
+        """Tâche existante pour la clé, ou nouvelle tâche ``fonction(contenu, nom, *arguments)``"""
+        with self._verrou:
+            tache = taches.get(cle)
+            if tache is not None and tache.terminee() and tache.futur.exception() is not None:
+                # Un chargement en échec (fichier illisible, processus interrompu) est relancé
+                del taches[cle]
+                tache = None
+            if tache is not None:
+                taches.move_to_end(cle)
+                return tache
+
+            if isinstance(fichier, (str, os.PathLike)):
+                contenu, nom = os.fspath(fichier), os.path.basename(fichier)
+            else:
+                contenu, nom = fichier.getvalue(), getattr(fichier, "name", "")
+            futur = self._threads.submit(fonction, contenu, nom, *arguments)
+            tache = TacheChargement(cle, nom, futur)
+            taches[cle] = tache
+            self._evincer(taches)
+        return tache
+
+    def soumettre(self, type_fichier, fichier, par_blocs=False, compacte=False, colonnes_utiles=False,
+                  empreinte=None):
+        """
+        Lance le chargement d'un fichier (chemin ou fichier importé), ou
+        retrouve celui en cours ; ``compacte`` et ``colonnes_utiles`` : voir
+        ``DonneesPartagees``. L'empreinte du contenu, si l'appelant l'a déjà
+        calculée, évite de relire tout le fichier
+        """
+        empreinte = empreinte or empreinte_contenu(fichier)
+        return self._lancer(
+            self._taches, (type_fichier, empreinte, par_blocs, compacte, colonnes_utiles), fichier,
+            lambda contenu, nom: self._charger(
+                type_fichier, contenu, nom, empreinte, par_blocs, compacte, colonnes_utiles
+            )
+        )
+
+    def apercu(self, type_fichier, fichier, empreinte=None):
+        """Lance la lecture de l'aperçu des comptes d'un fichier, ou retrouve celle en cours"""
+        empreinte = empreinte or empreinte_contenu(fichier)
+        return self._lancer(
+            self._apercus, (type_fichier, empreinte), fichier,
+            lambda contenu, nom: lire_apercu_contenu(type_fichier, contenu, nom, empreinte)
+        )
+
+    def _charger(self, type_fichier, contenu, nom, empreinte, par_blocs, compacte=False, colonnes_utiles=False):
+        df = charger_depuis_cache(schema_lecture(type_fichier, par_blocs), empreinte)
+        if df is None and format_fichier(nom) != "excel":
+            # CSV et Parquet : lecteurs Arrow multi-thread, sans processus séparé
+            df = lire_contenu(type_fichier, contenu, nom, empreinte, par_blocs)
+        if df is None:
+            try:
+                df = self._pool_processus().submit(
+                    lire_contenu, type_fichier, contenu, nom, empreinte, par_blocs
+                ).result()
+            except BrokenProcessPool:
+                # Un processus a été interrompu : le pool sera recréé au prochain chargement
+                with self._verrou:
+                    self._processus = None
+                raise
+        if type_fichier == SOLDES:
+            return DonneesPartagees(df, "DATPOS", empreinte, avec_cube=True, compacte=compacte,
+                                    colonnes_utiles=colonnes_utiles)
+        return DonneesPartagees(df, "DATOPER", empreinte, compacte=compacte, colonnes_utiles=colonnes_utiles,
+                                avec_credits=True)
+
+    def _evincer(self, taches):
+        """Oublie les plus anciennes tâches terminées au-delà de ``max_jeux`` par type de fichier"""
+        for type_fichier in (SOLDES, MOUVEMENTS):
+            terminees = [c for c, t in taches.items() if c[0] == type_fichier and t.terminee()]
+            for cle in terminees[:max(0, len(terminees) - self.max_jeux)]:
+                del taches[cle]
+
+    def en_cours(self):
+        """Nombre de chargements non terminés"""
+        with self._verrou:
+            return sum(not t.terminee() for t in self._taches.values())
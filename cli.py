@@ -0,0 +1,180 @@
+"""
+Exécution en ligne de commande des analyses BOA, sans Streamlit.
+
+Les comptes sont répartis en lots traités en parallèle par un pool de
+processus ; chaque lot ne reçoit que les lignes de ses comptes. Les
+résultats (un enregistrement par compte et par mois) sont écrits en
+Parquet ou en CSV selon l'extension du fichier de sortie.
+
+Exemple :
+    python cli.py --soldes soldes.xlsx --mouvements mvt.xlsx \\
+        --periode 2024-01:2024-06 --limite-credit 1000000 \\
+        --seuil-decouvert 0 --workers 8 --sortie resultats.parquet
+
+Les données peuvent aussi être lues dans l'entrepôt local (voir
+entrepot.py) avec ``--entrepot <répertoire>`` à la place des fichiers.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from calculs import calculer_metriques_compte, lire_mouvements, lire_soldes
+from credits_mouvements import IndexCredits
+from cube_mensuel import CubeMensuel
+from entrepot import Entrepot
+from index_comptes import IndexComptes
+
+
+def lire_periodes(texte):
+    """Convertit 'AAAA-MM' ou 'AAAA-MM:AAAA-MM' en liste de (année, mois)"""
+    debut, _, fin = texte.partition(":")
+    try:
+        periodes = pd.period_range(pd.Period(debut, "M"), pd.Period(fin or debut, "M"), freq="M")
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(f"Période invalide '{texte}' : {e}")
+    if len(periodes) == 0:
+        raise argparse.ArgumentTypeError(f"Période vide '{texte}'")
+    return [(p.year, p.month) for p in periodes]
+
+
+def _lignes_comptes(index, comptes):
+    """Lignes d'un index appartenant à une liste de comptes"""
+    if index is None:
+        return None
+    plages = [index.plage(compte) for compte in comptes]
+    positions = np.concatenate([np.arange(d, f) for d, f in plages] or [np.array([], dtype=np.int64)])
+    return index.df.iloc[positions]
+
+
+def traiter_lot(df_solde, df_mvt, comptes, periodes, limite_credit, seuil_decouvert):
+    """Calcule les indicateurs d'un lot de comptes pour toutes les périodes"""
+    index_solde = IndexComptes(df_solde, "DATPOS")
+    index_mvt = IndexComptes(df_mvt, "DATOPER") if df_mvt is not None else None
+    cube = CubeMensuel(index_solde)
+    credits = IndexCredits(index_mvt) if index_mvt is not None else None
+    return [
+        calculer_metriques_compte(
+            df_solde, df_mvt, compte, annee, mois,
+            limite_credit=limite_credit, seuil_decouvert=seuil_decouvert,
+            index_solde=index_solde, index_mvt=index_mvt, cube=cube, credits=credits
+        )
+        for compte in comptes
+        for annee, mois in periodes
+    ]
+
+
+def decouper_en_lots(comptes, workers, lots_par_worker=4):
+    """Découpe la liste des comptes en lots contigus"""
+    nb_lots = max(1, min(len(comptes), workers * lots_par_worker))
+    return [lot.tolist() for lot in np.array_split(np.asarray(comptes), nb_lots) if len(lot)]
+
+
+def executer(df_solde, df_mvt, comptes, periodes, limite_credit=None, seuil_decouvert=None, workers=None):
+    """Calcule les indicateurs de tous les comptes demandés, en parallèle si workers > 1"""
+    workers = workers or os.cpu_count() or 1
+    index_solde = IndexComptes(df_solde, "DATPOS")
+    index_mvt = IndexComptes(df_mvt, "DATOPER") if df_mvt is not None else None
+    if comptes is None:
+        comptes = index_solde.comptes.tolist()
+    comptes = sorted(set(comptes))
+
+    lots = decouper_en_lots(comptes, workers)
+    if workers == 1:
+        resultats = [
+            ligne
+            for lot in lots
+            for ligne in traiter_lot(
+                _lignes_comptes(index_solde, lot), _lignes_comptes(index_mvt, lot),
+                lot, periodes, limite_credit, seuil_decouvert
+            )
+        ]
+    else:
+        resultats = []
+        with ProcessPoolExecutor(max_workers=workers) as executeur:
+            futurs = [
+                executeur.submit(
+                    traiter_lot,
+                    _lignes_comptes(index_solde, lot), _lignes_comptes(index_mvt, lot),
+                    lot, periodes, limite_credit, seuil_decouvert
+                )
+                for lot in lots
+            ]
+            for futur in as_completed(futurs):
+                resultats.extend(futur.result())
+
+    df_resultats = pd.DataFrame(resultats)
+    if not df_resultats.empty:
+        df_resultats = df_resultats.sort_values(["COMPTE", "ANNEE", "MOIS"]).reset_index(drop=True)
+    return df_resultats
+
+
+def ecrire_resultats(df, chemin):
+    """Écrit les résultats en Parquet (.parquet) ou en CSV (autre extension)"""
+    if chemin.lower().endswith(".parquet"):
+        df.to_parquet(chemin, index=False)
+    else:
+        df.to_csv(chemin, index=False)
+
+
+def construire_parser():
+    parser = argparse.ArgumentParser(
+        description="Analyse BOA en ligne de commande : taux d'utilisation, turnover routed, "
+                    "découvert et Credit Line Overdraft"
+    )
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--soldes", help="Fichier des soldes journaliers (Excel, CSV ou Parquet)")
+    source.add_argument("--entrepot", help="Répertoire de l'entrepôt local (à la place des fichiers)")
+    parser.add_argument("--mouvements", help="Fichier des mouvements, Excel, CSV ou Parquet (optionnel)")
+    parser.add_argument("--par-blocs", action="store_true",
+                        help="Ne lire que les colonnes utiles des mouvements (par blocs pour les .xlsx)")
+    parser.add_argument("--comptes", nargs="+", type=int,
+                        help="Comptes à analyser (tous les comptes du fichier des soldes par défaut)")
+    parser.add_argument("--periode", required=True, type=lire_periodes,
+                        help="Mois analysé (AAAA-MM) ou plage de mois (AAAA-MM:AAAA-MM)")
+    parser.add_argument("--limite-credit", type=float, help="Limite de crédit pour le taux d'utilisation")
+    parser.add_argument("--seuil-decouvert", type=float,
+                        help="Seuil en dessous duquel le compte est considéré à découvert")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="Nombre de processus (défaut : nombre de cœurs)")
+    parser.add_argument("--sortie", required=True, help="Fichier de résultats (.parquet ou .csv)")
+    return parser
+
+
+def main(argv=None):
+    args = construire_parser().parse_args(argv)
+    debut = time.perf_counter()
+
+    try:
+        if args.entrepot:
+            entrepot = Entrepot(args.entrepot)
+            df_solde, df_mvt = entrepot.lire_soldes_et_mouvements()
+            if df_solde is None:
+                raise ValueError(f"entrepôt vide : {args.entrepot}")
+        else:
+            df_solde = lire_soldes(args.soldes)
+            df_mvt = lire_mouvements(args.mouvements, par_blocs=args.par_blocs) if args.mouvements else None
+    except Exception as e:
+        print(f"Erreur de lecture : {e}", file=sys.stderr)
+        return 1
+    print(f"Fichiers chargés en {time.perf_counter() - debut:.1f}s "
+          f"({len(df_solde)} soldes, {len(df_mvt) if df_mvt is not None else 0} mouvements)",
+          file=sys.stderr)
+
+    df_resultats = executer(
+        df_solde, df_mvt, args.comptes, args.periode,
+        limite_credit=args.limite_credit, seuil_decouvert=args.seuil_decouvert,
+        workers=max(1, args.workers or 1)
+    )
+    ecrire_resultats(df_resultats, args.sortie)
+    print(f"{len(df_resultats)} résultats écrits dans {args.sortie} "
+          f"en {time.perf_counter() - debut:.1f}s", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+"""
+Compaction en mémoire des DataFrames chargés.
+
+Les dictionnaires ``types_solde`` / ``types_mvt`` lisent les montants en
+int64, les codes en float64 et les textes en chaînes Python, alors que la
+plupart de ces colonnes n'ont que quelques valeurs distinctes ou une faible
+étendue. Après la lecture, chaque colonne reçoit le type le plus compact
+qui conserve exactement ses valeurs :
+
+- texte peu varié (valeurs distinctes ≤ ``SEUIL_CATEGORIE`` des lignes) :
+  catégorie, c'est-à-dire un dictionnaire des valeurs et un code entier
+  par ligne ; texte très varié : chaînes Arrow au lieu d'objets Python ;
+- entiers : plus petit type entier contenant toutes les valeurs ;
+- réels : entiers lorsque toutes les valeurs sont entières (codes et dates
+  numériques), float32 lorsque la conversion est exacte.
+
+Les colonnes de dates restent en datetime64 (8 octets quelle que soit la
+précision) et la clé COMPTE en int64, pour les jointures avec les agrégats
+et les exports. Les colonnes qu'aucune analyse n'utilise peuvent en outre
+être supprimées. Le rapport détaille, colonne par colonne, les types et la
+mémoire avant et après.
+"""
+import numpy as np
+import pandas as pd
+from pandas.api.types import (
+    infer_dtype,
+    is_datetime64_any_dtype,
+    is_float_dtype,
+    is_integer_dtype,
+    is_object_dtype,
+    is_string_dtype,
+)
+
+from lecture_streaming import COLONNES_ANALYSE_MVT
+
+# Colonnes utilisées par les analyses, selon la colonne de date du fichier
+COLONNES_ANALYSE = {
+    "DATPOS": ["COMPTE", "DATPOS", "SOLDE"],
+    "DATOPER": COLONNES_ANALYSE_MVT,
+}
+
+# Part maximale de valeurs distinctes pour stocker une colonne texte en catégorie
+SEUIL_CATEGORIE = 0.5
+
+# Clés de jointure laissées dans leur type d'origine
+COLONNES_CLES = ["COMPTE"]
+
+COLONNES_RAPPORT = ["COLONNE", "TYPE_AVANT", "TYPE_APRES", "OCTETS_AVANT", "OCTETS_APRES"]
+
+
+def _compacter_texte(serie, seuil_categorie):
+    if infer_dtype(serie, skipna=True) not in ("string", "empty"):
+        # Colonne objet hétérogène (nombres et textes) : laissée telle quelle
+        return serie
+    if serie.nunique(dropna=True) <= seuil_categorie * len(serie):
+        return serie.astype("category")
+    return serie.astype("string[pyarrow]")
+
+
+def _compacter_reels(serie):
+    valeurs = serie.to_numpy()
+    if np.isfinite(valeurs).all() and np.array_equal(valeurs, np.round(valeurs)):
+        return pd.to_numeric(serie.astype(np.int64), downcast="integer")
+    reduites = valeurs.astype(np.float32)
+    if np.array_equal(reduites.astype(np.float64), valeurs, equal_nan=True):
+        return serie.astype(np.float32)
+    return serie
+
+
+def compacter_colonne(serie, seuil_categorie=SEUIL_CATEGORIE):
+    """Colonne convertie dans le type le plus compact qui conserve ses valeurs"""
+    if isinstance(serie.dtype, pd.CategoricalDtype) or is_datetime64_any_dtype(serie.dtype):
+        return serie
+    if is_object_dtype(serie.dtype) or is_string_dtype(serie.dtype):
+        return _compacter_texte(serie, seuil_categorie)
+    if is_integer_dtype(serie.dtype):
+        return pd.to_numeric(serie, downcast="integer")
+    if is_float_dtype(serie.dtype) and len(serie):
+        return _compacter_reels(serie)
+    return serie
+
+
+def compacter(df, colonnes=None, seuil_categorie=SEUIL_CATEGORIE):
+    """
+    Copie compacte d'un DataFrame et rapport par colonne (COLONNE,
+    TYPE_AVANT, TYPE_APRES, OCTETS_AVANT, OCTETS_APRES). ``colonnes``
+    limite le résultat aux colonnes utiles : les autres sont supprimées
+    (type après « supprimée », 0 octet).
+    """
+    lignes, resultat = [], {}
+    for nom in df.columns:
+        serie = df[nom]
+        avant = int(serie.memory_usage(deep=True, index=False))
+        if colonnes is not None and nom not in colonnes:
+            lignes.append((nom, str(serie.dtype), "supprimée", avant, 0))
+            continue
+        if nom not in COLONNES_CLES:
+            serie = compacter_colonne(serie, seuil_categorie)
+        resultat[nom] = serie
+        lignes.append((nom, str(df[nom].dtype), str(serie.dtype), avant,
+                       int(serie.memory_usage(deep=True, index=False))))
+    return pd.DataFrame(resultat, index=df.index), pd.DataFrame(lignes, columns=COLONNES_RAPPORT)
+
+
+def bilan_compaction(rapport):
+    """Octets avant et après compaction et part de mémoire économisée"""
+    avant, apres = int(rapport["OCTETS_AVANT"].sum()), int(rapport["OCTETS_APRES"].sum())
+    return {
+        "OCTETS_AVANT": avant,
+        "OCTETS_APRES": apres,
+        "PART_ECONOMISEE": 1 - apres / avant if avant else 0.0,
+    }
@@ -0,0 +1,12 @@
+"""
+Configuration commune des tests : le cache Parquet des fichiers lus est
+redirigé vers un répertoire temporaire propre à chaque test.
+"""
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def cache_temporaire(tmp_path, monkeypatch):
+    repertoire = tmp_path / "cache"
+    monkeypatch.setattr("cache_fichiers.REPERTOIRE_CACHE", str(repertoire))
+    return repertoire
@@ -0,0 +1,73 @@
+"""
+Turnover calculé sur les mouvements créditeurs.
+
+Le turnover routed de ``calculer_turnover_routed_depuis_solde`` déduit les
+flux créditeurs des variations de solde d'un jour à l'autre : un crédit et
+un débit passés le même jour se compensent et n'apparaissent pas. Le
+fichier des mouvements donne les crédits réels (MNTDEV > 0).
+
+Le cumul des montants créditeurs est calculé une fois au chargement, dans
+l'ordre de l'index des mouvements (trié par COMPTE puis DATOPER). Les lignes
+d'un compte étant contiguës, le total de ses crédits sur une fenêtre
+quelconque est la différence du cumul entre les deux bornes de la fenêtre,
+trouvées par deux recherches dichotomiques dans les dates du compte : le
+coût ne dépend pas de la longueur de la fenêtre.
+
+Les montants entiers sont cumulés en int64 (sommes exactes), les autres en
+float64, quel que soit le type de la colonne après compaction.
+"""
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_integer_dtype
+
+# Nombre de mois de la fenêtre du turnover, comme pour le turnover sur les soldes
+NB_MOIS_TURNOVER = 3
+
+
+class IndexCredits:
+    """Cumul des montants créditeurs des mouvements, dans l'ordre de l'index (COMPTE, DATOPER)"""
+
+    def __init__(self, index_mvt, colonne_montant="MNTDEV"):
+        self.index = index_mvt
+        montants = index_mvt.df[colonne_montant]
+        if is_integer_dtype(montants.dtype) and not montants.hasnans:
+            valeurs = montants.to_numpy(dtype=np.int64)
+        else:
+            valeurs = montants.to_numpy(dtype=np.float64, na_value=np.nan)
+        est_credit = valeurs > 0
+        # Cumuls précédés d'un zéro : le total des lignes [d, f) vaut cumul[f] - cumul[d]
+        self.cumul = np.concatenate([np.zeros(1, dtype=valeurs.dtype), np.cumsum(np.where(est_credit, valeurs, 0))])
+        self.cumul_nb = np.concatenate([np.zeros(1, dtype=np.int64), np.cumsum(est_credit, dtype=np.int64)])
+
+    @property
+    def nbytes(self):
+        return self.cumul.nbytes + self.cumul_nb.nbytes
+
+    def credits_periode(self, compte, debut, fin):
+        """Total et nombre des crédits du compte datés entre début et fin inclus"""
+        d, f = self.index.plage_periode(compte, debut, fin)
+        return self.cumul[f] - self.cumul[d], int(self.cumul_nb[f] - self.cumul_nb[d])
+
+
+def fenetre_turnover(annee, mois, nb_mois=NB_MOIS_TURNOVER):
+    """Premier et dernier instant de la fenêtre de ``nb_mois`` mois se terminant au mois donné"""
+    date_ref = pd.Timestamp(year=annee, month=mois, day=1)
+    debut = date_ref - pd.DateOffset(months=nb_mois - 1)
+    fin = date_ref + pd.offsets.MonthBegin(1) - pd.Timedelta(1, "ns")
+    return debut, fin
+
+
+def turnover_mouvements(credits, compte, annee, mois, moyenne_solde, nb_mois=NB_MOIS_TURNOVER):
+    """
+    Turnover de la fenêtre calculé sur les crédits réels : total des
+    mouvements créditeurs rapporté au solde moyen de la même fenêtre
+    (TURNOVER_MOUVEMENTS, None sans solde moyen), total et nombre de crédits
+    """
+    debut, fin = fenetre_turnover(annee, mois, nb_mois)
+    total, nb_credits = credits.credits_periode(compte, debut, fin)
+    valide = moyenne_solde is not None and pd.notna(moyenne_solde) and moyenne_solde != 0
+    return {
+        "TURNOVER_MOUVEMENTS": total / moyenne_solde * 100 if valide else None,
+        "TOTAL_CREDITS_MOUVEMENTS": total,
+        "NB_CREDITS_MOUVEMENTS": nb_credits,
+    }
@@ -0,0 +1,150 @@
+"""
+Cube mensuel des soldes : une ligne par (COMPTE, mois).
+
+Le cube est construit une fois au chargement à partir de l'index des
+soldes (voir ``agreger_mensuel``) et partagé par toutes les analyses : une
+fenêtre de 3 mois pour le turnover ou de 12 mois pour le découvert ne lit
+que quelques lignes du cube au lieu des soldes journaliers. Le cube garde
+aussi le solde du premier jour de chaque mois (SOLDE_JOUR1) : la fenêtre
+du découvert, qui se termine le 1er du mois M-1, est lue entièrement dans
+le cube. Les autres mois partiellement couverts par une fenêtre sont
+complétés à partir de l'index journalier.
+"""
+import numpy as np
+import pandas as pd
+
+from index_comptes import IndexComptes
+from portefeuille import agreger_mensuel, mois_depuis_numero, soldes_premier_jour
+
+
+def _debut_mois(date):
+    return pd.Timestamp(year=date.year, month=date.month, day=1)
+
+
+class CubeMensuel:
+    """Agrégats mensuels des soldes par compte, indexés par (COMPTE, mois)"""
+
+    def __init__(self, index_solde, agregats=None):
+        """``agregats`` : agrégats mensuels déjà calculés (entrepôt local), sinon calculés depuis l'index"""
+        self.index_solde = index_solde
+        if agregats is None:
+            agregats = agreger_mensuel(None, index_solde)
+        else:
+            agregats = agregats.sort_values(["COMPTE", "NUM_MOIS"], kind="mergesort").reset_index(drop=True)
+        # Solde du premier jour du mois, NaN sans position ce jour-là
+        agregats = agregats.merge(soldes_premier_jour(None, index_solde), on=["COMPTE", "NUM_MOIS"], how="left")
+        agregats.insert(2, "MOIS", mois_depuis_numero(agregats["NUM_MOIS"]))
+        agregats.insert(3, "DEBUT_MOIS", agregats["MOIS"].dt.to_timestamp())
+        self._index = IndexComptes(agregats, "DEBUT_MOIS")
+        self.df = self._index.df
+
+    def __len__(self):
+        return len(self.df)
+
+    def lignes_compte(self, compte):
+        """Lignes du cube d'un compte, triées par mois"""
+        return self._index.lignes_compte(compte)
+
+    def lignes_mois(self, compte, debut, fin):
+        """Lignes du cube d'un compte pour les mois commençant entre début et fin inclus"""
+        return self._index.lignes_periode(compte, debut, fin)
+
+    def moyennes_mensuelles(self, compte, debut, fin):
+        """
+        Solde moyen mensuel d'un compte (colonnes COMPTE, MOIS, SOLDE_MOYEN)
+        calculé sur les soldes datés entre début et fin inclus. Les mois
+        entièrement couverts sont lus dans le cube, ainsi qu'un mois réduit à
+        son premier jour ; les autres mois partiels aux bornes sont recalculés
+        à partir des soldes journaliers.
+        """
+        debut, fin = pd.Timestamp(debut), pd.Timestamp(fin)
+        if fin < debut:
+            return self._moyennes_vides()
+
+        # Premier et dernier mois entièrement couverts par la fenêtre
+        premier_complet = debut if debut == _debut_mois(debut) else _debut_mois(debut) + pd.offsets.MonthBegin(1)
+        fin_jour = fin.normalize()
+        if (fin_jour + pd.Timedelta(days=1)).day == 1:
+            dernier_complet = _debut_mois(fin_jour)
+        else:
+            dernier_complet = _debut_mois(fin_jour) - pd.offsets.MonthBegin(1)
+
+        # Au plus un mois partiel à chaque borne, dans l'ordre des mois
+        mois, soldes = [], []
+        if debut < premier_complet:
+            self._ajouter_mois_partiel(mois, soldes, compte, debut, min(fin, premier_complet - pd.Timedelta(1, "ns")))
+        if premier_complet <= dernier_complet:
+            complets = self.lignes_mois(compte, premier_complet, dernier_complet)
+            mois.extend(complets["MOIS"])
+            soldes.extend(complets["SOLDE_MOYEN"].to_numpy(dtype=np.float64))
+        debut_mois_fin = _debut_mois(fin)
+        if dernier_complet < debut_mois_fin and premier_complet <= debut_mois_fin:
+            self._ajouter_mois_partiel(mois, soldes, compte, debut_mois_fin, fin)
+
+        if not mois:
+            return self._moyennes_vides()
+        return pd.DataFrame({
+            "COMPTE": np.full(len(mois), compte, dtype=self.df["COMPTE"].dtype),
+            "MOIS": pd.PeriodIndex(mois, freq="M"),
+            "SOLDE_MOYEN": np.asarray(soldes, dtype=np.float64),
+        })
+
+    def _ajouter_mois_partiel(self, mois, soldes, compte, debut, fin):
+        """Solde moyen d'un compte entre deux dates d'un même mois, lu dans le cube s'il s'agit du 1er à 0 h"""
+        if debut == fin == _debut_mois(debut):
+            lignes = self.lignes_mois(compte, debut, debut)
+            if not lignes.empty and pd.notna(lignes["SOLDE_JOUR1"].iloc[0]):
+                mois.append(lignes["MOIS"].iloc[0])
+                soldes.append(lignes["SOLDE_JOUR1"].iloc[0])
+            return
+        lignes = self.index_solde.lignes_periode(compte, debut, fin)
+        if not lignes.empty:
+            mois.append(pd.Period(debut, freq="M"))
+            soldes.append(lignes["SOLDE"].mean())
+
+    def premiers_jours(self, compte=None):
+        """Solde du premier jour de chaque mois (colonnes de ``soldes_premier_jour``), pour un compte ou tous"""
+        lignes = self.lignes_compte(compte) if compte is not None else self.df
+        lignes = lignes[lignes["SOLDE_JOUR1"].notna()]
+        return lignes[["COMPTE", "NUM_MOIS", "SOLDE_JOUR1"]].reset_index(drop=True)
+
+    def usage(self, compte, annee, mois, limite_credit):
+        """Taux d'utilisation moyen et maximal et solde moyen d'un mois, ou (None, None, None)"""
+        debut = pd.Timestamp(year=annee, month=mois, day=1)
+        lignes = self.lignes_mois(compte, debut, debut)
+        if lignes.empty or not limite_credit:
+            return None, None, None
+        ligne = lignes.iloc[0]
+        return (
+            ligne["SOLDE_MOYEN"] / limite_credit * 100,
+            ligne["SOLDE_MAX"] / limite_credit * 100,
+            ligne["SOLDE_MOYEN"],
+        )
+
+    def turnover(self, compte, annee, mois, nb_mois=3):
+        """
+        Turnover routed sur les ``nb_mois`` mois se terminant au mois donné,
+        total des flux créditeurs et solde moyen, ou (None, None, None)
+        """
+        fin = pd.Timestamp(year=annee, month=mois, day=1)
+        debut = fin - pd.DateOffset(months=nb_mois - 1)
+        lignes = self.lignes_mois(compte, debut, fin)
+        nb_jours = lignes["NB_JOURS"].sum()
+        if nb_jours < 2:
+            return None, None, None
+
+        # La variation d'entrée du premier mois est antérieure à la fenêtre
+        total_flux = (lignes["FLUX_CREDITEUR"].sum() + lignes["FLUX_ENTREE"].sum()
+                      - lignes["FLUX_ENTREE"].iloc[0])
+        moyenne_solde = lignes["SOMME_SOLDE"].sum() / nb_jours
+        if moyenne_solde == 0:
+            return None, None, None
+        return total_flux / moyenne_solde * 100, total_flux, moyenne_solde
+
+    @staticmethod
+    def _moyennes_vides():
+        return pd.DataFrame({
+            "COMPTE": pd.Series(dtype="int64"),
+            "MOIS": pd.Series(dtype="period[M]"),
+            "SOLDE_MOYEN": pd.Series(dtype="float64"),
+        })
@@ -0,0 +1,117 @@
+"""
+Jeux de données partagés entre les sessions Streamlit.
+
+Un fichier importé est lu une seule fois par processus : le DataFrame trié,
+son index par compte et, pour les soldes, le cube mensuel sont regroupés
+dans un objet ``DonneesPartagees`` conservé par ``st.cache_resource`` sous
+l'empreinte du contenu du fichier. Toutes les sessions qui importent le
+même extrait reçoivent ce même objet, sans copie ni désérialisation, là où
+``st.cache_data`` remettait une copie complète à chaque exécution du script.
+
+Les données partagées sont en lecture seule : les analyses travaillent sur
+des tranches de l'index et copient explicitement ce qu'elles modifient.
+Chaque objet tient le registre des sessions qui l'utilisent, ce qui permet
+d'estimer la mémoire économisée par rapport à une copie par session. La
+matrice dense des soldes (voir matrice_dense.py), optionnelle, n'est
+construite qu'à la première demande puis partagée de la même façon.
+
+Pour les mouvements, le cumul des montants créditeurs par compte (voir
+credits_mouvements.py) est calculé au chargement avec l'index.
+
+Le DataFrame peut être compacté avant d'être indexé (voir compaction.py) ;
+le rapport de compaction reste attaché au jeu pour l'affichage. Lorsque les
+colonnes non analysées sont supprimées, l'empreinte du jeu le distingue du
+même fichier chargé en entier.
+"""
+import threading
+import time
+
+from compaction import COLONNES_ANALYSE, compacter
+from credits_mouvements import IndexCredits
+from cube_mensuel import CubeMensuel
+from index_comptes import IndexComptes
+from matrice_dense import MatriceSoldes
+
+# Nombre de fichiers distincts conservés en mémoire, par type de fichier
+MAX_JEUX_PARTAGES = 4
+
+# Une session sans activité depuis ce délai n'est plus comptée comme utilisatrice
+DELAI_SESSION_INACTIVE = 30 * 60
+
+
+def taille_memoire(df):
+    """Taille en octets d'un DataFrame, chaînes de caractères comprises"""
+    if df is None:
+        return 0
+    return int(df.memory_usage(deep=True, index=True).sum())
+
+
+class DonneesPartagees:
+    """DataFrame trié par (COMPTE, date), son index et son cube ou ses crédits cumulés, partagés entre sessions"""
+
+    def __init__(self, df, colonne_date, empreinte, avec_cube=False, agregats=None, compacte=False,
+                 colonnes_utiles=False, avec_credits=False):
+        self.rapport_compaction = None
+        if compacte:
+            colonnes = COLONNES_ANALYSE[colonne_date] if colonnes_utiles else None
+            df, self.rapport_compaction = compacter(df, colonnes)
+            if colonnes is not None:
+                empreinte = f"{empreinte}:{','.join(colonnes)}"
+        self.empreinte = empreinte
+        self.index = IndexComptes(df, colonne_date)
+        # Le DataFrame trié de l'index sert de référence : la version non triée n'est pas conservée
+        self.df = self.index.df
+        self.cube = CubeMensuel(self.index, agregats) if avec_cube else None
+        self.credits = IndexCredits(self.index) if avec_credits and "MNTDEV" in self.df.columns else None
+        self.taille_octets = (
+            taille_memoire(self.df)
+            + taille_memoire(self.cube.df if self.cube is not None else None)
+            + (self.credits.nbytes if self.credits is not None else 0)
+            + sum(a.nbytes for a in (self.index.comptes, self.index.debuts, self.index.fins))
+        )
+        self._matrice = None
+        self._sessions = {}
+        self._verrou = threading.Lock()
+
+    def __len__(self):
+        return len(self.df)
+
+    def matrice(self):
+        """Matrice dense comptes × jours des soldes, construite à la première demande"""
+        with self._verrou:
+            if self._matrice is None:
+                self._matrice = MatriceSoldes(self.index)
+                self.taille_octets += self._matrice.nbytes
+            return self._matrice
+
+    def enregistrer_session(self, id_session):
+        """Note l'utilisation du jeu de données par une session"""
+        if id_session is None:
+            return
+        with self._verrou:
+            self._sessions[id_session] = time.monotonic()
+
+    def sessions_actives(self, delai=DELAI_SESSION_INACTIVE):
+        """Nombre de sessions ayant utilisé le jeu de données pendant le délai"""
+        limite = time.monotonic() - delai
+        with self._verrou:
+            for id_session in [s for s, vu in self._sessions.items() if vu < limite]:
+                del self._sessions[id_session]
+            return len(self._sessions)
+
+    def memoire_economisee(self):
+        """Octets économisés par rapport à une copie du jeu de données par session"""
+        return max(0, self.sessions_actives() - 1) * self.taille_octets
+
+
+def bilan_memoire(jeux):
+    """
+    Bilan mémoire d'une liste de jeux partagés : nombre de jeux, mémoire
+    occupée et mémoire économisée, en octets
+    """
+    jeux = [j for j in jeux if j is not None]
+    return {
+        "NB_JEUX": len(jeux),
+        "MEMOIRE_PARTAGEE": sum(j.taille_octets for j in jeux),
+        "MEMOIRE_ECONOMISEE": sum(j.memoire_economisee() for j in jeux),
+    }
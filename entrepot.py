@@ -0,0 +1,379 @@
+"""
+Entrepôt local des soldes et des mouvements, partitionné par mois.
+
+Plutôt que de réimporter chaque jour tout l'historique, les extraits
+quotidiens sont ajoutés à un entrepôt sur disque (fichiers Parquet, sans
+serveur) :
+
+    <répertoire>/soldes/2024-01.parquet      une partition par mois
+    <répertoire>/mouvements/2024-01.parquet
+    <répertoire>/agregats_soldes.parquet     agrégats mensuels (cube)
+    <répertoire>/manifeste.json              version, dates, historique
+
+L'ajout d'un extrait n'intègre que les dates nouvelles : un solde déjà
+présent pour (COMPTE, DATPOS) est conservé, et les mouvements d'un
+(COMPTE, jour) déjà présent sont ignorés. Seules les partitions des mois
+touchés sont réécrites et seuls les agrégats mensuels des (COMPTE, mois)
+modifiés sont recalculés ; le cube mensuel est ensuite reconstruit à partir
+des agrégats enregistrés, sans reparcourir les soldes journaliers.
+
+Plusieurs processus peuvent partager l'entrepôt (sessions Streamlit,
+entrepot.py, cli.py) : un ajout prend le verrou exclusif du fichier
+``<répertoire>/.verrou`` (``fcntl.flock``) et les lectures le verrou
+partagé, de sorte qu'aucune lecture ne voit un ajout à moitié écrit.
+
+Exemple (intégration de l'extrait du jour) :
+    python entrepot.py --entrepot donnees/entrepot --soldes soldes_du_jour.xlsx \\
+        --mouvements mvt_du_jour.xlsx
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from calculs import lire_mouvements, lire_soldes
+from donnees_partagees import DonneesPartagees
+from portefeuille import agreger_mensuel, numero_mois
+
+try:
+    import fcntl
+except ImportError:  # Windows : verrou limité au processus
+    fcntl = None
+
+REPERTOIRE_ENTREPOT = os.environ.get(
+    "BOA_ENTREPOT_DIR",
+    os.path.join(os.path.expanduser("~"), ".local", "share", "boa_analyse", "entrepot")
+)
+
+SOLDES = "soldes"
+MOUVEMENTS = "mouvements"
+COLONNES_DATE = {SOLDES: "DATPOS", MOUVEMENTS: "DATOPER"}
+FICHIER_AGREGATS = "agregats_soldes.parquet"
+FICHIER_MANIFESTE = "manifeste.json"
+FICHIER_VERROU = ".verrou"
+EXTENSION = ".parquet"
+
+# Nombre d'ajouts conservés dans l'historique du manifeste
+TAILLE_HISTORIQUE = 100
+
+
+def _ecrire_parquet(df, chemin):
+    """Écriture atomique : fichier temporaire puis renommage"""
+    descripteur, chemin_tmp = tempfile.mkstemp(dir=os.path.dirname(chemin), suffix=".tmp")
+    os.close(descripteur)
+    try:
+        df.to_parquet(chemin_tmp, index=False)
+        os.replace(chemin_tmp, chemin)
+    finally:
+        if os.path.exists(chemin_tmp):
+            os.remove(chemin_tmp)
+
+
+def _mois_partition(dates):
+    """Nom de partition (AAAA-MM) de chaque date"""
+    return dates.dt.strftime("%Y-%m")
+
+
+def _cles(table, df):
+    """Clé de déduplication : (COMPTE, DATPOS) pour les soldes, (COMPTE, jour) pour les mouvements"""
+    if table == SOLDES:
+        return pd.MultiIndex.from_arrays([df["COMPTE"], df["DATPOS"]])
+    return pd.MultiIndex.from_arrays([df["COMPTE"], df["DATOPER"].dt.normalize()])
+
+
+def recalculer_flux_entree(agregats):
+    """
+    FLUX_ENTREE de tous les mois à partir des agrégats : variation positive
+    entre le dernier solde du mois précédent du compte et le premier solde
+    du mois, 0 pour le premier mois du compte (définition d'``agreger_mensuel``)
+    """
+    agregats = agregats.sort_values(["COMPTE", "NUM_MOIS"], kind="mergesort").reset_index(drop=True)
+    comptes = agregats["COMPTE"].to_numpy()
+    nouveau_compte = np.r_[True, comptes[1:] != comptes[:-1]] if len(comptes) else np.array([], dtype=bool)
+    precedent = np.r_[np.nan, agregats["DERNIER_SOLDE"].to_numpy(dtype=np.float64)[:-1]][:len(comptes)]
+    variation = agregats["PREMIER_SOLDE"].to_numpy(dtype=np.float64) - precedent
+    variation[nouveau_compte] = 0.0
+    agregats["FLUX_ENTREE"] = np.where(variation > 0, variation, 0.0)
+    return agregats
+
+
+class Entrepot:
+    """Entrepôt Parquet partitionné par mois, alimenté par ajouts successifs"""
+
+    def __init__(self, repertoire=None):
+        self.repertoire = repertoire or REPERTOIRE_ENTREPOT
+        self._verrou = threading.Lock()
+
+    def _chemin(self, *parties):
+        return os.path.join(self.repertoire, *parties)
+
+    @contextmanager
+    def _verrou_fichier(self, exclusif):
+        """
+        Verrou du répertoire partagé entre processus (application, cli.py,
+        entrepot.py) : exclusif pour un ajout, partagé pour une lecture
+        """
+        if fcntl is None or not os.path.isdir(self.repertoire):
+            yield
+            return
+        with open(self._chemin(FICHIER_VERROU), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusif else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    # --- Manifeste ---
+
+    def manifeste(self):
+        """Contenu du manifeste : version, bornes des dates et historique des ajouts"""
+        try:
+            with open(self._chemin(FICHIER_MANIFESTE), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"version": 0, "dates": {}, "lignes": {}, "ajouts": []}
+
+    def _ecrire_manifeste(self, manifeste):
+        descripteur, chemin_tmp = tempfile.mkstemp(dir=self.repertoire, suffix=".tmp")
+        with os.fdopen(descripteur, "w", encoding="utf-8") as f:
+            json.dump(manifeste, f, ensure_ascii=False, indent=1)
+        os.replace(chemin_tmp, self._chemin(FICHIER_MANIFESTE))
+
+    @property
+    def version(self):
+        """Numéro incrémenté à chaque ajout, qui identifie le contenu de l'entrepôt"""
+        return self.manifeste()["version"]
+
+    def empreinte(self):
+        """Identifiant du contenu, utilisable comme empreinte de données partagées"""
+        return f"entrepot:{os.path.abspath(self.repertoire)}:{self.version}"
+
+    def est_vide(self):
+        return not self.partitions(SOLDES)
+
+    # --- Lecture ---
+    def partitions(self, table):
+        """Mois (AAAA-MM) présents dans une table, triés"""
+        repertoire = self._chemin(table)
+        if not os.path.isdir(repertoire):
+            return []
+        return sorted(nom[:-len(EXTENSION)] for nom in os.listdir(repertoire) if nom.endswith(EXTENSION))
+
+    def _lire_partition(self, table, mois):
+        chemin = self._chemin(table, f"{mois}{EXTENSION}")
+        return pd.read_parquet(chemin) if os.path.exists(chemin) else None
+
+    def lire(self, table, debut=None, fin=None):
+        """Lignes d'une table dont le mois est compris entre début et fin (AAAA-MM) inclus"""
+        mois = [m for m in self.partitions(table)
+                if (debut is None or m >= debut) and (fin is None or m <= fin)]
+        morceaux = [self._lire_partition(table, m) for m in mois]
+        morceaux = [m for m in morceaux if m is not None and not m.empty]
+        if not morceaux:
+            return None
+        return pd.concat(morceaux, ignore_index=True)
+
+    def lire_soldes(self, debut=None, fin=None):
+        return self.lire(SOLDES, debut, fin)
+
+    def lire_mouvements(self, debut=None, fin=None):
+        return self.lire(MOUVEMENTS, debut, fin)
+
+    def lire_soldes_et_mouvements(self):
+        """Soldes et mouvements lus ensemble, sans ajout concurrent entre les deux lectures"""
+        with self._verrou_fichier(exclusif=False):
+            return self.lire_soldes(), self.lire_mouvements()
+
+    def lire_agregats(self):
+        """Agrégats mensuels des soldes (colonnes d'``agreger_mensuel``), None si l'entrepôt est vide"""
+        chemin = self._chemin(FICHIER_AGREGATS)
+        return pd.read_parquet(chemin) if os.path.exists(chemin) else None
+
+    def charger(self, compacte=False, colonnes_utiles=False):
+        """
+        Soldes et mouvements de l'entrepôt en ``DonneesPartagees`` (None pour
+        une table vide) ; le cube mensuel est construit à partir des agrégats
+        enregistrés. ``compacte`` et ``colonnes_utiles`` : voir
+        ``DonneesPartagees``
+        """
+        # Lecture sous verrou partagé : aucun ajout ne peut réécrire les partitions pendant la lecture
+        with self._verrou_fichier(exclusif=False):
+            empreinte = self.empreinte()
+            df_solde, df_mvt = self.lire_soldes(), self.lire_mouvements()
+            agregats = self.lire_agregats() if df_solde is not None else None
+        donnees_solde = donnees_mvt = None
+        if df_solde is not None:
+            donnees_solde = DonneesPartagees(df_solde, "DATPOS", f"{empreinte}:{SOLDES}", avec_cube=True,
+                                             agregats=agregats, compacte=compacte,
+                                             colonnes_utiles=colonnes_utiles)
+        if df_mvt is not None:
+            donnees_mvt = DonneesPartagees(df_mvt, "DATOPER", f"{empreinte}:{MOUVEMENTS}", compacte=compacte,
+                                           colonnes_utiles=colonnes_utiles, avec_credits=True)
+        return donnees_solde, donnees_mvt
+
+    # --- Ajout d'extraits ---
+    def _ajouter(self, table, df):
+        """
+        Ajoute à une table les lignes dont la clé (voir ``_cles``) est
+        absente, mois par mois. Renvoie les lignes effectivement ajoutées.
+        """
+        colonne_date = COLONNES_DATE[table]
+        df = df[df["COMPTE"].notna() & df[colonne_date].notna()]
+        if df.empty:
+            return df
+        os.makedirs(self._chemin(table), exist_ok=True)
+
+        ajoutees = []
+        for mois, nouvelles in df.groupby(_mois_partition(df[colonne_date]), sort=True):
+            existantes = self._lire_partition(table, mois)
+            if existantes is not None and not existantes.empty:
+                nouvelles = nouvelles[~_cles(table, nouvelles).isin(_cles(table, existantes))]
+                if nouvelles.empty:
+                    continue
+                partition = pd.concat([existantes, nouvelles], ignore_index=True)
+            else:
+                partition = nouvelles
+            partition = partition.sort_values(["COMPTE", colonne_date], kind="mergesort")
+            _ecrire_parquet(partition, self._chemin(table, f"{mois}{EXTENSION}"))
+            ajoutees.append(nouvelles)
+
+        if not ajoutees:
+            return df.iloc[:0]
+        return pd.concat(ajoutees, ignore_index=True)
+
+    def _mettre_a_jour_agregats(self, soldes_ajoutes):
+        """Recalcule les agrégats des (COMPTE, mois) qui ont reçu des soldes"""
+        agregats = self.lire_agregats()
+        touches = pd.DataFrame({
+            "COMPTE": soldes_ajoutes["COMPTE"].to_numpy(),
+            "NUM_MOIS": numero_mois(soldes_ajoutes["DATPOS"]),
+        }).drop_duplicates()
+
+        # Soldes complets des groupes touchés, relus dans leurs partitions
+        morceaux = []
+        for num_mois, groupe in touches.groupby("NUM_MOIS"):
+            partition = self._lire_partition(SOLDES, f"{num_mois // 12:04d}-{num_mois % 12 + 1:02d}")
+            morceaux.append(partition[partition["COMPTE"].isin(groupe["COMPTE"])])
+        nouveaux = agreger_mensuel(pd.concat(morceaux, ignore_index=True))
+
+        if agregats is not None and not agregats.empty:
+            cles_touchees = pd.MultiIndex.from_frame(touches[["COMPTE", "NUM_MOIS"]])
+            conserves = agregats[~pd.MultiIndex.from_frame(agregats[["COMPTE", "NUM_MOIS"]]).isin(cles_touchees)]
+            agregats = pd.concat([conserves, nouveaux], ignore_index=True)
+        else:
+            agregats = nouveaux
+        # La variation d'entrée dépend du mois précédent du compte, éventuellement modifié
+        agregats = recalculer_flux_entree(agregats)
+        _ecrire_parquet(agregats, self._chemin(FICHIER_AGREGATS))
+        return len(nouveaux)
+
+    def ajouter_extrait(self, df_solde=None, df_mvt=None, libelle=None):
+        """
+        Intègre un extrait de soldes et/ou de mouvements et renvoie le bilan
+        de l'ajout (lignes lues et ajoutées, mois modifiés, nouvelle version)
+        """
+        os.makedirs(self.repertoire, exist_ok=True)
+        with self._verrou, self._verrou_fichier(exclusif=True):
+            manifeste = self.manifeste()
+            bilan = {
+                "SOLDES_LUS": 0, "SOLDES_AJOUTES": 0,
+                "MOUVEMENTS_LUS": 0, "MOUVEMENTS_AJOUTES": 0,
+                "MOIS_MODIFIES": [], "AGREGATS_RECALCULES": 0,
+            }
+            mois_modifies = set()
+
+            if df_solde is not None:
+                # Un extrait peut répéter un solde : la dernière ligne l'emporte
+                df_solde = df_solde.drop_duplicates(["COMPTE", "DATPOS"], keep="last")
+                ajoutes = self._ajouter(SOLDES, df_solde)
+                bilan["SOLDES_LUS"], bilan["SOLDES_AJOUTES"] = len(df_solde), len(ajoutes)
+                if not ajoutes.empty:
+                    mois_modifies.update(_mois_partition(ajoutes["DATPOS"]).unique())
+                    bilan["AGREGATS_RECALCULES"] = self._mettre_a_jour_agregats(ajoutes)
+
+            if df_mvt is not None:
+                # Les mouvements n'ont pas de clé unique : un (COMPTE, jour) déjà présent est complet
+                ajoutes = self._ajouter(MOUVEMENTS, df_mvt)
+                bilan["MOUVEMENTS_LUS"], bilan["MOUVEMENTS_AJOUTES"] = len(df_mvt), len(ajoutes)
+                if not ajoutes.empty:
+                    mois_modifies.update(_mois_partition(ajoutes["DATOPER"]).unique())
+
+            bilan["MOIS_MODIFIES"] = sorted(mois_modifies)
+            if bilan["SOLDES_AJOUTES"] or bilan["MOUVEMENTS_AJOUTES"]:
+                manifeste["version"] += 1
+                for table, colonne in COLONNES_DATE.items():
+                    manifeste["dates"][table] = self._bornes(table, colonne, manifeste["dates"].get(table))
+                    manifeste["lignes"][table] = manifeste["lignes"].get(table, 0) + bilan[
+                        "SOLDES_AJOUTES" if table == SOLDES else "MOUVEMENTS_AJOUTES"]
+                manifeste["ajouts"] = (manifeste["ajouts"] + [{
+                    "date": datetime.now().isoformat(timespec="seconds"),
+                    "libelle": libelle,
+                    "soldes": bilan["SOLDES_AJOUTES"],
+                    "mouvements": bilan["MOUVEMENTS_AJOUTES"],
+                    "mois": bilan["MOIS_MODIFIES"],
+                }])[-TAILLE_HISTORIQUE:]
+                self._ecrire_manifeste(manifeste)
+            bilan["VERSION"] = manifeste["version"]
+            return bilan
+
+    def _bornes(self, table, colonne, bornes):
+        """Première et dernière date d'une table, lues dans sa première et sa dernière partition"""
+        partitions = self.partitions(table)
+        if not partitions:
+            return bornes
+        premiere = self._lire_partition(table, partitions[0])[colonne].min()
+        derniere = self._lire_partition(table, partitions[-1])[colonne].max()
+        return [premiere.isoformat(), derniere.isoformat()]
+
+    def statistiques(self):
+        """Version, nombre de lignes, bornes des dates et taille sur disque de l'entrepôt"""
+        manifeste = self.manifeste()
+        taille = 0
+        for racine, _, fichiers in os.walk(self.repertoire):
+            taille += sum(os.path.getsize(os.path.join(racine, f)) for f in fichiers)
+        return {
+            "VERSION": manifeste["version"],
+            "LIGNES_SOLDES": manifeste["lignes"].get(SOLDES, 0),
+            "LIGNES_MOUVEMENTS": manifeste["lignes"].get(MOUVEMENTS, 0),
+            "DATES_SOLDES": manifeste["dates"].get(SOLDES),
+            "DATES_MOUVEMENTS": manifeste["dates"].get(MOUVEMENTS),
+            "NB_MOIS": len(self.partitions(SOLDES)),
+            "TAILLE_OCTETS": taille,
+            "DERNIER_AJOUT": manifeste["ajouts"][-1] if manifeste["ajouts"] else None,
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ajoute un extrait de soldes et/ou de mouvements à l'entrepôt local")
+    parser.add_argument("--entrepot", default=REPERTOIRE_ENTREPOT, help="Répertoire de l'entrepôt")
+    parser.add_argument("--soldes", help="Extrait des soldes journaliers (Excel, CSV ou Parquet)")
+    parser.add_argument("--mouvements", help="Extrait des mouvements (Excel, CSV ou Parquet)")
+    args = parser.parse_args(argv)
+    if not args.soldes and not args.mouvements:
+        parser.error("indiquer --soldes et/ou --mouvements")
+
+    try:
+        df_solde = lire_soldes(args.soldes) if args.soldes else None
+        df_mvt = lire_mouvements(args.mouvements) if args.mouvements else None
+    except Exception as e:
+        print(f"Erreur de lecture : {e}", file=sys.stderr)
+        return 1
+
+    libelle = ", ".join(os.path.basename(c) for c in (args.soldes, args.mouvements) if c)
+    bilan = Entrepot(args.entrepot).ajouter_extrait(df_solde, df_mvt, libelle=libelle)
+    print(f"{bilan['SOLDES_AJOUTES']}/{bilan['SOLDES_LUS']} soldes et "
+          f"{bilan['MOUVEMENTS_AJOUTES']}/{bilan['MOUVEMENTS_LUS']} mouvements ajoutés "
+          f"({', '.join(bilan['MOIS_MODIFIES']) or 'aucun mois modifié'}) - version {bilan['VERSION']}",
+          file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
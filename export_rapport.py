@@ -0,0 +1,280 @@
+"""
+Rapport multi-comptes exporté en Excel ou en Parquet, à mémoire bornée.
+
+Le rapport d'un mois comprend quatre tables, pour les comptes choisis ou
+pour tout le portefeuille :
+
+- SYNTHESE : une ligne par compte, avec les indicateurs de
+  ``calculer_metriques_compte`` (taux d'utilisation, turnover routed et sur
+  les mouvements, durée moyenne de découvert, Credit Line Overdraft) ;
+- USAGE : soldes journaliers du mois et taux d'utilisation (``df_usage``) ;
+- TURNOVER : soldes des 3 mois, variations et flux créditeurs
+  (``df_turnover``) ;
+- SOLDES_MENSUELS : soldes moyens des 12 mois jusqu'au mois analysé, écart
+  au pic et Credit Line Overdraft (``solde_moyen_complet``).
+
+Les comptes sont traités par lots de ``TAILLE_LOT_EXPORT`` comptes : les
+tables d'un lot sont calculées en une passe vectorisée sur ses lignes de
+l'index des soldes puis écrites aussitôt. La mémoire dépend de la taille
+d'un lot, pas du nombre de comptes exportés :
+
+- Excel : xlsxwriter en mode ``constant_memory``, chaque ligne part sur
+  disque dès que la suivante commence ; une table qui dépasse la limite
+  d'Excel continue sur une nouvelle feuille (« USAGE (2) ») ;
+- Parquet : un fichier par table écrit lot par lot (un groupe de lignes
+  par lot) avec ``pyarrow.parquet.ParquetWriter``, les fichiers étant
+  réunis dans une archive zip.
+"""
+import os
+import tempfile
+import zipfile
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from credits_mouvements import turnover_mouvements
+from portefeuille import analyser_duree_decouvert_portefeuille
+
+# Nombre de comptes calculés et écrits ensemble
+TAILLE_LOT_EXPORT = 500
+
+# Nombre maximal de lignes d'une feuille Excel, en-tête compris
+LIGNES_MAX_FEUILLE = 1_048_576
+
+TABLES_RAPPORT = ["SYNTHESE", "USAGE", "TURNOVER", "SOLDES_MENSUELS"]
+
+FORMATS_RAPPORT = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "zip": "application/zip",
+}
+
+
+# --- Tables d'un lot de comptes ---
+def _usage(lignes, annee, mois, limite_credit):
+    """Soldes du mois et taux d'utilisation (``calculer_usage_rate_mensuel``)"""
+    debut = pd.Timestamp(year=annee, month=mois, day=1)
+    dates = lignes["DATPOS"]
+    usage = lignes[(dates >= debut) & (dates < debut + pd.offsets.MonthBegin(1))].copy()
+    usage["TAUX_USAGE"] = usage["SOLDE"] / limite_credit * 100 if limite_credit else np.nan
+    return usage
+
+
+def _turnover(lignes, annee, mois):
+    """Soldes des 3 mois, variations et flux créditeurs (``calculer_turnover_routed_depuis_solde``)"""
+    date_ref = pd.Timestamp(year=annee, month=mois, day=1)
+    debut = date_ref - pd.DateOffset(months=2)
+    fin = date_ref + pd.DateOffset(months=1) - pd.Timedelta(days=1)
+    dates = lignes["DATPOS"]
+    turnover = lignes[(dates >= debut) & (dates <= fin)].copy()
+    turnover["VARIATION"] = turnover.groupby("COMPTE")["SOLDE"].diff()
+    turnover["FLUX_CREDITEUR"] = turnover["VARIATION"].where(turnover["VARIATION"] > 0, 0.0)
+    # Sans turnover : moins de 2 soldes ou solde moyen nul
+    soldes = turnover.groupby("COMPTE")["SOLDE"]
+    return turnover[(soldes.transform("size") >= 2) & (soldes.transform("mean") != 0)]
+
+
+def _soldes_mensuels(lignes, annee, mois):
+    """Soldes moyens des 12 mois jusqu'au mois analysé et Credit Line Overdraft (``solde_moyen_complet``)"""
+    date_ref = pd.Timestamp(year=annee, month=mois, day=1)
+    dates = lignes["DATPOS"]
+    periode = lignes[(dates >= date_ref - pd.DateOffset(months=11)) & (dates <= date_ref + pd.offsets.MonthEnd(0))]
+    soldes = (
+        periode.groupby(["COMPTE", periode["DATPOS"].dt.to_period("M").rename("MOIS")])["SOLDE"]
+        .mean()
+        .rename("SOLDE_MOYEN")
+        .reset_index()
+    )
+    par_compte = soldes.groupby("COMPTE")["SOLDE_MOYEN"]
+    soldes["SOLDE_MAXI"] = par_compte.transform("max")
+    soldes["ECART_AU_PIC"] = soldes["SOLDE_MAXI"] - soldes["SOLDE_MOYEN"]
+    soldes["SOLDE_PRECEDENT"] = par_compte.shift(1)
+    soldes["CREDIT_LINE_OVERDRAFT"] = (soldes["SOLDE_MOYEN"] > soldes["SOLDE_PRECEDENT"]).astype(int)
+    return soldes
+
+
+def tables_lot(lignes, comptes, annee, mois, limite_credit, seuil_decouvert, index_mvt=None, credits=None):
+    """
+    Tables du rapport (dictionnaire ``TABLES_RAPPORT``) pour un lot de
+    comptes, à partir de leurs lignes de soldes triées par (COMPTE, DATPOS)
+    """
+    usage = _usage(lignes, annee, mois, limite_credit)
+    turnover = _turnover(lignes, annee, mois)
+    soldes_mensuels = _soldes_mensuels(lignes, annee, mois)
+
+    synthese = pd.DataFrame({"COMPTE": comptes, "ANNEE": annee, "MOIS": mois})
+    synthese = synthese.set_index("COMPTE")
+    synthese["NB_LIGNES_SOLDE"] = usage.groupby("COMPTE").size().reindex(synthese.index, fill_value=0)
+    if index_mvt is not None:
+        debut_mois = pd.Timestamp(year=annee, month=mois, day=1)
+        fin_mois = debut_mois + pd.offsets.MonthBegin(1) - pd.Timedelta(1, "ns")
+        plages = [index_mvt.plage_periode(compte, debut_mois, fin_mois) for compte in comptes]
+        synthese["NB_LIGNES_MVT"] = [f - d for d, f in plages]
+    else:
+        synthese["NB_LIGNES_MVT"] = 0
+    agregats_usage = usage.groupby("COMPTE").agg(
+        TAUX_USAGE_MOYEN=("TAUX_USAGE", "mean"), TAUX_USAGE_MAX=("TAUX_USAGE", "max"), SOLDE_MOYEN=("SOLDE", "mean")
+    )
+    agregats_turnover = turnover.groupby("COMPTE").agg(
+        TOTAL_FLUX_CREDITEUR=("FLUX_CREDITEUR", "sum"), MOYENNE_SOLDE_3M=("SOLDE", "mean")
+    )
+    agregats_turnover.insert(
+        0, "TURNOVER_ROUTED", agregats_turnover["TOTAL_FLUX_CREDITEUR"] / agregats_turnover["MOYENNE_SOLDE_3M"] * 100
+    )
+    synthese = synthese.join(agregats_usage).join(agregats_turnover)
+    if credits is not None:
+        mouvements = [
+            turnover_mouvements(credits, compte, annee, mois, moyenne)
+            for compte, moyenne in zip(comptes, synthese["MOYENNE_SOLDE_3M"])
+        ]
+        synthese = synthese.join(
+            pd.DataFrame(mouvements, index=synthese.index).astype({"TURNOVER_MOUVEMENTS": np.float64})
+        )
+    durees = analyser_duree_decouvert_portefeuille(lignes, pd.Timestamp(year=annee, month=mois, day=1),
+                                                   seuil_decouvert)
+    synthese["DUREE_MOYENNE_DECOUVERT"] = (
+        durees.set_index("COMPTE")["DUREE_MOYENNE_DECOUVERT"].reindex(synthese.index, fill_value=0.0)
+    )
+    synthese["NB_CREDIT_LINE_OVERDRAFT"] = (
+        soldes_mensuels.groupby("COMPTE")["CREDIT_LINE_OVERDRAFT"].sum().reindex(synthese.index, fill_value=0)
+    )
+    return {
+        "SYNTHESE": synthese.reset_index(),
+        "USAGE": usage.reset_index(drop=True),
+        "TURNOVER": turnover.reset_index(drop=True),
+        "SOLDES_MENSUELS": soldes_mensuels,
+    }
+
+
+def lots_comptes(index_solde, comptes=None, taille_lot=TAILLE_LOT_EXPORT):
+    """Lots de comptes de l'index (tous les comptes par défaut) avec leurs lignes de soldes"""
+    positions = np.arange(len(index_solde.comptes))
+    if comptes is not None:
+        comptes = np.unique(np.asarray(comptes))
+        positions = np.searchsorted(index_solde.comptes, comptes)
+        trouves = positions < len(index_solde.comptes)
+        positions = positions[trouves][index_solde.comptes[positions[trouves]] == comptes[trouves]]
+    for debut in range(0, len(positions), taille_lot):
+        lot = positions[debut:debut + taille_lot]
+        lignes = np.concatenate(
+            [np.arange(index_solde.debuts[i], index_solde.fins[i]) for i in lot] or [np.array([], dtype=np.int64)]
+        )
+        yield index_solde.comptes[lot], index_solde.df.iloc[lignes]
+
+
+# --- Écriture en flux ---
+def _valeurs(df):
+    """Colonnes en listes de valeurs Python, None pour les valeurs manquantes"""
+    colonnes = []
+    for nom in df.columns:
+        serie = df[nom]
+        if isinstance(serie.dtype, pd.PeriodDtype):
+            serie = serie.astype(str)
+        serie = serie.astype(object)
+        colonnes.append(serie.where(serie.notna(), None).tolist())
+    return colonnes
+
+
+class _TableExcel:
+    """Table écrite ligne à ligne, sur une feuille puis ses suites au-delà de ``LIGNES_MAX_FEUILLE``"""
+
+    def __init__(self, classeur, nom):
+        self.classeur = classeur
+        self.nom = nom
+        self.feuille = None
+        self.nb_feuilles = 0
+        self.ligne = 0
+        self.colonnes = None
+
+    def _nouvelle_feuille(self):
+        self.nb_feuilles += 1
+        self.feuille = self.classeur.add_worksheet(
+            self.nom if self.nb_feuilles == 1 else f"{self.nom} ({self.nb_feuilles})"
+        )
+        self.feuille.write_row(0, 0, self.colonnes)
+        self.feuille.freeze_panes(1, 0)
+        self.ligne = 1
+
+    def ecrire(self, df):
+        if self.colonnes is None:
+            self.colonnes = list(df.columns)
+            self._nouvelle_feuille()
+        for valeurs in zip(*_valeurs(df[self.colonnes])):
+            if self.ligne == LIGNES_MAX_FEUILLE:
+                self._nouvelle_feuille()
+            self.feuille.write_row(self.ligne, 0, valeurs)
+            self.ligne += 1
+
+
+class _TableParquet:
+    """Table écrite lot par lot dans un fichier Parquet, un groupe de lignes par lot"""
+
+    def __init__(self, chemin):
+        self.chemin = chemin
+        self.schema = None
+        self.ecrivain = None
+
+    def ecrire(self, df):
+        df = df.copy()
+        for nom in df.columns:
+            if isinstance(df[nom].dtype, pd.PeriodDtype):
+                df[nom] = df[nom].astype(str)
+        if self.ecrivain is None:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            self.schema = table.schema
+            self.ecrivain = pq.ParquetWriter(self.chemin, self.schema)
+        else:
+            table = pa.Table.from_pandas(df[self.schema.names], schema=self.schema, preserve_index=False)
+        self.ecrivain.write_table(table)
+
+    def fermer(self):
+        if self.ecrivain is not None:
+            self.ecrivain.close()
+
+
+def exporter_rapport(chemin, index_solde, annee, mois, limite_credit, seuil_decouvert, comptes=None,
+                     index_mvt=None, credits=None, format_export="xlsx", taille_lot=TAILLE_LOT_EXPORT,
+                     progression=None):
+    """
+    Écrit le rapport des comptes demandés (tous par défaut) dans ``chemin`` :
+    classeur Excel (``xlsx``) ou archive zip de fichiers Parquet (``zip``).
+    ``progression`` reçoit la part des comptes traités après chaque lot.
+    Renvoie le nombre de comptes exportés.
+    """
+    nb_total = len(index_solde.comptes) if comptes is None else len(set(comptes))
+    nb_comptes = 0
+
+    def ecrire_lots(tables):
+        nonlocal nb_comptes
+        for comptes_lot, lignes in lots_comptes(index_solde, comptes, taille_lot):
+            resultat = tables_lot(lignes, comptes_lot, annee, mois, limite_credit, seuil_decouvert,
+                                  index_mvt=index_mvt, credits=credits)
+            for nom in TABLES_RAPPORT:
+                tables[nom].ecrire(resultat[nom])
+            nb_comptes += len(comptes_lot)
+            if progression is not None:
+                progression(min(1.0, nb_comptes / nb_total) if nb_total else 1.0)
+
+    if format_export == "xlsx":
+        import xlsxwriter
+
+        classeur = xlsxwriter.Workbook(chemin, {"constant_memory": True, "default_date_format": "dd/mm/yyyy"})
+        try:
+            ecrire_lots({nom: _TableExcel(classeur, nom) for nom in TABLES_RAPPORT})
+        finally:
+            classeur.close()
+    else:
+        with tempfile.TemporaryDirectory() as repertoire:
+            tables = {nom: _TableParquet(os.path.join(repertoire, f"{nom.lower()}.parquet"))
+                      for nom in TABLES_RAPPORT}
+            try:
+                ecrire_lots(tables)
+            finally:
+                for table in tables.values():
+                    table.fermer()
+            with zipfile.ZipFile(chemin, "w", zipfile.ZIP_STORED) as archive:
+                for table in tables.values():
+                    if os.path.exists(table.chemin):
+                        archive.write(table.chemin, os.path.basename(table.chemin))
+    return nb_comptes
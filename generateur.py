@@ -0,0 +1,143 @@
+"""
+Générateur de données synthétiques aux schémas des fichiers BOA.
+
+Produit des soldes journaliers (``types_solde`` : COMPTE, SOLDE, DATPOS) et
+des mouvements (``types_mvt`` + DATOPER, DATVAL) pour un nombre de comptes
+et une période configurables, afin de mesurer le comportement de
+l'application aux volumes réels (voir benchmark.py). La génération est
+vectorisée et reproductible (graine fixe).
+
+Exemple :
+    python generateur.py --comptes 10000 --debut 2023-01-01 --fin 2024-12-31 \\
+        --mouvements 500000 --sortie donnees_10k
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from calculs import dates_mvt, types_mvt, types_solde
+
+# Nombre maximal de lignes d'une feuille Excel, en-tête compris
+LIGNES_MAX_EXCEL = 1_048_576
+
+PREMIER_COMPTE = 10_000_000
+TAILLE_BLOC_COMPTES = 10_000
+LIBELLES = np.array(["VIREMENT RECU", "VIREMENT EMIS", "CHEQUE", "RETRAIT DAB", "FRAIS", "VERSEMENT"])
+NATURES = np.array(["VIR", "CHQ", "RET", "FRA", "VER"])
+
+
+def dates_ouvrees(debut, fin):
+    """Jours ouvrés (lundi à vendredi) entre début et fin inclus"""
+    dates = pd.date_range(debut, fin, freq="D")
+    return dates[dates.dayofweek < 5]
+
+
+def generer_soldes(nb_comptes, debut, fin, graine=0, taux_decouvert=0.2, taille_bloc=TAILLE_BLOC_COMPTES):
+    """
+    Soldes journaliers de ``nb_comptes`` comptes sur les jours ouvrés de la
+    période : marche aléatoire par compte, une part des comptes démarrant à
+    découvert. Les comptes sont générés par blocs pour borner la mémoire
+    intermédiaire.
+    """
+    rng = np.random.default_rng(graine)
+    dates = dates_ouvrees(debut, fin).to_numpy()
+    nb_jours = len(dates)
+
+    blocs = []
+    for premier in range(0, nb_comptes, taille_bloc):
+        n = min(taille_bloc, nb_comptes - premier)
+        comptes = PREMIER_COMPTE + premier + np.arange(n, dtype=np.int64)
+        depart = rng.integers(0, 5_000_000, n)
+        a_decouvert = rng.random(n) < taux_decouvert
+        depart[a_decouvert] = -rng.integers(0, 2_000_000, a_decouvert.sum())
+        amplitude = rng.integers(10_000, 200_000, n)
+
+        variations = rng.standard_normal((n, nb_jours)) * amplitude[:, None]
+        soldes = depart[:, None] + np.cumsum(variations, axis=1)
+        blocs.append(pd.DataFrame({
+            "COMPTE": np.repeat(comptes, nb_jours),
+            "SOLDE": soldes.ravel().astype(np.int64),
+            "DATPOS": np.tile(dates, n),
+        }))
+
+    if not blocs:
+        return pd.DataFrame({"COMPTE": [], "SOLDE": [], "DATPOS": pd.to_datetime([])}).astype(types_solde)
+    return pd.concat(blocs, ignore_index=True).astype(types_solde)
+
+
+def generer_mouvements(nb_comptes, nb_mouvements, debut, fin, graine=0):
+    """Mouvements répartis aléatoirement entre les comptes et les jours ouvrés de la période"""
+    rng = np.random.default_rng(graine + 1)
+    dates = dates_ouvrees(debut, fin).to_numpy()
+    date_oper = rng.choice(dates, nb_mouvements)
+    montants = rng.integers(1_000, 2_000_000, nb_mouvements)
+    sens = np.where(rng.random(nb_mouvements) < 0.5, 1, -1)
+
+    df = pd.DataFrame({
+        "COMPTE": PREMIER_COMPTE + rng.integers(0, nb_comptes, nb_mouvements),
+        "MNTDEV": montants * sens,
+        "LIBELLE": rng.choice(LIBELLES, nb_mouvements),
+        "CODOPSC": rng.choice(np.array(["A01", "A02", "B10"]), nb_mouvements),
+        "EXPL": "BOA",
+        "NATOP": rng.choice(NATURES, nb_mouvements),
+        "REFREL": np.char.add("REL", rng.integers(0, 10_000, nb_mouvements).astype(str)),
+        "NOOPER": np.char.add("OP", np.arange(nb_mouvements).astype(str)),
+        "DATHGEN": rng.integers(0, 86_400, nb_mouvements).astype(np.float64),
+        "NOREF": rng.integers(0, 1_000_000, nb_mouvements).astype(np.float64),
+        "DATECH": np.nan,
+        "XCASH": 0.0,
+        "DATOPER": date_oper,
+        "DATVAL": date_oper + rng.integers(0, 3, nb_mouvements).astype("timedelta64[D]"),
+    })
+    return df.astype(types_mvt).sort_values(dates_mvt, kind="mergesort").reset_index(drop=True)
+
+
+def ecrire(df, chemin):
+    """Écrit un jeu généré en Excel (.xlsx), en Parquet (.parquet) ou en CSV (autre extension)"""
+    extension = os.path.splitext(chemin)[1].lower()
+    if extension == ".xlsx":
+        if len(df) >= LIGNES_MAX_EXCEL:
+            raise ValueError(
+                f"{len(df)} lignes dépassent la capacité d'une feuille Excel ({LIGNES_MAX_EXCEL - 1})"
+            )
+        df.to_excel(chemin, index=False)
+    elif extension == ".parquet":
+        df.to_parquet(chemin, index=False)
+    else:
+        df.to_csv(chemin, index=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Génère des fichiers de soldes et de mouvements synthétiques")
+    parser.add_argument("--comptes", type=int, default=10_000, help="Nombre de comptes")
+    parser.add_argument("--debut", default="2024-01-01", help="Première date (AAAA-MM-JJ)")
+    parser.add_argument("--fin", default="2024-12-31", help="Dernière date (AAAA-MM-JJ)")
+    parser.add_argument("--mouvements", type=int, default=0, help="Nombre de mouvements (aucun par défaut)")
+    parser.add_argument("--format", choices=["xlsx", "parquet", "csv"], default="xlsx", help="Format des fichiers")
+    parser.add_argument("--graine", type=int, default=0, help="Graine du générateur aléatoire")
+    parser.add_argument("--sortie", required=True, help="Répertoire de sortie")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.sortie, exist_ok=True)
+    try:
+        df_solde = generer_soldes(args.comptes, args.debut, args.fin, graine=args.graine)
+        chemin = os.path.join(args.sortie, f"soldes.{args.format}")
+        ecrire(df_solde, chemin)
+        print(f"{len(df_solde)} soldes écrits dans {chemin}", file=sys.stderr)
+
+        if args.mouvements:
+            df_mvt = generer_mouvements(args.comptes, args.mouvements, args.debut, args.fin, graine=args.graine)
+            chemin = os.path.join(args.sortie, f"mouvements.{args.format}")
+            ecrire(df_mvt, chemin)
+            print(f"{len(df_mvt)} mouvements écrits dans {chemin}", file=sys.stderr)
+    except ValueError as e:
+        print(f"Erreur : {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+"""
+Graphiques allégés pour les longues séries journalières.
+
+Au-delà de ``SEUIL_WEBGL`` points, une série est réduite avant d'être
+envoyée au navigateur et tracée en WebGL (Scattergl) plutôt qu'en SVG :
+
+- ``indices_lttb`` : Largest-Triangle-Three-Buckets, qui garde dans chaque
+  tranche le point formant le plus grand triangle avec ses voisins et
+  conserve ainsi l'allure de la courbe ;
+- ``indices_min_max`` : minimum et maximum de chaque tranche, qui conserve
+  les pics (utilisé pour les barres).
+
+Les points retenus sont des points réels de la série, jamais des valeurs
+interpolées. Sur une plage plus courte (zoom), la série repasse sous le
+seuil et retrouve sa pleine résolution.
+"""
+import numpy as np
+import plotly.express as px
+
+# Nombre de points au-delà duquel une série est réduite et tracée en WebGL
+SEUIL_WEBGL = 5_000
+# Nombre de points conservés après réduction
+NB_POINTS_REDUITS = 2_000
+
+
+def _en_nombres(valeurs):
+    """Valeurs numériques (dates converties en nanosecondes) en float64"""
+    valeurs = np.asarray(valeurs)
+    if np.issubdtype(valeurs.dtype, np.datetime64):
+        valeurs = valeurs.astype("datetime64[ns]").astype(np.int64)
+    return valeurs.astype(np.float64)
+
+
+def indices_lttb(x, y, nb_points):
+    """Indices des points retenus par l'algorithme LTTB, premier et dernier compris"""
+    n = len(y)
+    if nb_points >= n or nb_points < 3:
+        return np.arange(n)
+    x, y = _en_nombres(x), _en_nombres(y)
+
+    # Tranches de taille égale entre le premier et le dernier point
+    pas = (n - 2) / (nb_points - 2)
+    bornes = (np.arange(nb_points - 1) * pas).astype(np.int64) + 1
+    bornes[-1] = n - 1
+
+    indices = np.empty(nb_points, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    a = 0
+    for i in range(nb_points - 2):
+        debut, fin = bornes[i], bornes[i + 1]
+        # Point moyen de la tranche suivante (le dernier point pour la dernière tranche)
+        debut_suivant, fin_suivant = fin, bornes[i + 2] if i + 2 < len(bornes) else n
+        x_moyen = x[debut_suivant:fin_suivant].mean()
+        y_moyen = y[debut_suivant:fin_suivant].mean()
+
+        aires = np.abs(
+            (x[a] - x_moyen) * (y[debut:fin] - y[a])
+            - (x[a] - x[debut:fin]) * (y_moyen - y[a])
+        )
+        a = debut + int(np.argmax(aires))
+        indices[i + 1] = a
+    return indices
+
+
+def indices_min_max(y, nb_tranches):
+    """Indices du minimum et du maximum de chaque tranche, dans l'ordre de la série"""
+    n = len(y)
+    if 2 * nb_tranches >= n or nb_tranches < 1:
+        return np.arange(n)
+    y = _en_nombres(y)
+    bornes = np.linspace(0, n, nb_tranches + 1).astype(np.int64)
+    tranches = np.repeat(np.arange(nb_tranches), np.diff(bornes))
+    # Tri par tranche puis par valeur : le minimum ouvre chaque tranche, le maximum la ferme
+    ordre = np.lexsort((y, tranches))
+    return np.unique(np.concatenate([ordre[bornes[:-1]], ordre[bornes[1:] - 1]]))
+
+
+def reduire_serie(df, x, y, nb_points=NB_POINTS_REDUITS, methode="lttb"):
+    """Lignes de df retenues pour tracer y en fonction de x (df trié par x)"""
+    if len(df) <= nb_points:
+        return df
+    if methode == "lttb":
+        indices = indices_lttb(df[x].to_numpy(), df[y].to_numpy(), nb_points)
+    else:
+        indices = indices_min_max(df[y].to_numpy(), nb_points // 2)
+    return df.iloc[indices]
+
+
+def figure_serie(df, x, y, type_graphique="ligne", seuil=SEUIL_WEBGL, nb_points=NB_POINTS_REDUITS, **options):
+    """
+    Figure Plotly Express (``px.line`` ou ``px.bar``) d'une série ; au-delà
+    du seuil, la série est réduite (LTTB pour les lignes, min/max pour les
+    barres) et les lignes sont tracées en WebGL. Le titre indique alors le
+    nombre de points affichés.
+    """
+    reduite = len(df) > seuil
+    df_trace = df
+    if reduite:
+        df_trace = reduire_serie(df, x, y, nb_points, "lttb" if type_graphique == "ligne" else "min_max")
+        if len(df_trace) < len(df) and "title" in options:
+            options["title"] = f"{options['title']} ({len(df_trace):,} points sur {len(df):,})"
+
+    if type_graphique == "ligne":
+        return px.line(df_trace, x=x, y=y, render_mode="webgl" if reduite else "auto", **options)
+    return px.bar(df_trace, x=x, y=y, **options)
@@ -0,0 +1,81 @@
+"""
+Index par compte des soldes et des mouvements.
+
+Le DataFrame est trié une seule fois par (COMPTE, date) et l'index mémorise,
+pour chaque compte, la plage de lignes [début, fin) qui lui correspond. Une
+recherche par compte puis par période se fait alors par recherche
+dichotomique : O(log n + k) au lieu d'un masque booléen sur toute la table.
+"""
+import numpy as np
+import pandas as pd
+
+
+class IndexComptes:
+    """Index trié par (COMPTE, date) avec la plage de lignes de chaque compte"""
+
+    def __init__(self, df, colonne_date):
+        self.colonne_date = colonne_date
+        df = df[df["COMPTE"].notna()]
+        self.df = df.sort_values(["COMPTE", colonne_date], kind="mergesort").reset_index(drop=True)
+
+        comptes = self.df["COMPTE"].to_numpy()
+        if len(comptes):
+            debuts = np.flatnonzero(np.r_[True, comptes[1:] != comptes[:-1]])
+        else:
+            debuts = np.array([], dtype=np.int64)
+        self.comptes = comptes[debuts]
+        self.debuts = debuts
+        self.fins = np.r_[debuts[1:], len(comptes)].astype(np.int64)
+        self.dates = self.df[colonne_date].to_numpy(dtype="datetime64[ns]")
+
+    def __len__(self):
+        return len(self.df)
+
+    def plage(self, compte):
+        """Plage de lignes [début, fin) du compte, vide si le compte est inconnu"""
+        i = np.searchsorted(self.comptes, compte)
+        if i == len(self.comptes) or self.comptes[i] != compte:
+            return 0, 0
+        return int(self.debuts[i]), int(self.fins[i])
+
+    def plage_periode(self, compte, debut=None, fin=None):
+        """Plage de lignes du compte dont la date est comprise entre début et fin inclus"""
+        d, f = self.plage(compte)
+        if d == f:
+            return d, f
+        dates_compte = self.dates[d:f]
+        if debut is not None:
+            d_periode = d + int(np.searchsorted(dates_compte, np.datetime64(pd.Timestamp(debut), "ns"), side="left"))
+        else:
+            d_periode = d
+        if fin is not None:
+            f_periode = d + int(np.searchsorted(dates_compte, np.datetime64(pd.Timestamp(fin), "ns"), side="right"))
+        else:
+            f_periode = f
+        return d_periode, max(d_periode, f_periode)
+
+    def lignes_compte(self, compte):
+        """Lignes du compte, triées par date"""
+        d, f = self.plage(compte)
+        return self.df.iloc[d:f]
+
+    def lignes_periode(self, compte, debut=None, fin=None):
+        """Lignes du compte entre début et fin inclus, triées par date"""
+        d, f = self.plage_periode(compte, debut, fin)
+        return self.df.iloc[d:f]
+
+    def plage_mois(self, compte, annee, mois):
+        """Plage de lignes du compte pour un mois calendaire"""
+        debut = pd.Timestamp(year=annee, month=mois, day=1)
+        fin = debut + pd.offsets.MonthBegin(1) - pd.Timedelta(1, "ns")
+        return self.plage_periode(compte, debut, fin)
+
+    def lignes_mois(self, compte, annee, mois):
+        """Lignes du compte pour un mois calendaire"""
+        d, f = self.plage_mois(compte, annee, mois)
+        return self.df.iloc[d:f]
+
+    def nb_lignes_mois(self, compte, annee, mois):
+        """Nombre de lignes du compte pour un mois calendaire, sans les extraire"""
+        d, f = self.plage_mois(compte, annee, mois)
+        return f - d
@@ -0,0 +1,103 @@
+"""
+Instrumentation des étapes de l'application : temps, lignes et mémoire.
+
+Un ``JournalPerformance`` est créé à chaque exécution du script Streamlit.
+Chaque étape mesurée (``with journal.etape("filtrage") as mesure:``)
+enregistre sa durée, le nombre de lignes traitées renseigné par l'appelant
+et la variation de la mémoire résidente du processus. Les étapes imbriquées
+sont nommées par leur chemin (``analyse_turnover/filtrage``).
+
+Chaque mesure est aussi émise sur le logger ``instrumentation`` sous forme
+d'une ligne JSON ; avec la variable d'environnement ``BOA_JOURNAL_PERF``,
+ces lignes sont ajoutées à un fichier commun à toutes les sessions, qui peut
+être agrégé ensuite (par exemple avec ``pd.read_json(chemin, lines=True)``).
+"""
+import json
+import logging
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+FICHIER_JOURNAL = os.environ.get("BOA_JOURNAL_PERF")
+
+COLONNES_MESURE = [
+    "SESSION", "EXECUTION", "ETAPE", "DEBUT", "SECONDES", "LIGNES", "MEMOIRE_MO", "DELTA_MEMOIRE_MO"
+]
+
+
+def memoire_processus():
+    """Mémoire résidente du processus en octets, None si elle n'est pas disponible"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def configurer_journal_fichier(chemin=FICHIER_JOURNAL):
+    """Ajoute au logger un fichier recevant une ligne JSON par étape ; sans effet si aucun chemin"""
+    if not chemin:
+        return False
+    chemin = os.path.abspath(chemin)
+    if any(getattr(h, "baseFilename", None) == chemin for h in logger.handlers):
+        return True
+    gestionnaire = logging.FileHandler(chemin, encoding="utf-8")
+    gestionnaire.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(gestionnaire)
+    logger.setLevel(logging.INFO)
+    return True
+
+
+class JournalPerformance:
+    """Mesures des étapes d'une exécution, dans l'ordre où elles ont commencé"""
+
+    def __init__(self, session=None):
+        self.session = session
+        self.execution = uuid.uuid4().hex[:12]
+        self.mesures = []
+        self._pile = []
+
+    @contextmanager
+    def etape(self, nom, lignes=None):
+        """Mesure le bloc ; l'appelant peut renseigner ``mesure["LIGNES"]``"""
+        mesure = {
+            "SESSION": self.session,
+            "EXECUTION": self.execution,
+            "ETAPE": "/".join(self._pile + [nom]),
+            "DEBUT": datetime.now().isoformat(timespec="milliseconds"),
+            "SECONDES": None,
+            "LIGNES": lignes,
+            "MEMOIRE_MO": None,
+            "DELTA_MEMOIRE_MO": None,
+        }
+        self.mesures.append(mesure)
+        self._pile.append(nom)
+        memoire_avant = memoire_processus()
+        debut = time.perf_counter()
+        try:
+            yield mesure
+        finally:
+            mesure["SECONDES"] = time.perf_counter() - debut
+            self._pile.pop()
+            memoire_apres = memoire_processus()
+            if memoire_apres is not None:
+                mesure["MEMOIRE_MO"] = memoire_apres / 1024 / 1024
+                if memoire_avant is not None:
+                    mesure["DELTA_MEMOIRE_MO"] = (memoire_apres - memoire_avant) / 1024 / 1024
+            logger.info(json.dumps(mesure, ensure_ascii=False, default=str))
+
+    def tableau(self):
+        """Mesures sous forme de DataFrame"""
+        return pd.DataFrame(self.mesures, columns=COLONNES_MESURE)
+
+    def exporter_jsonl(self):
+        """Mesures au format JSON lines (une ligne par étape), en octets"""
+        return "".join(
+            json.dumps(mesure, ensure_ascii=False, default=str) + "\n" for mesure in self.mesures
+        ).encode("utf-8")
@@ -0,0 +1,131 @@
+"""
+Lecture des extraits CSV et Parquet avec Apache Arrow.
+
+Le système bancaire peut exporter les soldes et les mouvements en CSV ou en
+Parquet avec les mêmes colonnes que les fichiers Excel. Ces formats sont lus
+par pyarrow, en parallèle sur plusieurs threads, puis convertis en
+DataFrame avec les mêmes types (``types_solde`` / ``types_mvt``) et les mêmes
+colonnes de dates que la lecture Excel. Seules les colonnes demandées sont
+lues ; le séparateur des CSV (``,``, ``;``, tabulation ou ``|``) est détecté
+sur les premières lignes.
+"""
+import csv
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+EXTENSIONS_CSV = (".csv", ".txt")
+EXTENSIONS_PARQUET = (".parquet", ".pq")
+SEPARATEURS = ",;\t|"
+TAILLE_ECHANTILLON = 64 * 1024
+
+# Formats de date acceptés dans les CSV, en plus de l'ISO 8601
+FORMATS_DATE = [pa_csv.ISO8601, "%d/%m/%Y", "%d/%m/%Y %H:%M:%S", "%d-%m-%Y"]
+
+TYPES_ARROW = {
+    "int64": pa.int64(),
+    "float64": pa.float64(),
+    "string": pa.string(),
+    "object": pa.string(),
+    "str": pa.string(),
+}
+
+
+def format_fichier(source):
+    """'csv', 'parquet' ou 'excel' selon l'extension du chemin ou du nom du fichier importé"""
+    nom = os.fspath(source) if isinstance(source, (str, os.PathLike)) else getattr(source, "name", "") or ""
+    extension = os.path.splitext(nom)[1].lower()
+    if extension in EXTENSIONS_CSV:
+        return "csv"
+    if extension in EXTENSIONS_PARQUET:
+        return "parquet"
+    return "excel"
+
+
+def _echantillon(source):
+    """Premiers octets d'un fichier (chemin ou objet fichier), sans déplacer la position de lecture"""
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            return f.read(TAILLE_ECHANTILLON)
+    position = source.tell()
+    try:
+        return source.read(TAILLE_ECHANTILLON)
+    finally:
+        source.seek(position)
+
+
+def detecter_separateur(source):
+    """Séparateur de colonnes d'un CSV, ',' si la détection échoue"""
+    texte = _echantillon(source).decode("utf-8", errors="ignore")
+    try:
+        return csv.Sniffer().sniff(texte.split("\n", 1)[0], delimiters=SEPARATEURS).delimiter
+    except csv.Error:
+        return ","
+
+
+def _verifier_colonnes(disponibles, colonnes):
+    manquantes = [c for c in colonnes if c not in disponibles]
+    if manquantes:
+        raise ValueError(f"Colonnes absentes du fichier : {', '.join(manquantes)}")
+
+
+def _vers_pandas(table, types, dates):
+    """Convertit une table Arrow en DataFrame avec les types de la lecture Excel"""
+    df = table.to_pandas()
+    for colonne in df.columns:
+        if colonne in dates:
+            df[colonne] = pd.to_datetime(df[colonne])
+        elif colonne in types:
+            df[colonne] = df[colonne].astype(types[colonne])
+    return df
+
+
+def lire_csv_arrow(source, types, dates, colonnes=None, exclues=()):
+    """
+    Lit un CSV avec le lecteur multi-thread de pyarrow. ``colonnes`` limite
+    la lecture aux colonnes utiles (toutes hors ``exclues`` si None) ; une
+    ValueError est levée si une colonne demandée est absente.
+    """
+    separateur = detecter_separateur(source)
+    entete = next(csv.reader([_echantillon(source).decode("utf-8-sig", errors="ignore").split("\n", 1)[0]],
+                             delimiter=separateur))
+    entete = [c.strip() for c in entete]
+    if colonnes is None:
+        colonnes = [c for c in entete if c and c not in exclues]
+    _verifier_colonnes(entete, colonnes)
+
+    types_colonnes = {c: TYPES_ARROW[types[c]] for c in colonnes if c in types and types[c] in TYPES_ARROW}
+    types_colonnes.update({c: pa.timestamp("ns") for c in colonnes if c in dates})
+    table = pa_csv.read_csv(
+        source,
+        read_options=pa_csv.ReadOptions(use_threads=True, column_names=entete, skip_rows=1),
+        parse_options=pa_csv.ParseOptions(delimiter=separateur),
+        convert_options=pa_csv.ConvertOptions(
+            column_types=types_colonnes,
+            include_columns=colonnes,
+            timestamp_parsers=FORMATS_DATE,
+            strings_can_be_null=True,
+        ),
+    )
+    return _vers_pandas(table, types, dates)
+
+
+def lire_parquet_arrow(source, types, dates, colonnes=None, exclues=()):
+    """Lit un fichier Parquet sur plusieurs threads, en ne chargeant que les colonnes utiles"""
+    fichier = pq.ParquetFile(source)
+    disponibles = fichier.schema_arrow.names
+    if colonnes is None:
+        colonnes = [c for c in disponibles if c not in exclues]
+    _verifier_colonnes(disponibles, colonnes)
+    table = fichier.read(columns=colonnes, use_threads=True)
+    return _vers_pandas(table, types, dates)
+
+
+def lire_arrow(source, types, dates, colonnes=None, exclues=()):
+    """Lit un CSV ou un fichier Parquet selon son extension"""
+    if format_fichier(source) == "parquet":
+        return lire_parquet_arrow(source, types, dates, colonnes, exclues)
+    return lire_csv_arrow(source, types, dates, colonnes, exclues)
@@ -0,0 +1,129 @@
+"""
+Lecture par blocs des gros fichiers Excel de mouvements.
+
+Le classeur est parcouru en mode lecture seule d'openpyxl, ligne par ligne,
+sans jamais charger la feuille entière. Les lignes sont regroupées en blocs
+typés avec ``types_mvt`` ; seules les colonnes utiles aux analyses sont
+conservées et les colonnes texte sont converties en catégories, de sorte que
+la mémoire consommée dépend de la taille du bloc et non de celle du fichier.
+"""
+from operator import itemgetter
+
+import openpyxl
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+# Colonnes des mouvements réellement utilisées par les analyses
+COLONNES_ANALYSE_MVT = ["COMPTE", "MNTDEV", "DATOPER"]
+COLONNES_EXCLUES = ["DATVAL"]
+TAILLE_BLOC = 50_000
+
+TYPES_TEXTE = ("string", "object", "str")
+
+
+def _typer_bloc(lignes, colonnes, types, dates, compacter=True):
+    """Construit un DataFrame typé à partir d'une liste de tuples"""
+    bloc = pd.DataFrame.from_records(lignes, columns=colonnes)
+    for colonne in colonnes:
+        if colonne in dates:
+            bloc[colonne] = pd.to_datetime(bloc[colonne])
+        elif colonne in types:
+            type_colonne = types[colonne]
+            if compacter and type_colonne in TYPES_TEXTE:
+                bloc[colonne] = bloc[colonne].astype("string").astype("category")
+            else:
+                bloc[colonne] = bloc[colonne].astype(type_colonne)
+    return bloc
+
+
+def iterer_blocs_excel(source, types, dates, colonnes=None, taille_bloc=TAILLE_BLOC,
+                       exclues=COLONNES_EXCLUES, compacter=True):
+    """
+    Parcourt la première feuille d'un classeur .xlsx et produit des blocs
+    typés d'au plus ``taille_bloc`` lignes.
+
+    ``colonnes`` limite la lecture aux colonnes utiles (toutes les colonnes
+    hors ``exclues`` si None). Une ValueError est levée si une colonne
+    demandée est absente de l'en-tête.
+    """
+    classeur = openpyxl.load_workbook(source, read_only=True, data_only=True)
+    try:
+        lignes = classeur.active.iter_rows(values_only=True)
+        entete = next(lignes, None)
+        if entete is None:
+            return
+        entete = [str(c).strip() if c is not None else None for c in entete]
+
+        if colonnes is None:
+            colonnes = [c for c in entete if c and c not in exclues]
+        manquantes = [c for c in colonnes if c not in entete]
+        if manquantes:
+            raise ValueError(f"Colonnes absentes du fichier : {', '.join(manquantes)}")
+
+        positions = [entete.index(c) for c in colonnes]
+        extraire = itemgetter(*positions)
+        unique = len(positions) == 1
+        largeur = max(positions) + 1
+
+        tampon = []
+        for ligne in lignes:
+            if ligne is None or all(v is None for v in ligne):
+                continue
+            if len(ligne) < largeur:
+                ligne = tuple(ligne) + (None,) * (largeur - len(ligne))
+            valeurs = extraire(ligne)
+            tampon.append((valeurs,) if unique else valeurs)
+            if len(tampon) >= taille_bloc:
+                yield _typer_bloc(tampon, colonnes, types, dates, compacter)
+                tampon = []
+        if tampon:
+            yield _typer_bloc(tampon, colonnes, types, dates, compacter)
+    finally:
+        classeur.close()
+
+
+def concatener_blocs(blocs):
+    """Concatène des blocs en conservant les colonnes catégorielles"""
+    blocs = list(blocs)
+    if not blocs:
+        return pd.DataFrame()
+    for colonne in blocs[0].columns:
+        if isinstance(blocs[0][colonne].dtype, pd.CategoricalDtype):
+            categories = union_categoricals(
+                [bloc[colonne] for bloc in blocs], ignore_order=True
+            ).categories
+            for bloc in blocs:
+                bloc[colonne] = bloc[colonne].cat.set_categories(categories)
+    return pd.concat(blocs, ignore_index=True)
+
+
+def lire_mvt_streaming(source, types, dates, colonnes=COLONNES_ANALYSE_MVT, taille_bloc=TAILLE_BLOC):
+    """Lit un fichier de mouvements par blocs et renvoie un DataFrame compact"""
+    return concatener_blocs(
+        iterer_blocs_excel(source, types, dates, colonnes=colonnes, taille_bloc=taille_bloc)
+    )
+
+
+def convertir_mvt_en_parquet(source, destination, types, dates, colonnes=COLONNES_ANALYSE_MVT,
+                             taille_bloc=TAILLE_BLOC):
+    """
+    Convertit un fichier de mouvements en Parquet bloc par bloc, sans jamais
+    conserver plus d'un bloc en mémoire. Renvoie le nombre de lignes écrites.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    ecrivain = None
+    nb_lignes = 0
+    try:
+        for bloc in iterer_blocs_excel(source, types, dates, colonnes=colonnes,
+                                       taille_bloc=taille_bloc, compacter=False):
+            table = pa.Table.from_pandas(bloc, preserve_index=False)
+            if ecrivain is None:
+                ecrivain = pq.ParquetWriter(destination, table.schema)
+            ecrivain.write_table(table.cast(ecrivain.schema))
+            nb_lignes += len(bloc)
+    finally:
+        if ecrivain is not None:
+            ecrivain.close()
+    return nb_lignes
@@ -0,0 +1,235 @@
+"""
+Matrice dense des soldes : une ligne par compte, une colonne par jour calendaire.
+
+Les soldes journaliers ne sont connus que les jours ouvrés ; une moyenne sur
+les lignes présentes donne le même poids à un vendredi qu'à un jour isolé
+et ignore les week-ends et jours fériés. La matrice aligne tous les comptes
+sur le calendrier, du premier au dernier jour des données :
+
+- ``soldes`` : solde de chaque compte pour chaque jour, le dernier solde
+  connu étant reporté sur les jours sans position (NaN avant le premier et
+  après le dernier solde du compte) ;
+- ``observe`` : masque des jours pour lesquels un solde existe réellement.
+
+Les taux d'utilisation, soldes moyens et turnover routed sont alors des
+réductions le long de l'axe des jours, pour un compte ou pour tous les
+comptes à la fois. Un report de solde ne crée aucune variation : les flux
+créditeurs sont ceux des soldes observés.
+"""
+import numpy as np
+import pandas as pd
+
+# Nombre maximal de cellules (comptes × jours)
+CELLULES_MAX_MATRICE = 50_000_000
+# Octets par cellule de la matrice construite : solde (float64) et masque des jours observés
+OCTETS_PAR_CELLULE = np.dtype(np.float64).itemsize + np.dtype(bool).itemsize
+# Cellules remplies ensemble : les tableaux intermédiaires (soldes bruts,
+# positions, masque), environ 25 octets par cellule, ne portent que sur un bloc de comptes
+CELLULES_BLOC_MATRICE = 2_000_000
+OCTETS_PAR_CELLULE_BLOC = 25
+
+
+class MatriceSoldes:
+    """Soldes de tous les comptes sur un calendrier journalier continu"""
+
+    def __init__(self, index_solde, cellules_max=CELLULES_MAX_MATRICE, cellules_bloc=CELLULES_BLOC_MATRICE):
+        self.comptes = index_solde.comptes
+        dates = index_solde.dates
+        if len(dates):
+            self.jours = pd.date_range(pd.Timestamp(dates.min()).normalize(), pd.Timestamp(dates.max()).normalize(),
+                                       freq="D")
+        else:
+            self.jours = pd.DatetimeIndex([])
+        nb_comptes, nb_jours = len(self.comptes), len(self.jours)
+        taille_bloc = max(1, cellules_bloc // max(nb_jours, 1))
+        if nb_comptes * nb_jours > cellules_max:
+            # Pic de mémoire : matrice construite et tableaux intermédiaires d'un bloc
+            pic = (nb_comptes * OCTETS_PAR_CELLULE + min(nb_comptes, taille_bloc) * OCTETS_PAR_CELLULE_BLOC) * nb_jours
+            raise ValueError(
+                f"Matrice de {nb_comptes:,} comptes × {nb_jours:,} jours trop volumineuse "
+                f"({pic / 1024 / 1024:,.0f} Mo)"
+            )
+
+        self.premier_jour = self._colonnes(dates[index_solde.debuts])
+        self.dernier_jour = self._colonnes(dates[index_solde.fins - 1])
+        self.soldes = np.empty((nb_comptes, nb_jours))
+        self.observe = np.zeros((nb_comptes, nb_jours), dtype=bool)
+        for debut in range(0, nb_comptes, taille_bloc):
+            self._remplir(index_solde, debut, min(debut + taille_bloc, nb_comptes))
+
+    def _colonnes(self, dates):
+        """Colonnes des jours de dates (datetime64) comprises dans le calendrier"""
+        if not len(self.jours):
+            return np.array([], dtype=np.int64)
+        return (dates.astype("datetime64[D]") - self.jours[0].to_datetime64().astype("datetime64[D]")).astype(np.int64)
+
+    def _remplir(self, index_solde, debut, fin):
+        """
+        Remplit les lignes des comptes ``debut`` à ``fin`` (exclu) ; les
+        tableaux intermédiaires ne portent que sur ces comptes
+        """
+        nb_jours = len(self.jours)
+        debuts, fins = index_solde.debuts[debut:fin], index_solde.fins[debut:fin]
+        lignes_solde = slice(int(debuts[0]), int(fins[-1]))
+        lignes = np.repeat(np.arange(fin - debut), fins - debuts)
+        colonnes = self._colonnes(index_solde.dates[lignes_solde])
+        # Lignes triées par date : pour plusieurs soldes le même jour, le dernier l'emporte
+        bruts = np.full((fin - debut, nb_jours), np.nan)
+        bruts[lignes, colonnes] = index_solde.df["SOLDE"].iloc[lignes_solde].to_numpy(dtype=np.float64)
+        observe = self.observe[debut:fin]
+        observe[lignes, colonnes] = True
+        del lignes, colonnes
+
+        # Report du dernier solde connu, entre le premier et le dernier solde de chaque compte
+        positions = np.where(observe, np.arange(nb_jours), 0)
+        np.maximum.accumulate(positions, axis=1, out=positions)
+        reportes = np.take_along_axis(bruts, positions, axis=1)
+        del bruts, positions
+        jours = np.arange(nb_jours)
+        reportes[(jours < self.premier_jour[debut:fin, None]) | (jours > self.dernier_jour[debut:fin, None])] = np.nan
+        self.soldes[debut:fin] = reportes
+
+    @property
+    def nbytes(self):
+        return self.soldes.nbytes + self.observe.nbytes
+
+    def ligne(self, compte):
+        """Position du compte dans la matrice, None si le compte est inconnu"""
+        i = np.searchsorted(self.comptes, compte)
+        if i == len(self.comptes) or self.comptes[i] != compte:
+            return None
+        return int(i)
+
+    def colonnes_periode(self, debut, fin):
+        """Tranche des colonnes des jours compris entre début et fin inclus"""
+        d = self.jours.searchsorted(pd.Timestamp(debut).normalize(), side="left")
+        f = self.jours.searchsorted(pd.Timestamp(fin).normalize(), side="right")
+        return slice(int(d), int(max(d, f)))
+
+    def colonnes_mois(self, annee, mois, nb_mois=1):
+        """Colonnes des ``nb_mois`` mois se terminant au mois donné"""
+        fin = pd.Timestamp(year=annee, month=mois, day=1) + pd.offsets.MonthEnd(0)
+        debut = pd.Timestamp(year=annee, month=mois, day=1) - pd.DateOffset(months=nb_mois - 1)
+        return self.colonnes_periode(debut, fin)
+
+    # --- Réductions le long de l'axe des jours ---
+    @staticmethod
+    def _moyenne(soldes):
+        """Moyenne des jours couverts de chaque ligne, NaN pour une ligne sans solde"""
+        nb_jours = np.sum(~np.isnan(soldes), axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(nb_jours > 0, np.nansum(soldes, axis=1) / nb_jours, np.nan), nb_jours
+
+    @staticmethod
+    def _flux_crediteurs(soldes, observe):
+        """
+        Variations positives d'un jour à l'autre ; la variation jusqu'au
+        premier solde observé de la période est antérieure à la période
+        """
+        variation = np.diff(soldes, axis=1, prepend=np.nan)
+        variation[np.cumsum(observe, axis=1) <= 1] = 0.0
+        return np.where(variation > 0, variation, 0.0)
+
+    def usage(self, compte, annee, mois, limite_credit):
+        """
+        Taux d'utilisation moyen et maximal, solde moyen et nombre de jours
+        (observés, couverts) d'un mois sur base calendaire, et table
+        journalière ; None si le compte n'a pas de solde sur le mois
+        """
+        i = self.ligne(compte)
+        if i is None or not limite_credit:
+            return None
+        colonnes = self.colonnes_mois(annee, mois)
+        soldes = self.soldes[i, colonnes]
+        if np.isnan(soldes).all():
+            return None
+        moyenne, nb_jours = self._moyenne(soldes[None, :])
+        df_usage = pd.DataFrame({
+            "DATPOS": self.jours[colonnes],
+            "SOLDE": soldes,
+            "OBSERVE": self.observe[i, colonnes],
+        }).dropna(subset=["SOLDE"])
+        df_usage["TAUX_USAGE"] = df_usage["SOLDE"] / limite_credit * 100
+        return {
+            "TAUX_USAGE_MOYEN": moyenne[0] / limite_credit * 100,
+            "TAUX_USAGE_MAX": np.nanmax(soldes) / limite_credit * 100,
+            "SOLDE_MOYEN": moyenne[0],
+            "NB_JOURS_OBSERVES": int(self.observe[i, colonnes].sum()),
+            "NB_JOURS_CALENDAIRES": int(nb_jours[0]),
+            "USAGE": df_usage,
+        }
+
+    def turnover(self, compte, annee, mois, nb_mois=3):
+        """
+        Turnover routed des ``nb_mois`` mois se terminant au mois donné sur
+        base calendaire : flux créditeurs des soldes observés rapportés au
+        solde moyen de tous les jours couverts ; None si moins de 2 soldes
+        """
+        i = self.ligne(compte)
+        if i is None:
+            return None
+        colonnes = self.colonnes_mois(annee, mois, nb_mois)
+        soldes = self.soldes[i, colonnes]
+        if self.observe[i, colonnes].sum() < 2:
+            return None
+        moyenne, nb_jours = self._moyenne(soldes[None, :])
+        total_flux = self._flux_crediteurs(soldes[None, :], self.observe[i, colonnes][None, :]).sum()
+        if moyenne[0] == 0:
+            return None
+        return {
+            "TURNOVER_ROUTED": total_flux / moyenne[0] * 100,
+            "TOTAL_FLUX_CREDITEUR": total_flux,
+            "MOYENNE_SOLDE_3M": moyenne[0],
+            "NB_JOURS_CALENDAIRES_3M": int(nb_jours[0]),
+        }
+
+    def moyennes_mensuelles(self):
+        """
+        Solde moyen calendaire de chaque compte pour chaque mois : périodes
+        mensuelles, matrice (comptes × mois) des moyennes et des jours couverts
+        """
+        if not len(self.jours):
+            return pd.PeriodIndex([], freq="M"), np.empty((len(self.comptes), 0)), np.empty((len(self.comptes), 0))
+        mois = self.jours.to_period("M")
+        debuts = np.flatnonzero(np.r_[True, mois[1:] != mois[:-1]])
+        couverts = ~np.isnan(self.soldes)
+        sommes = np.add.reduceat(np.where(couverts, self.soldes, 0.0), debuts, axis=1)
+        nb_jours = np.add.reduceat(couverts, debuts, axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            moyennes = np.where(nb_jours > 0, sommes / nb_jours, np.nan)
+        return mois[debuts], moyennes, nb_jours
+
+    def usage_portefeuille(self, limite_credit):
+        """Taux d'utilisation moyen calendaire de tous les comptes pour tous les mois"""
+        mois, moyennes, nb_jours = self.moyennes_mensuelles()
+        presents = nb_jours > 0
+        lignes, colonnes = np.nonzero(presents)
+        resultat = pd.DataFrame({
+            "COMPTE": self.comptes[lignes],
+            "MOIS": mois[colonnes],
+            "NB_JOURS_CALENDAIRES": nb_jours[presents],
+            "SOLDE_MOYEN": moyennes[presents],
+        })
+        resultat["TAUX_USAGE_MOYEN"] = (
+            resultat["SOLDE_MOYEN"] / limite_credit * 100 if limite_credit else np.nan
+        )
+        return resultat
+
+    def turnover_portefeuille(self, annee, mois, nb_mois=3):
+        """Turnover routed calendaire de tous les comptes pour une fenêtre de ``nb_mois`` mois"""
+        colonnes = self.colonnes_mois(annee, mois, nb_mois)
+        soldes = self.soldes[:, colonnes]
+        moyennes, nb_jours = self._moyenne(soldes)
+        observe = self.observe[:, colonnes]
+        flux = self._flux_crediteurs(soldes, observe).sum(axis=1)
+        nb_observes = observe.sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            turnover = flux / moyennes * 100
+        turnover[(nb_observes < 2) | (moyennes == 0)] = np.nan
+        return pd.DataFrame({
+            "COMPTE": self.comptes,
+            "NB_JOURS_CALENDAIRES_3M": nb_jours,
+            "FLUX_CREDITEUR_3M": flux,
+            "SOLDE_MOYEN_3M": moyennes,
+            "TURNOVER_ROUTED_3M": turnover,
+        })
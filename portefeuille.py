@@ -0,0 +1,481 @@
+"""
+Calculs sur l'ensemble du portefeuille en une seule passe vectorisée.
+
+Les soldes journaliers sont agrégés par (COMPTE, mois) puis les indicateurs
+mensuels (taux d'utilisation, solde moyen, turnover routed sur 3 mois) sont
+dérivés de ces agrégats, pour tous les comptes et tous les mois à la fois,
+sans appeler les fonctions par compte dans une boucle. Les définitions sont
+celles de ``calculer_usage_rate_mensuel``, de
+``calculer_turnover_routed_depuis_solde`` et de ``moyenne_duree_decouvert``.
+"""
+import io
+
+import numpy as np
+import pandas as pd
+
+
+def numero_mois(dates):
+    """Numéro de mois absolu (année * 12 + mois - 1) d'une série de dates"""
+    return (dates.dt.year * 12 + dates.dt.month - 1).to_numpy(dtype=np.int64)
+
+
+def mois_depuis_numero(numeros):
+    """Convertit des numéros de mois absolus en périodes mensuelles"""
+    numeros = np.asarray(numeros, dtype=np.int64)
+    dates = pd.to_datetime(pd.DataFrame({"year": numeros // 12, "month": numeros % 12 + 1, "day": 1}))
+    return pd.PeriodIndex(dates.dt.to_period("M"))
+
+
+def _soldes_tries(df_solde, index=None):
+    """Soldes triés par (COMPTE, DATPOS), en réutilisant l'index s'il existe"""
+    if index is not None:
+        return index.df
+    df = df_solde[df_solde["COMPTE"].notna() & df_solde["DATPOS"].notna()]
+    return df.sort_values(["COMPTE", "DATPOS"], kind="mergesort").reset_index(drop=True)
+
+
+def agreger_mensuel(df_solde, index=None):
+    """
+    Agrégats mensuels par compte :
+
+    - NB_JOURS, SOMME_SOLDE, SOLDE_MOYEN, SOLDE_MIN, SOLDE_MAX
+    - PREMIER_SOLDE, DERNIER_SOLDE : premier et dernier solde du mois
+    - FLUX_CREDITEUR : somme des variations positives entre deux soldes
+      consécutifs du même mois
+    - FLUX_ENTREE : variation positive entre le dernier solde connu du compte
+      et le premier solde du mois (0 pour le premier mois du compte)
+    """
+    df = _soldes_tries(df_solde, index)
+    df = df[df["DATPOS"].notna()]
+    colonnes = ["COMPTE", "NUM_MOIS", "NB_JOURS", "SOMME_SOLDE", "SOLDE_MOYEN", "SOLDE_MIN",
+                "SOLDE_MAX", "PREMIER_SOLDE", "DERNIER_SOLDE", "FLUX_CREDITEUR", "FLUX_ENTREE"]
+    if df.empty:
+        return pd.DataFrame(columns=colonnes)
+
+    comptes = df["COMPTE"].to_numpy()
+    soldes = df["SOLDE"].to_numpy(dtype=np.float64)
+    num_mois = numero_mois(df["DATPOS"])
+
+    nouveau_compte = np.r_[True, comptes[1:] != comptes[:-1]]
+    nouveau_groupe = nouveau_compte | np.r_[True, num_mois[1:] != num_mois[:-1]]
+    debuts = np.flatnonzero(nouveau_groupe)
+    fins = np.r_[debuts[1:], len(df)] - 1
+
+    variation = np.r_[0.0, np.diff(soldes)]
+    variation[nouveau_compte] = 0.0
+    flux = np.where(variation > 0, variation, 0.0)
+    flux_entree = flux[debuts]
+
+    agregats = pd.DataFrame({
+        "COMPTE": comptes[debuts],
+        "NUM_MOIS": num_mois[debuts],
+        "NB_JOURS": fins - debuts + 1,
+        "SOMME_SOLDE": np.add.reduceat(soldes, debuts),
+        "SOLDE_MIN": np.minimum.reduceat(soldes, debuts),
+        "SOLDE_MAX": np.maximum.reduceat(soldes, debuts),
+        "PREMIER_SOLDE": soldes[debuts],
+        "DERNIER_SOLDE": soldes[fins],
+        "FLUX_CREDITEUR": np.add.reduceat(flux, debuts) - flux_entree,
+        "FLUX_ENTREE": flux_entree,
+    })
+    agregats["SOLDE_MOYEN"] = agregats["SOMME_SOLDE"] / agregats["NB_JOURS"]
+    return agregats[colonnes]
+
+
+def turnover_glissant(agregats, nb_mois=3):
+    """
+    Turnover routed sur une fenêtre glissante de ``nb_mois`` mois (M-2 à M
+    par défaut) pour chaque compte et chaque mois calendaire entre le
+    premier et le dernier mois du compte.
+
+    Les agrégats sont dépliés sur un axe mensuel continu puis cumulés : la
+    somme d'une fenêtre est la différence de deux sommes cumulées, en O(1)
+    quel que soit le nombre de mois. NaN lorsque la fenêtre compte moins de
+    2 soldes ou que le solde moyen est nul, comme pour le calcul par compte.
+    """
+    colonnes = ["COMPTE", "NUM_MOIS", "PRESENT", "NB_JOURS_3M", "FLUX_CREDITEUR_3M",
+                "SOLDE_MOYEN_3M", "TURNOVER_ROUTED_3M"]
+    if agregats.empty:
+        return pd.DataFrame(columns=colonnes)
+
+    agregats = agregats.sort_values(["COMPTE", "NUM_MOIS"], kind="mergesort")
+    comptes = agregats["COMPTE"].to_numpy()
+    num_mois = agregats["NUM_MOIS"].to_numpy(dtype=np.int64)
+
+    # Axe mensuel continu de chaque compte, du premier au dernier mois
+    nouveau_compte = np.r_[True, comptes[1:] != comptes[:-1]]
+    debuts = np.flatnonzero(nouveau_compte)
+    fins = np.r_[debuts[1:], len(comptes)] - 1
+    longueurs = num_mois[fins] - num_mois[debuts] + 1
+    decalages = np.r_[0, np.cumsum(longueurs)[:-1]]
+    taille = int(longueurs.sum())
+
+    numero_compte = np.cumsum(nouveau_compte) - 1
+    positions = decalages[numero_compte] + num_mois - num_mois[debuts][numero_compte]
+    compte_dense = np.repeat(comptes[debuts], longueurs)
+    debut_compte_dense = np.repeat(decalages, longueurs)
+    num_mois_dense = np.arange(taille) - debut_compte_dense + np.repeat(num_mois[debuts], longueurs)
+
+    def deplier(colonne):
+        valeurs = np.zeros(taille)
+        valeurs[positions] = agregats[colonne].to_numpy(dtype=np.float64)
+        return valeurs
+
+    present = np.zeros(taille, dtype=bool)
+    present[positions] = True
+    nb_jours = deplier("NB_JOURS")
+    somme = deplier("SOMME_SOLDE")
+    entree = deplier("FLUX_ENTREE")
+    flux = deplier("FLUX_CREDITEUR") + entree
+
+    # Sommes cumulées : somme(j0..j) = cumul[j + 1] - cumul[j0]
+    def cumuler(valeurs):
+        return np.r_[0.0, np.cumsum(valeurs)]
+
+    cumul_jours, cumul_somme, cumul_flux = cumuler(nb_jours), cumuler(somme), cumuler(flux)
+    fin_fenetre = np.arange(taille)
+    debut_fenetre = np.maximum(fin_fenetre - (nb_mois - 1), debut_compte_dense)
+    nb_jours_fenetre = cumul_jours[fin_fenetre + 1] - cumul_jours[debut_fenetre]
+    somme_fenetre = cumul_somme[fin_fenetre + 1] - cumul_somme[debut_fenetre]
+    flux_fenetre = cumul_flux[fin_fenetre + 1] - cumul_flux[debut_fenetre]
+
+    # La variation d'entrée du premier mois présent de la fenêtre est hors fenêtre
+    candidats = np.where(present, np.arange(taille), taille)
+    premier_present = np.minimum.accumulate(candidats[::-1])[::-1]
+    premier = premier_present[debut_fenetre]
+    dans_fenetre = premier <= fin_fenetre
+    flux_fenetre[dans_fenetre] -= entree[premier[dans_fenetre]]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        moyenne = somme_fenetre / nb_jours_fenetre
+        turnover = flux_fenetre / moyenne * 100
+    turnover[(nb_jours_fenetre < 2) | (moyenne == 0)] = np.nan
+
+    return pd.DataFrame({
+        "COMPTE": compte_dense,
+        "NUM_MOIS": num_mois_dense,
+        "PRESENT": present,
+        "NB_JOURS_3M": nb_jours_fenetre.astype(np.int64),
+        "FLUX_CREDITEUR_3M": flux_fenetre,
+        "SOLDE_MOYEN_3M": moyenne,
+        "TURNOVER_ROUTED_3M": turnover,
+    })
+
+
+def historique_turnover(df_solde, compte=None, index=None, cube=None):
+    """
+    Historique du turnover routed sur 3 mois pour chaque mois d'un compte,
+    ou de tous les comptes si ``compte`` est None
+    """
+    if cube is not None:
+        agregats = cube.lignes_compte(compte) if compte is not None else cube.df
+        historique = turnover_glissant(agregats)
+        historique.insert(1, "MOIS", mois_depuis_numero(historique["NUM_MOIS"]))
+        return historique.drop(columns=["NUM_MOIS"])
+    if compte is not None:
+        if index is not None:
+            df_solde = index.lignes_compte(compte)
+        else:
+            df_solde = df_solde[df_solde["COMPTE"] == compte]
+        index = None
+    historique = turnover_glissant(agreger_mensuel(df_solde, index))
+    historique.insert(1, "MOIS", mois_depuis_numero(historique["NUM_MOIS"]))
+    return historique.drop(columns=["NUM_MOIS"])
+
+
+def historique_turnover_portefeuille(historique):
+    """
+    Turnover routed du portefeuille pour chaque mois : total des flux
+    créditeurs des comptes rapporté à la somme de leurs soldes moyens
+    """
+    valides = historique[historique["TURNOVER_ROUTED_3M"].notna()]
+    par_mois = valides.groupby("MOIS").agg(
+        NB_COMPTES=("COMPTE", "size"),
+        FLUX_CREDITEUR_3M=("FLUX_CREDITEUR_3M", "sum"),
+        SOLDE_MOYEN_3M=("SOLDE_MOYEN_3M", "sum"),
+    ).reset_index()
+    par_mois["TURNOVER_ROUTED_3M"] = par_mois["FLUX_CREDITEUR_3M"] / par_mois["SOLDE_MOYEN_3M"] * 100
+    return par_mois
+
+
+def calculer_portefeuille(df_solde, limite_credit, index=None, cube=None):
+    """
+    Taux d'utilisation moyen et maximal, solde moyen et turnover routed
+    sur 3 mois pour chaque compte et chaque mois disponible.
+
+    ``limite_credit`` est soit une valeur unique, soit une série indexée par
+    COMPTE donnant la limite de chaque compte.
+    """
+    agregats = cube.df if cube is not None else agreger_mensuel(df_solde, index)
+    if agregats.empty:
+        return pd.DataFrame(columns=[
+            "COMPTE", "MOIS", "NB_JOURS", "SOLDE_MOYEN", "TAUX_USAGE_MOYEN", "TAUX_USAGE_MAX",
+            "FLUX_CREDITEUR_3M", "SOLDE_MOYEN_3M", "TURNOVER_ROUTED_3M",
+        ])
+
+    if isinstance(limite_credit, (pd.Series, dict)):
+        limites = agregats["COMPTE"].map(limite_credit).to_numpy(dtype=np.float64, copy=True)
+    else:
+        limites = np.full(len(agregats), float(limite_credit))
+    limites[~(limites > 0)] = np.nan
+
+    resultat = pd.DataFrame({
+        "COMPTE": agregats["COMPTE"].to_numpy(),
+        "MOIS": mois_depuis_numero(agregats["NUM_MOIS"]),
+        "NB_JOURS": agregats["NB_JOURS"].to_numpy(),
+        "SOLDE_MOYEN": agregats["SOLDE_MOYEN"].to_numpy(),
+        "TAUX_USAGE_MOYEN": agregats["SOLDE_MOYEN"].to_numpy() / limites * 100,
+        "TAUX_USAGE_MAX": agregats["SOLDE_MAX"].to_numpy() / limites * 100,
+    })
+    # Les mois présents de l'axe continu sont dans l'ordre des agrégats
+    turnover = turnover_glissant(agregats)
+    turnover = turnover[turnover["PRESENT"]]
+    for colonne in ["FLUX_CREDITEUR_3M", "SOLDE_MOYEN_3M", "TURNOVER_ROUTED_3M"]:
+        resultat[colonne] = turnover[colonne].to_numpy()
+    return resultat
+
+
+def soldes_premier_jour(df_solde, index=None):
+    """
+    Solde moyen du premier jour calendaire de chaque mois (colonnes COMPTE,
+    NUM_MOIS, SOLDE_JOUR1), pour les mois où ce jour a une position
+    """
+    df = _soldes_tries(df_solde, index)
+    dates = df["DATPOS"]
+    premiers = df[dates == dates.dt.to_period("M").dt.to_timestamp()]
+    return (
+        premiers.groupby(["COMPTE", numero_mois(premiers["DATPOS"])])["SOLDE"]
+        .mean()
+        .rename("SOLDE_JOUR1")
+        .rename_axis(["COMPTE", "NUM_MOIS"])
+        .reset_index()
+    )
+
+
+def decouvert_glissant(agregats, premiers_jours, seuil):
+    """
+    Durée moyenne de découvert et Credit Line Overdraft pour chaque compte
+    et chaque mois de référence, du premier mois du compte au mois suivant
+    son dernier mois, avec les fenêtres d'``analyser_decouvert_et_credit_line_overdraft`` :
+
+    - découvert : les mois M-12 à M-2, puis le mois M-1 réduit à son premier
+      jour (la fenêtre se termine le 1er du mois M-1) ;
+    - Credit Line Overdraft : les mois M-11 à M, en comptant les mois dont le
+      solde moyen dépasse celui du mois présent précédent de la fenêtre.
+
+    Comme pour ``turnover_glissant``, les mois sont dépliés sur un axe
+    continu ; les épisodes et les améliorations sont repérés une seule fois
+    sur tout l'historique, puis comptés dans chaque fenêtre par différence de
+    sommes cumulées, en corrigeant le premier mois de la fenêtre dont le
+    mois précédent est hors fenêtre.
+    """
+    colonnes = ["COMPTE", "NUM_MOIS", "NB_MOIS_FENETRE_DECOUVERT", "NB_MOIS_DECOUVERT", "NB_EPISODES_DECOUVERT",
+                "DUREE_MOYENNE_DECOUVERT", "NB_MOIS_FENETRE_CREDIT_LINE", "NB_CREDIT_LINE_OVERDRAFT"]
+    if agregats.empty:
+        return pd.DataFrame(columns=colonnes)
+
+    agregats = agregats.sort_values(["COMPTE", "NUM_MOIS"], kind="mergesort")
+    comptes = agregats["COMPTE"].to_numpy()
+    num_mois = agregats["NUM_MOIS"].to_numpy(dtype=np.int64)
+
+    # Axe mensuel continu de chaque compte, du premier mois au mois suivant le dernier
+    nouveau_compte = np.r_[True, comptes[1:] != comptes[:-1]]
+    debuts = np.flatnonzero(nouveau_compte)
+    fins = np.r_[debuts[1:], len(comptes)] - 1
+    longueurs = num_mois[fins] - num_mois[debuts] + 2
+    decalages = np.r_[0, np.cumsum(longueurs)[:-1]]
+    taille = int(longueurs.sum())
+
+    numero_compte = np.cumsum(nouveau_compte) - 1
+    positions = decalages[numero_compte] + num_mois - num_mois[debuts][numero_compte]
+    compte_dense = np.repeat(comptes[debuts], longueurs)
+    debut_compte_dense = np.repeat(decalages, longueurs)
+    num_mois_dense = np.arange(taille) - debut_compte_dense + np.repeat(num_mois[debuts], longueurs)
+
+    present = np.zeros(taille, dtype=bool)
+    present[positions] = True
+    moyenne = np.full(taille, np.nan)
+    moyenne[positions] = agregats["SOLDE_MOYEN"].to_numpy(dtype=np.float64)
+
+    # Solde du premier jour de chaque mois, placé sur l'axe continu
+    jour1 = np.full(taille, np.nan)
+    if len(premiers_jours):
+        i = np.searchsorted(comptes[debuts], premiers_jours["COMPTE"].to_numpy())
+        i_borne = np.minimum(i, len(debuts) - 1)
+        rang = premiers_jours["NUM_MOIS"].to_numpy(dtype=np.int64) - num_mois[debuts][i_borne]
+        connus = (i < len(debuts)) & (comptes[debuts][i_borne] == premiers_jours["COMPTE"].to_numpy()) \
+            & (rang >= 0) & (rang < longueurs[i_borne])
+        jour1[decalages[i_borne[connus]] + rang[connus]] = premiers_jours["SOLDE_JOUR1"].to_numpy()[connus]
+
+    # Mois présent précédent (dans le compte) et indicateurs sur tout l'historique
+    rangs = np.arange(taille)
+    dernier_present = np.maximum.accumulate(np.where(present, rangs, -1))
+    precedent = np.r_[-1, dernier_present[:-1]]
+    precedent[precedent < debut_compte_dense] = -1
+    a_decouvert = present & (moyenne <= seuil)
+    debut_episode = a_decouvert & ~np.where(precedent >= 0, a_decouvert[precedent], False)
+    with np.errstate(invalid="ignore"):
+        amelioration = present & (moyenne > np.where(precedent >= 0, moyenne[precedent], np.nan))
+    candidats = np.where(present, rangs, taille)
+    premier_present = np.r_[np.minimum.accumulate(candidats[::-1])[::-1], taille]
+
+    def cumuler(valeurs):
+        return np.r_[0, np.cumsum(valeurs)]
+
+    cumul_present, cumul_decouvert = cumuler(present), cumuler(a_decouvert)
+    cumul_episodes, cumul_ameliorations = cumuler(debut_episode), cumuler(amelioration)
+
+    def fenetre(cumul, debut, fin):
+        # Somme sur [debut, fin], 0 pour une fenêtre vide
+        return np.where(fin >= debut, cumul[np.maximum(fin, debut - 1) + 1] - cumul[debut], 0)
+
+    # Découvert : mois M-12 à M-2 ...
+    debut = np.maximum(rangs - 12, debut_compte_dense)
+    fin = rangs - 2
+    nb_mois_fenetre = fenetre(cumul_present, debut, fin)
+    nb_decouvert = fenetre(cumul_decouvert, debut, fin)
+    nb_episodes = fenetre(cumul_episodes, debut, fin)
+    premier = premier_present[debut]
+    premier_dans = premier <= fin
+    nb_episodes += premier_dans & a_decouvert[np.minimum(premier, taille - 1)] \
+        & ~debut_episode[np.minimum(premier, taille - 1)]
+
+    # ... puis le premier jour du mois M-1, qui suit le dernier mois présent de la fenêtre
+    mois_precedent = rangs - 1
+    valide = mois_precedent >= debut_compte_dense
+    solde_jour1 = np.where(valide, jour1[np.maximum(mois_precedent, 0)], np.nan)
+    jour1_present = ~np.isnan(solde_jour1)
+    with np.errstate(invalid="ignore"):
+        jour1_decouvert = jour1_present & (solde_jour1 <= seuil)
+    dernier = dernier_present[np.maximum(fin, 0)]
+    dernier_decouvert = (fin >= debut) & (dernier >= debut) & a_decouvert[np.maximum(dernier, 0)]
+    nb_mois_fenetre = nb_mois_fenetre + jour1_present
+    nb_decouvert = nb_decouvert + jour1_decouvert
+    nb_episodes = nb_episodes + (jour1_decouvert & ~dernier_decouvert)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        duree_moyenne = np.where(nb_episodes > 0, nb_decouvert / nb_episodes, 0.0)
+
+    # Credit Line Overdraft : mois M-11 à M, sans le premier mois présent de la fenêtre
+    debut = np.maximum(rangs - 11, debut_compte_dense)
+    premier = premier_present[debut]
+    premier_dans = premier <= rangs
+    nb_credit_line = fenetre(cumul_ameliorations, debut, rangs) \
+        - (premier_dans & amelioration[np.minimum(premier, taille - 1)])
+
+    return pd.DataFrame({
+        "COMPTE": compte_dense,
+        "NUM_MOIS": num_mois_dense,
+        "NB_MOIS_FENETRE_DECOUVERT": nb_mois_fenetre.astype(np.int64),
+        "NB_MOIS_DECOUVERT": nb_decouvert.astype(np.int64),
+        "NB_EPISODES_DECOUVERT": nb_episodes.astype(np.int64),
+        "DUREE_MOYENNE_DECOUVERT": duree_moyenne,
+        "NB_MOIS_FENETRE_CREDIT_LINE": fenetre(cumul_present, debut, rangs).astype(np.int64),
+        "NB_CREDIT_LINE_OVERDRAFT": nb_credit_line.astype(np.int64),
+    })[colonnes]
+
+
+def historique_decouvert(df_solde, seuil, compte=None, index=None, cube=None):
+    """
+    Historique de la durée moyenne de découvert et des Credit Line Overdraft
+    pour chaque mois de référence d'un compte, ou de tous les comptes si
+    ``compte`` est None
+    """
+    if compte is not None:
+        if index is not None:
+            df_solde = index.lignes_compte(compte)
+        else:
+            df_solde = df_solde[df_solde["COMPTE"] == compte]
+        agregats = cube.lignes_compte(compte) if cube is not None else agreger_mensuel(df_solde)
+        premiers = cube.premiers_jours(compte) if cube is not None else soldes_premier_jour(df_solde)
+    else:
+        agregats = cube.df if cube is not None else agreger_mensuel(df_solde, index)
+        premiers = cube.premiers_jours() if cube is not None else soldes_premier_jour(df_solde, index)
+    historique = decouvert_glissant(agregats, premiers, seuil)
+    historique.insert(1, "MOIS", mois_depuis_numero(historique["NUM_MOIS"]))
+    return historique.drop(columns=["NUM_MOIS"])
+
+
+def episodes_decouvert(comptes, a_decouvert):
+    """
+    Encodage par plages des mois à découvert.
+
+    Les tableaux sont triés par compte puis par mois ; un épisode est une
+    suite de lignes consécutives à découvert d'un même compte. Renvoie le
+    compte et la longueur (en mois) de chaque épisode.
+    """
+    comptes = np.asarray(comptes)
+    a_decouvert = np.asarray(a_decouvert, dtype=bool)
+    if not len(a_decouvert):
+        return comptes[:0], np.array([], dtype=np.int64)
+
+    nouveau_compte = np.r_[True, comptes[1:] != comptes[:-1]]
+    suite_episode = np.r_[False, a_decouvert[:-1]] & ~nouveau_compte
+    debut_episode = a_decouvert & ~suite_episode
+    numero_episode = np.cumsum(debut_episode) - 1
+    longueurs = np.bincount(numero_episode[a_decouvert], minlength=int(debut_episode.sum()))
+    return comptes[debut_episode], longueurs
+
+
+def durees_decouvert(solde_moyen_mensuel, seuil):
+    """
+    Durée moyenne et maximale des épisodes de découvert et nombre
+    d'épisodes pour chaque compte des soldes moyens mensuels
+    (colonnes COMPTE, MOIS, SOLDE_MOYEN). Un mois est à découvert lorsque
+    son solde moyen est inférieur ou égal au seuil.
+    """
+    df = solde_moyen_mensuel.sort_values(["COMPTE", "MOIS"], kind="mergesort")
+    comptes = df["COMPTE"].to_numpy()
+    a_decouvert = (df["SOLDE_MOYEN"] <= seuil).to_numpy()
+
+    comptes_uniques = np.unique(comptes)
+    comptes_episodes, longueurs = episodes_decouvert(comptes, a_decouvert)
+    position = np.searchsorted(comptes_uniques, comptes_episodes)
+
+    nb_episodes = np.bincount(position, minlength=len(comptes_uniques))
+    total_mois = np.bincount(position, weights=longueurs, minlength=len(comptes_uniques))
+    duree_max = np.zeros(len(comptes_uniques), dtype=np.int64)
+    np.maximum.at(duree_max, position, longueurs)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        duree_moyenne = np.where(nb_episodes > 0, total_mois / nb_episodes, 0.0)
+
+    return pd.DataFrame({
+        "COMPTE": comptes_uniques,
+        "NB_MOIS": np.bincount(np.searchsorted(comptes_uniques, comptes), minlength=len(comptes_uniques)),
+        "NB_MOIS_DECOUVERT": total_mois.astype(np.int64),
+        "NB_EPISODES_DECOUVERT": nb_episodes,
+        "DUREE_MOYENNE_DECOUVERT": duree_moyenne,
+        "DUREE_MAX_DECOUVERT": duree_max,
+    })
+
+
+def analyser_duree_decouvert_portefeuille(df_solde, date_position, seuil, index=None):
+    """
+    Durées de découvert de tous les comptes sur la même fenêtre que
+    ``analyser_decouvert_et_credit_line_overdraft`` (12 mois avant le mois
+    de référence).
+    """
+    debut = date_position - pd.DateOffset(months=12)
+    fin = date_position - pd.offsets.MonthBegin(1)
+
+    df = _soldes_tries(df_solde, index)
+    periode = df[(df["DATPOS"] >= debut) & (df["DATPOS"] <= fin)]
+    solde_moyen_mensuel = (
+        periode.groupby(["COMPTE", periode["DATPOS"].dt.to_period("M").rename("MOIS")])["SOLDE"]
+        .mean()
+        .rename("SOLDE_MOYEN")
+        .reset_index()
+    )
+    return durees_decouvert(solde_moyen_mensuel, seuil)
+
+
+def exporter_table(df, format_export="csv"):
+    """Sérialise une table de résultats en CSV ou en Parquet"""
+    df = df.copy()
+    for colonne in df.columns:
+        if isinstance(df[colonne].dtype, pd.PeriodDtype):
+            df[colonne] = df[colonne].astype(str)
+    if format_export == "parquet":
+        tampon = io.BytesIO()
+        df.to_parquet(tampon, index=False)
+        return tampon.getvalue()
+    return df.to_csv(index=False).encode("utf-8")
@@ -0,0 +1,117 @@
+"""
+Analyse de sensibilité d'un compte à la limite de crédit et au seuil de découvert.
+
+Au lieu de relancer l'analyse pour chaque valeur, toute une plage de
+limites (ou de seuils) est évaluée en un seul calcul : les soldes du compte
+forment un vecteur, les valeurs du paramètre un second vecteur, et la
+comparaison des deux par diffusion (broadcasting) donne une matrice
+(valeurs × jours ou valeurs × mois) réduite ensuite le long des jours ou
+des mois.
+
+- Limite de crédit : taux d'utilisation moyen et maximal et nombre de
+  jours au-delà de la limite, sur les soldes journaliers du mois analysé
+  (définition de ``calculer_usage_rate_mensuel``) ;
+- Seuil de découvert : nombre de mois à découvert, nombre d'épisodes et
+  durée moyenne des épisodes sur les 12 mois précédant le mois analysé
+  (définition de ``moyenne_duree_decouvert``).
+"""
+import numpy as np
+import pandas as pd
+
+# Nombre de valeurs évaluées par défaut sur chaque plage
+NB_POINTS_SENSIBILITE = 200
+
+
+def balayer_limites(soldes, limites):
+    """Indicateurs d'utilisation des soldes journaliers pour chaque limite de crédit (> 0)"""
+    soldes = np.asarray(soldes, dtype=np.float64)
+    limites = np.asarray(limites, dtype=np.float64)
+    if not len(soldes):
+        return pd.DataFrame(columns=["LIMITE_CREDIT", "TAUX_USAGE_MOYEN", "TAUX_USAGE_MAX",
+                                     "NB_JOURS_AU_DELA", "PART_JOURS_AU_DELA"])
+    # (limites × jours)
+    au_dela = soldes[None, :] > limites[:, None]
+    nb_jours_au_dela = au_dela.sum(axis=1)
+    return pd.DataFrame({
+        "LIMITE_CREDIT": limites,
+        "TAUX_USAGE_MOYEN": soldes.mean() / limites * 100,
+        "TAUX_USAGE_MAX": soldes.max() / limites * 100,
+        "NB_JOURS_AU_DELA": nb_jours_au_dela,
+        "PART_JOURS_AU_DELA": nb_jours_au_dela / len(soldes) * 100,
+    })
+
+
+def balayer_seuils(soldes_moyens, seuils):
+    """
+    Mois à découvert, épisodes et durée moyenne des épisodes des soldes
+    moyens mensuels (consécutifs, triés par mois) pour chaque seuil
+    """
+    soldes_moyens = np.asarray(soldes_moyens, dtype=np.float64)
+    seuils = np.asarray(seuils, dtype=np.float64)
+    # (seuils × mois) : un mois est à découvert si son solde moyen est inférieur ou égal au seuil
+    a_decouvert = soldes_moyens[None, :] <= seuils[:, None]
+    debut_episode = a_decouvert & ~np.pad(a_decouvert, ((0, 0), (1, 0)))[:, :-1]
+    nb_mois = a_decouvert.sum(axis=1)
+    nb_episodes = debut_episode.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        duree_moyenne = np.where(nb_episodes > 0, nb_mois / nb_episodes, 0.0)
+    return pd.DataFrame({
+        "SEUIL_DECOUVERT": seuils,
+        "NB_MOIS_DECOUVERT": nb_mois,
+        "NB_EPISODES_DECOUVERT": nb_episodes,
+        "DUREE_MOYENNE_DECOUVERT": duree_moyenne,
+    })
+
+
+def soldes_moyens_decouvert(df_solde, compte, date_position, index=None, cube=None):
+    """Soldes moyens mensuels du compte sur la fenêtre de découvert (12 mois avant le mois de référence)"""
+    debut = date_position - pd.DateOffset(months=12)
+    fin = date_position - pd.offsets.MonthBegin(1)
+    if cube is not None:
+        return cube.moyennes_mensuelles(compte, debut, fin)
+    if index is not None:
+        lignes = index.lignes_periode(compte, debut, fin)
+    else:
+        lignes = df_solde[(df_solde["COMPTE"] == compte) & (df_solde["DATPOS"] >= debut) & (df_solde["DATPOS"] <= fin)]
+    return (
+        lignes.groupby(["COMPTE", lignes["DATPOS"].dt.to_period("M").rename("MOIS")])["SOLDE"]
+        .mean()
+        .rename("SOLDE_MOYEN")
+        .reset_index()
+    )
+
+
+def calculer_sensibilite(df_solde, compte, annee, mois, limites, seuils, index=None, cube=None):
+    """
+    Sensibilité d'un compte pour un mois : table par limite de crédit,
+    table par seuil de découvert et valeurs de bascule (limite sous
+    laquelle le taux moyen dépasse 100 %, seuil à partir duquel un mois est
+    à découvert), None pour les parties sans données
+    """
+    if index is not None:
+        soldes_mois = index.lignes_mois(compte, annee, mois)
+    else:
+        soldes_mois = df_solde[
+            (df_solde["COMPTE"] == compte)
+            & (df_solde["DATPOS"].dt.year == annee)
+            & (df_solde["DATPOS"].dt.month == mois)
+        ]
+    soldes = soldes_mois["SOLDE"].to_numpy(dtype=np.float64)
+    limites = np.asarray(limites, dtype=np.float64)
+    limites = limites[limites > 0]
+
+    date_position = pd.Timestamp(year=annee, month=mois, day=1)
+    soldes_moyens = soldes_moyens_decouvert(df_solde, compte, date_position, index=index, cube=cube)
+    soldes_moyens = soldes_moyens.sort_values("MOIS")["SOLDE_MOYEN"].to_numpy(dtype=np.float64)
+
+    return {
+        "LIMITES": balayer_limites(soldes, limites) if len(soldes) and len(limites) else None,
+        "SEUILS": balayer_seuils(soldes_moyens, seuils) if len(soldes_moyens) else None,
+        # Le taux moyen vaut 100 % lorsque la limite est égale au solde moyen ; aucune
+        # limite positive ne convient à un solde moyen négatif ou nul
+        "LIMITE_100": soldes.mean() if len(soldes) and soldes.mean() > 0 else None,
+        # Le premier mois à découvert apparaît lorsque le seuil atteint le plus faible solde moyen
+        "SEUIL_PREMIER_DECOUVERT": soldes_moyens.min() if len(soldes_moyens) else None,
+        "NB_JOURS": len(soldes),
+        "NB_MOIS": len(soldes_moyens),
+    }
@@ -0,0 +1,375 @@
+"""
+Service HTTP des indicateurs, sur des données chargées une fois en mémoire.
+
+Les soldes et les mouvements (fichiers ou entrepôt local) sont lus au
+démarrage et gardés indexés en mémoire (``DonneesPartagees`` : index par
+compte, cube mensuel, cumul des crédits). Chaque requête calcule ses
+indicateurs avec ``calculer_metriques_compte``, la fonction utilisée par
+l'interface et par cli.py, sur ces données en lecture seule : les requêtes
+sont servies en parallèle par un fil d'exécution chacune, sans copie.
+
+Routes (réponses JSON, valeurs manquantes à null) :
+
+    GET  /sante                 état du service, volumes chargés, cache
+    GET  /comptes               liste des comptes des soldes
+    GET  /metriques?compte=1001&periode=2024-01:2024-03&limite_credit=1000000&seuil_decouvert=0
+    POST /metriques/lot         {"comptes": [1001, 1002], "periode": "2024-03",
+                                 "limite_credit": 1000000, "seuil_decouvert": 0}
+    POST /recharger             relit les fichiers ou l'entrepôt
+
+Sans ``comptes``, un lot porte sur tous les comptes. Les résultats d'un
+(compte, mois, limite, seuil) sont conservés dans un cache LRU ; le
+rechargement remplace les données d'un bloc, les requêtes en cours
+finissant sur les anciennes.
+
+Exemple :
+    python service.py --soldes soldes.parquet --mouvements mvt.parquet --port 8502
+    python charge_service.py --url http://127.0.0.1:8502 --requetes 2000 --concurrence 16
+"""
+import argparse
+import json
+import math
+import sys
+import threading
+import time
+from datetime import datetime
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+
+from cache_fichiers import empreinte_contenu
+from cache_resultats import CacheResultats
+from calculs import calculer_metriques_compte, lire_mouvements, lire_soldes
+from cli import lire_periodes
+from donnees_partagees import DonneesPartagees
+from entrepot import Entrepot
+
+PORT_SERVICE = 8502
+
+# Résultats (compte, mois) conservés : quelques centaines d'octets chacun
+TAILLE_CACHE_SERVICE = 50_000
+
+# Nombre maximal de résultats (comptes × mois) d'une requête
+MAX_RESULTATS_REQUETE = 100_000
+
+# Taille maximale du corps d'une requête POST
+TAILLE_MAX_CORPS = 10 * 1024 * 1024
+
+
+def _valeur_json(valeur):
+    """Valeur sérialisable en JSON : types numpy convertis, NaN et valeurs manquantes à None"""
+    if isinstance(valeur, np.generic):
+        valeur = valeur.item()
+    if valeur is None or valeur is pd.NA or valeur is pd.NaT:
+        return None
+    if isinstance(valeur, float) and not math.isfinite(valeur):
+        return None
+    if isinstance(valeur, pd.Timestamp):
+        return valeur.isoformat()
+    return valeur
+
+
+def _nombre(parametres, nom, type_nombre=float):
+    """Paramètre numérique facultatif d'une requête, None s'il est absent"""
+    valeur = parametres.get(nom)
+    if valeur is None or valeur == "":
+        return None
+    try:
+        return type_nombre(valeur)
+    except (TypeError, ValueError):
+        raise ValueError(f"paramètre '{nom}' invalide : {valeur!r}")
+
+
+def _periodes(parametres):
+    """Mois demandés ('AAAA-MM' ou 'AAAA-MM:AAAA-MM'), obligatoires"""
+    if not parametres.get("periode"):
+        raise ValueError("paramètre 'periode' manquant (AAAA-MM ou AAAA-MM:AAAA-MM)")
+    try:
+        return lire_periodes(str(parametres["periode"]))
+    except argparse.ArgumentTypeError as e:
+        raise ValueError(str(e))
+
+
+class ServiceMetriques:
+    """Données indexées gardées en mémoire et cache des indicateurs, partagés par toutes les requêtes"""
+
+    def __init__(self, charger, taille_cache=TAILLE_CACHE_SERVICE):
+        """``charger`` : fonction sans argument renvoyant (DonneesPartagees soldes, mouvements ou None)"""
+        self._charger = charger
+        self._verrou_chargement = threading.Lock()
+        self._verrou_compteurs = threading.Lock()
+        self.cache = CacheResultats(taille_cache)
+        self.nb_requetes = 0
+        self.nb_erreurs = 0
+        self.demarre_le = datetime.now()
+        self.recharger()
+
+    def recharger(self):
+        """Relit les données puis les substitue d'un bloc aux précédentes"""
+        with self._verrou_chargement:
+            debut = time.perf_counter()
+            donnees_solde, donnees_mvt = self._charger()
+            if donnees_solde is None:
+                raise ValueError("aucun solde à servir")
+            # Une seule affectation : une requête voit les anciennes données ou les nouvelles, jamais un mélange
+            self.donnees = (donnees_solde, donnees_mvt)
+            self.charge_le = datetime.now()
+            self.duree_chargement = time.perf_counter() - debut
+            self.cache.vider()
+
+    def compter(self, erreur=False):
+        with self._verrou_compteurs:
+            self.nb_requetes += 1
+            self.nb_erreurs += int(erreur)
+
+    def sante(self):
+        """État du service : volumes chargés, mémoire des données, requêtes et cache"""
+        donnees_solde, donnees_mvt = self.donnees
+        taux_succes = self.cache.taux_succes()
+        return {
+            "STATUT": "ok",
+            "DEMARRE_LE": self.demarre_le.isoformat(timespec="seconds"),
+            "CHARGE_LE": self.charge_le.isoformat(timespec="seconds"),
+            "DUREE_CHARGEMENT": round(self.duree_chargement, 3),
+            "NB_COMPTES": len(donnees_solde.index.comptes),
+            "LIGNES_SOLDES": len(donnees_solde),
+            "LIGNES_MOUVEMENTS": len(donnees_mvt) if donnees_mvt is not None else 0,
+            "MEMOIRE_OCTETS": sum(d.taille_octets for d in self.donnees if d is not None),
+            "NB_REQUETES": self.nb_requetes,
+            "NB_ERREURS": self.nb_erreurs,
+            "CACHE_ENTREES": len(self.cache),
+            "CACHE_TAUX_SUCCES": round(taux_succes, 4) if taux_succes is not None else None,
+        }
+
+    def comptes(self):
+        donnees_solde, _ = self.donnees
+        return [_valeur_json(compte) for compte in donnees_solde.index.comptes]
+
+    def metriques(self, comptes, periodes, limite_credit=None, seuil_decouvert=None):
+        """
+        Indicateurs de ``calculer_metriques_compte`` pour chaque compte connu
+        et chaque mois (tous les comptes si ``comptes`` vaut None), et liste
+        des comptes absents des soldes
+        """
+        donnees_solde, donnees_mvt = self.donnees
+        index_solde = donnees_solde.index
+        if comptes is None:
+            comptes = index_solde.comptes.tolist()
+        connus, inconnus = [], []
+        for compte in comptes:
+            (connus if index_solde.plage(compte)[1] > 0 else inconnus).append(compte)
+        if len(connus) * len(periodes) > MAX_RESULTATS_REQUETE:
+            raise ValueError(f"{len(connus) * len(periodes)} résultats demandés, "
+                             f"au plus {MAX_RESULTATS_REQUETE} par requête")
+
+        df_mvt = donnees_mvt.df if donnees_mvt is not None else None
+        index_mvt = donnees_mvt.index if donnees_mvt is not None else None
+        credits = donnees_mvt.credits if donnees_mvt is not None else None
+        empreintes = (donnees_solde.empreinte, donnees_mvt.empreinte if donnees_mvt is not None else None)
+        resultats = []
+        for compte in connus:
+            for annee, mois in periodes:
+                cle = (empreintes, "metriques", compte, annee, mois, limite_credit, seuil_decouvert)
+                resultat = self.cache.obtenir(cle)
+                if resultat is None:
+                    resultat = calculer_metriques_compte(
+                        donnees_solde.df, df_mvt, compte, annee, mois,
+                        limite_credit=limite_credit, seuil_decouvert=seuil_decouvert,
+                        index_solde=index_solde, index_mvt=index_mvt, cube=donnees_solde.cube, credits=credits
+                    )
+                    resultat = {nom: _valeur_json(valeur) for nom, valeur in resultat.items()}
+                    self.cache.enregistrer(cle, resultat)
+                resultats.append(resultat)
+        return resultats, inconnus
+
+
+# --- Serveur HTTP ---
+class GestionnaireRequetes(BaseHTTPRequestHandler):
+    """Routes du service ; le service est porté par le serveur (``self.server.service``)"""
+
+    protocol_version = "HTTP/1.1"
+    server_version = "BOAService/1.0"
+    # En-têtes et corps partent en deux écritures : sans TCP_NODELAY, chaque réponse attendrait l'accusé différé
+    disable_nagle_algorithm = True
+
+    def _repondre(self, statut, contenu):
+        corps = json.dumps(contenu, ensure_ascii=False).encode("utf-8")
+        self.send_response(statut)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(corps)))
+        if statut >= 400:
+            # Le corps de la requête n'a peut-être pas été lu : la connexion n'est pas réutilisée
+            self.send_header("Connection", "close")
+            self.close_connection = True
+        self.end_headers()
+        self.wfile.write(corps)
+
+    def _corps_json(self):
+        taille = int(self.headers.get("Content-Length") or 0)
+        if taille > TAILLE_MAX_CORPS:
+            raise ValueError(f"corps de requête trop volumineux ({taille} octets)")
+        if taille == 0:
+            return {}
+        try:
+            corps = json.loads(self.rfile.read(taille))
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
+            raise ValueError(f"corps JSON invalide : {e}")
+        if not isinstance(corps, dict):
+            raise ValueError("le corps JSON doit être un objet")
+        return corps
+
+    def _traiter(self, routes):
+        service = self.server.service
+        url = urlsplit(self.path)
+        route = routes.get(url.path.rstrip("/") or "/")
+        if route is None:
+            service.compter(erreur=True)
+            self._repondre(404, {"ERREUR": f"route inconnue : {self.command} {url.path}"})
+            return
+        debut = time.perf_counter()
+        try:
+            statut, contenu = route(service, url)
+        except ValueError as e:
+            statut, contenu = 400, {"ERREUR": str(e)}
+        except Exception as e:
+            statut, contenu = 500, {"ERREUR": f"{type(e).__name__} : {e}"}
+        service.compter(erreur=statut >= 400)
+        if statut < 400:
+            contenu["SECONDES"] = round(time.perf_counter() - debut, 6)
+        self._repondre(statut, contenu)
+
+    def do_GET(self):
+        self._traiter({
+            "/sante": lambda service, url: (200, service.sante()),
+            "/comptes": lambda service, url: (200, {"COMPTES": service.comptes()}),
+            "/metriques": self._metriques_compte,
+        })
+
+    def do_POST(self):
+        self._traiter({
+            "/metriques/lot": self._metriques_lot,
+            "/recharger": self._recharger,
+        })
+
+    def _metriques_compte(self, service, url):
+        parametres = {nom: valeurs[-1] for nom, valeurs in parse_qs(url.query).items()}
+        compte = _nombre(parametres, "compte", int)
+        if compte is None:
+            raise ValueError("paramètre 'compte' manquant")
+        resultats, inconnus = service.metriques(
+            [compte], _periodes(parametres),
+            limite_credit=_nombre(parametres, "limite_credit"), seuil_decouvert=_nombre(parametres, "seuil_decouvert")
+        )
+        if inconnus:
+            return 404, {"ERREUR": f"compte inconnu : {compte}"}
+        return 200, {"RESULTATS": resultats}
+
+    def _metriques_lot(self, service, url):
+        parametres = self._corps_json()
+        comptes = parametres.get("comptes")
+        if comptes is not None:
+            if not isinstance(comptes, list):
+                raise ValueError("'comptes' doit être une liste de numéros de compte")
+            try:
+                comptes = list(dict.fromkeys(int(compte) for compte in comptes))
+            except (TypeError, ValueError):
+                raise ValueError("'comptes' doit être une liste de numéros de compte")
+        resultats, inconnus = service.metriques(
+            comptes, _periodes(parametres),
+            limite_credit=_nombre(parametres, "limite_credit"), seuil_decouvert=_nombre(parametres, "seuil_decouvert")
+        )
+        return 200, {"NB_RESULTATS": len(resultats), "COMPTES_INCONNUS": inconnus, "RESULTATS": resultats}
+
+    def _recharger(self, service, url):
+        service.recharger()
+        return 200, service.sante()
+
+    def log_message(self, format, *args):
+        if self.server.journal:
+            super().log_message(format, *args)
+
+
+class ServeurMetriques(ThreadingHTTPServer):
+    """Serveur HTTP multi-fils, un fil par connexion"""
+
+    daemon_threads = True
+    # File d'attente des connexions : celle par défaut (5) refuse les rafales de clients simultanés
+    request_queue_size = 128
+
+
+def creer_serveur(service, hote="127.0.0.1", port=PORT_SERVICE, journal=False):
+    """Serveur HTTP qui répond avec le service donné"""
+    serveur = ServeurMetriques((hote, port), GestionnaireRequetes)
+    serveur.service = service
+    serveur.journal = journal
+    return serveur
+
+
+def chargeur_fichiers(soldes, mouvements=None, par_blocs=False, compacte=False):
+    """Fonction de chargement des fichiers de soldes et de mouvements, relus à chaque appel"""
+    def charger():
+        df_solde = lire_soldes(soldes)
+        donnees_solde = DonneesPartagees(df_solde, "DATPOS", empreinte_contenu(soldes), avec_cube=True,
+                                         compacte=compacte)
+        donnees_mvt = None
+        if mouvements:
+            df_mvt = lire_mouvements(mouvements, par_blocs=par_blocs)
+            donnees_mvt = DonneesPartagees(df_mvt, "DATOPER", empreinte_contenu(mouvements), compacte=compacte,
+                                           avec_credits=True)
+        return donnees_solde, donnees_mvt
+    return charger
+
+
+def construire_parser():
+    parser = argparse.ArgumentParser(
+        description="Service HTTP des indicateurs BOA (taux d'utilisation, turnover routed, découvert) "
+                    "sur des données gardées en mémoire"
+    )
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--soldes", help="Fichier des soldes journaliers (Excel, CSV ou Parquet)")
+    source.add_argument("--entrepot", help="Répertoire de l'entrepôt local (à la place des fichiers)")
+    parser.add_argument("--mouvements", help="Fichier des mouvements, Excel, CSV ou Parquet (optionnel)")
+    parser.add_argument("--par-blocs", action="store_true",
+                        help="Ne lire que les colonnes utiles des mouvements (par blocs pour les .xlsx)")
+    parser.add_argument("--compacte", action="store_true", help="Compacter les données chargées en mémoire")
+    parser.add_argument("--hote", default="127.0.0.1", help="Adresse d'écoute (défaut : 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=PORT_SERVICE, help=f"Port d'écoute (défaut : {PORT_SERVICE})")
+    parser.add_argument("--taille-cache", type=int, default=TAILLE_CACHE_SERVICE,
+                        help="Nombre de résultats (compte, mois) conservés en cache")
+    parser.add_argument("--journal", action="store_true", help="Afficher chaque requête sur la sortie d'erreur")
+    return parser
+
+
+def main(argv=None):
+    args = construire_parser().parse_args(argv)
+    if args.entrepot:
+        entrepot = Entrepot(args.entrepot)
+        charger = partial(entrepot.charger, compacte=args.compacte)
+    else:
+        charger = chargeur_fichiers(args.soldes, args.mouvements, par_blocs=args.par_blocs, compacte=args.compacte)
+
+    try:
+        service = ServiceMetriques(charger, taille_cache=args.taille_cache)
+    except Exception as e:
+        print(f"Erreur de chargement : {e}", file=sys.stderr)
+        return 1
+    etat = service.sante()
+    print(f"{etat['NB_COMPTES']} comptes chargés en {etat['DUREE_CHARGEMENT']:.1f}s "
+          f"({etat['LIGNES_SOLDES']} soldes, {etat['LIGNES_MOUVEMENTS']} mouvements)", file=sys.stderr)
+
+    serveur = creer_serveur(service, args.hote, args.port, journal=args.journal)
+    print(f"Service à l'écoute sur http://{args.hote}:{args.port}", file=sys.stderr)
+    try:
+        serveur.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        serveur.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+"""
+Alertes du portefeuille (alertes.py) comparées aux calculs par compte.
+
+Chaque règle est recalculée compte par compte avec les fonctions de
+calculs.py (``calculer_usage_rate_mensuel`` sur les soldes du mois,
+``analyser_decouvert_et_credit_line_overdraft`` sur les fenêtres de 12
+mois) ; les comptes en alerte, leurs indicateurs et leur classement
+doivent être ceux de ``scanner_alertes``, sans index, avec l'index par
+compte et avec le cube mensuel, pour une limite unique ou par compte.
+
+    python -m pytest -q test_alertes.py
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from alertes import COLONNES_ALERTES, scanner_alertes
+from calculs import (
+    analyser_decouvert_et_credit_line_overdraft,
+    calculer_usage_rate_mensuel,
+    filtrer_par_compte_mois_annee,
+)
+from cube_mensuel import CubeMensuel
+from generateur import generer_soldes
+from index_comptes import IndexComptes
+
+SEUIL = 0.0
+PERIODES = [(2024, 3), (2024, 6), (2024, 10)]
+REGLES = {"taux_usage": 100.0, "jours_au_dela": 5, "duree_decouvert": 2.0, "sans_credit_line": True}
+
+
+@pytest.fixture(scope="module")
+def soldes():
+    """
+    Soldes lacunaires de 10 comptes, dont un à découvert sans position en
+    juin 2024, et d'un compte en baisse continue (aucun Credit Line Overdraft)
+    """
+    rng = np.random.default_rng(22)
+    df = generer_soldes(10, "2023-01-01", "2024-12-31", graine=22, taux_decouvert=0.5)
+    dates = np.sort(df["DATPOS"].unique())
+    en_baisse = pd.DataFrame({"COMPTE": df["COMPTE"].max() + 1, "DATPOS": dates,
+                              "SOLDE": np.linspace(1_000_000, -3_000_000, len(dates)).round()})
+    df = pd.concat([df, en_baisse.astype(df.dtypes.to_dict())], ignore_index=True)
+    df = df[rng.random(len(df)) > 0.3]
+    comptes = np.sort(df["COMPTE"].unique())
+    df = df[~(df["COMPTE"].isin(comptes[:3]) & df["DATPOS"].dt.month.isin([2, 7]))]
+    return df[~((df["COMPTE"] == comptes[6]) & (df["DATPOS"].dt.to_period("M") == pd.Period("2024-06")))]
+
+
+@pytest.fixture(scope="module")
+def sources(soldes):
+    index = IndexComptes(soldes, "DATPOS")
+    return {"sans_index": {}, "index": {"index": index}, "cube": {"index": index, "cube": CubeMensuel(index)}}
+
+
+def _limites(soldes):
+    """Limite par compte, dont une nulle, une négative et un compte sans limite"""
+    comptes = np.sort(soldes["COMPTE"].unique())
+    valeurs = [4e6, 1e6, 2e6, 5e5, 9e6, 0.0, 1e6, -1.0, 3e5]
+    return pd.Series(valeurs, index=comptes[:len(valeurs)])
+
+
+def _episodes(a_decouvert):
+    a_decouvert = np.asarray(a_decouvert, dtype=bool)
+    return int((a_decouvert & ~np.r_[False, a_decouvert[:-1]]).sum())
+
+
+def _scan_par_compte(soldes, annee, mois, limite_credit, seuil, taux_usage, jours_au_dela, duree_decouvert,
+                     sans_credit_line):
+    """Règles évaluées compte par compte, puis classement de ``scanner_alertes``"""
+    date_position = pd.Timestamp(year=annee, month=mois, day=1)
+    lignes = []
+    for compte in np.sort(soldes["COMPTE"].unique()):
+        limite = limite_credit.get(compte, np.nan) if isinstance(limite_credit, pd.Series) else limite_credit
+        limite = limite if limite > 0 else np.nan
+        soldes_mois, _ = filtrer_par_compte_mois_annee(soldes, None, compte, annee, mois)
+        taux_moyen, df_usage = calculer_usage_rate_mensuel(soldes_mois, limite)
+        duree, solde_decouvert, solde_complet, nb_credit_line = analyser_decouvert_et_credit_line_overdraft(
+            soldes, compte, date_position, seuil
+        )
+        solde_decouvert = solde_decouvert.sort_values("MOIS")
+        lignes.append({
+            "COMPTE": compte,
+            "TAUX_USAGE_MOYEN": taux_moyen if df_usage is not None else np.nan,
+            "TAUX_USAGE_MAX": df_usage["TAUX_USAGE"].max() if df_usage is not None else np.nan,
+            "NB_JOURS": len(soldes_mois) if len(soldes_mois) else np.nan,
+            "NB_JOURS_AU_DELA": (soldes_mois["SOLDE"] > limite).sum() if len(soldes_mois) else np.nan,
+            "DUREE_MOYENNE_DECOUVERT": duree,
+            "NB_EPISODES_DECOUVERT": _episodes(solde_decouvert["A_DECOUVERT"]),
+            "NB_MOIS_FENETRE_CREDIT_LINE": len(solde_complet) if solde_complet is not None else 0,
+            "NB_CREDIT_LINE_OVERDRAFT": nb_credit_line,
+        })
+    scan = pd.DataFrame(lignes)
+    scan["ALERTE_USAGE"] = scan["TAUX_USAGE_MOYEN"] > taux_usage if taux_usage is not None else False
+    scan["ALERTE_JOURS_AU_DELA"] = scan["NB_JOURS_AU_DELA"] > jours_au_dela if jours_au_dela is not None else False
+    scan["ALERTE_DECOUVERT"] = scan["DUREE_MOYENNE_DECOUVERT"] > duree_decouvert \
+        if duree_decouvert is not None else False
+    scan["ALERTE_CREDIT_LINE"] = (
+        (scan["NB_MOIS_FENETRE_CREDIT_LINE"] >= 2) & (scan["NB_CREDIT_LINE_OVERDRAFT"] == 0) & sans_credit_line
+    )
+    alertes = ["ALERTE_USAGE", "ALERTE_JOURS_AU_DELA", "ALERTE_DECOUVERT", "ALERTE_CREDIT_LINE"]
+    scan["NB_ALERTES"] = scan[alertes].sum(axis=1)
+    scan = scan[scan["NB_ALERTES"] > 0].sort_values(
+        ["NB_ALERTES", "TAUX_USAGE_MOYEN", "DUREE_MOYENNE_DECOUVERT", "NB_JOURS_AU_DELA", "COMPTE"],
+        ascending=[False, False, False, False, True], na_position="last", kind="mergesort"
+    )
+    scan["RANG"] = np.arange(1, len(scan) + 1)
+    return scan[COLONNES_ALERTES].reset_index(drop=True)
+
+
+def _comparer(scan, attendu):
+    colonnes = [c for c in COLONNES_ALERTES if not c.startswith("ALERTE_")]
+    pd.testing.assert_frame_equal(scan[colonnes].astype(np.float64), attendu[colonnes].astype(np.float64))
+    alertes = [c for c in COLONNES_ALERTES if c.startswith("ALERTE_")]
+    pd.testing.assert_frame_equal(scan[alertes].astype(bool), attendu[alertes].astype(bool))
+
+
+@pytest.mark.parametrize("variante", ["sans_index", "index", "cube"])
+@pytest.mark.parametrize("limite", ["unique", "par_compte"])
+def test_classement_egal_aux_calculs_par_compte(soldes, sources, variante, limite):
+    limite_credit = 3_000_000.0 if limite == "unique" else _limites(soldes)
+    nb_alertes = 0
+    for annee, mois in PERIODES:
+        scan = scanner_alertes(soldes, annee, mois, limite_credit, SEUIL, **REGLES, **sources[variante])
+        attendu = _scan_par_compte(soldes, annee, mois, limite_credit, SEUIL, **REGLES)
+        _comparer(scan, attendu)
+        nb_alertes += len(scan)
+        assert scan["NB_ALERTES"].is_monotonic_decreasing
+    assert nb_alertes > 10
+    assert scan[[c for c in COLONNES_ALERTES if c.startswith("ALERTE_")]].any().all()
+
+
+def test_regles_desactivees(soldes, sources):
+    """Une règle dont le paramètre vaut None n'est jamais déclenchée"""
+    regles = {"taux_usage": None, "jours_au_dela": 5, "duree_decouvert": None, "sans_credit_line": False}
+    scan = scanner_alertes(soldes, 2024, 6, 3_000_000.0, SEUIL, **regles, **sources["index"])
+    attendu = _scan_par_compte(soldes, 2024, 6, 3_000_000.0, SEUIL, **regles)
+    _comparer(scan, attendu)
+    assert not scan[["ALERTE_USAGE", "ALERTE_DECOUVERT", "ALERTE_CREDIT_LINE"]].any().any()
+    assert len(scan) and scan["ALERTE_JOURS_AU_DELA"].all()
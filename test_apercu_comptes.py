@@ -0,0 +1,172 @@
+"""
+Lecture des colonnes COMPTE et date de l'aperçu (apercu_comptes.py)
+comparée à ``pd.read_excel`` sur des classeurs .xlsx aux variantes du
+format : chaînes partagées ou en ligne, calendrier 1904, formules, cellules
+et lignes sans référence ``r``, lignes vides.
+
+    python -m pytest -q test_apercu_comptes.py
+"""
+import datetime
+import re
+import zipfile
+
+import numpy as np
+import openpyxl
+import pandas as pd
+import pytest
+import xlsxwriter
+
+from apercu_comptes import lire_apercu, lire_colonnes, lire_colonnes_xlsx, resumer_comptes
+
+FEUILLE = "xl/worksheets/sheet1.xml"
+CHAINES = "xl/sharedStrings.xml"
+
+
+def _lignes(nb_lignes=40):
+    """Lignes LIBELLE / COMPTE / SOLDE / DATPOS tirées au hasard"""
+    rng = np.random.default_rng(3)
+    return [
+        (f"ligne {i}", 10000000 + int(rng.integers(0, 5)), int(rng.integers(-1e6, 1e6)),
+         datetime.datetime(2024, 1, 1) + datetime.timedelta(days=int(rng.integers(0, 365))))
+        for i in range(nb_lignes)
+    ]
+
+
+def _classeur(chemin, comptes_texte=False, date1904=False, formules=False, nb_lignes=40):
+    """Classeur écrit par xlsxwriter : textes en chaînes partagées, comptes en texte ou en formules si demandé"""
+    classeur = xlsxwriter.Workbook(str(chemin), {"date_1904": date1904})
+    feuille = classeur.add_worksheet()
+    format_date = classeur.add_format({"num_format": "yyyy-mm-dd"})
+    feuille.write_row(0, 0, ["LIBELLE", "COMPTE", "SOLDE", "DATPOS"])
+    for i, (libelle, compte, solde, date) in enumerate(_lignes(nb_lignes), start=1):
+        feuille.write_string(i, 0, libelle)
+        if formules:
+            feuille.write_formula(i, 1, f"={compte - 1}+1", None, compte)
+        elif comptes_texte:
+            feuille.write_string(i, 1, str(compte))
+        else:
+            feuille.write_number(i, 1, compte)
+        feuille.write_number(i, 2, solde)
+        feuille.write_datetime(i, 3, date, format_date)
+    classeur.close()
+    return chemin
+
+
+def _reecrire(chemin, transformation, partie=FEUILLE):
+    """Réécrit une partie XML du classeur après transformation de son contenu"""
+    with zipfile.ZipFile(chemin) as archive:
+        parties = {nom: archive.read(nom) for nom in archive.namelist()}
+    parties[partie] = transformation(parties[partie].decode("utf-8")).encode("utf-8")
+    with zipfile.ZipFile(chemin, "w", zipfile.ZIP_DEFLATED) as archive:
+        for nom, contenu in parties.items():
+            archive.writestr(nom, contenu)
+    return chemin
+
+
+def _partie(chemin, partie=FEUILLE):
+    with zipfile.ZipFile(chemin) as archive:
+        return archive.read(partie).decode("utf-8")
+
+
+def _comparer(chemin):
+    """Mêmes comptes et mêmes dates que pd.read_excel, lignes vides exclues"""
+    lu = lire_colonnes_xlsx(chemin, "DATPOS")
+    attendu = pd.read_excel(chemin, usecols=["COMPTE", "DATPOS"])
+    lu = lu[lu["COMPTE"].notna() | lu["DATPOS"].notna()].reset_index(drop=True)
+    attendu = attendu[attendu["COMPTE"].notna() | attendu["DATPOS"].notna()].reset_index(drop=True)
+    assert len(lu) == len(attendu) > 0
+    np.testing.assert_array_equal(lu["COMPTE"].to_numpy(), pd.to_numeric(attendu["COMPTE"]).to_numpy(dtype=float))
+    np.testing.assert_array_equal(lu["DATPOS"].to_numpy(dtype="datetime64[s]"),
+                                  pd.to_datetime(attendu["DATPOS"]).to_numpy(dtype="datetime64[s]"))
+
+
+def test_chaines_partagees(tmp_path):
+    chemin = _classeur(tmp_path / "partagees.xlsx", comptes_texte=True)
+    assert 't="s"' in _partie(chemin)
+    _comparer(chemin)
+
+
+def test_chaines_en_ligne(tmp_path):
+    """openpyxl écrit les textes en chaînes en ligne (<is>)"""
+    chemin = tmp_path / "en_ligne.xlsx"
+    classeur = openpyxl.Workbook()
+    classeur.active.append(["LIBELLE", "COMPTE", "SOLDE", "DATPOS"])
+    for libelle, compte, solde, date in _lignes():
+        classeur.active.append([libelle, str(compte), solde, date])
+    classeur.save(chemin)
+    assert "inlineStr" in _partie(chemin)
+    _comparer(chemin)
+
+
+def test_chaine_partagee_vide(tmp_path):
+    """Une chaîne partagée vide (<si/>) ne décale pas les suivantes"""
+    chemin = _classeur(tmp_path / "vide.xlsx", comptes_texte=True)
+    _reecrire(chemin, lambda xml: re.sub(r"(<sst\b[^>]*>)", r"\1<si/>", xml), CHAINES)
+    _reecrire(chemin, lambda xml: re.sub(
+        r'(t="s"><v>)(\d+)(</v>)', lambda m: f"{m.group(1)}{int(m.group(2)) + 1}{m.group(3)}", xml
+    ))
+    assert "<si/>" in _partie(chemin, CHAINES)
+    _comparer(chemin)
+
+
+def test_chaines_avec_phonetique(tmp_path):
+    """Les indications phonétiques (<rPh>) ne font pas partie du texte"""
+    chemin = _classeur(tmp_path / "phonetique.xlsx", comptes_texte=True)
+    _reecrire(chemin, lambda xml: re.sub(
+        r"<si><t>(\d+)</t></si>", r'<si><t>\1</t><rPh sb="0" eb="1"><t>9</t></rPh></si>', xml
+    ), CHAINES)
+    assert "<rPh" in _partie(chemin, CHAINES)
+    _comparer(chemin)
+
+
+def test_calendrier_1904(tmp_path):
+    chemin = _classeur(tmp_path / "1904.xlsx", date1904=True)
+    assert "date1904" in _partie(chemin, "xl/workbook.xml")
+    _comparer(chemin)
+
+
+def test_formules(tmp_path):
+    """Cellules calculées : la valeur en cache de la formule est lue"""
+    chemin = _classeur(tmp_path / "formules.xlsx", formules=True)
+    assert "<f>" in _partie(chemin)
+    _comparer(chemin)
+
+
+def test_cellules_sans_reference(tmp_path):
+    """L'attribut r des cellules et des lignes est facultatif"""
+    chemin = _classeur(tmp_path / "sans_r.xlsx", comptes_texte=True)
+    _reecrire(chemin, lambda xml: re.sub(r'(<(?:c|row)\b[^>]*?) r="[A-Z]*\d+"', r"\1", xml))
+    assert not re.search(r'<c [^>]*\br="', _partie(chemin))
+    _comparer(chemin)
+
+
+def test_lignes_vides(tmp_path):
+    """Lignes vides auto-fermantes (<row/>) au milieu des données, dimension déclarée trop courte"""
+    chemin = _classeur(tmp_path / "lignes_vides.xlsx")
+
+    def inserer(xml):
+        decaler = {str(numero): str(numero + (numero > 5) + (numero > 20)) for numero in range(1, 100)}
+        xml = re.sub(r'(<row r=")(\d+)"', lambda m: f'{m.group(1)}{decaler[m.group(2)]}"', xml)
+        xml = re.sub(r'(<c r="[A-Z]+)(\d+)"', lambda m: f'{m.group(1)}{decaler[m.group(2)]}"', xml)
+        return xml.replace('<row r="7"', '<row r="6"/><row r="7"', 1).replace('<row r="23"', '<row r="22"/><row r="23"', 1)
+
+    _reecrire(chemin, inserer)
+    assert '<row r="6"/>' in _partie(chemin)
+    _comparer(chemin)
+
+
+def test_colonne_absente(tmp_path):
+    chemin = _classeur(tmp_path / "absente.xlsx")
+    with pytest.raises(ValueError, match="DATOPER"):
+        lire_colonnes_xlsx(chemin, "DATOPER")
+
+
+def test_apercu(tmp_path):
+    chemin = _classeur(tmp_path / "apercu.xlsx", nb_lignes=200)
+    par_compte = pd.read_excel(chemin).groupby("COMPTE")["DATPOS"].agg(["size", "min", "max"])
+    apercu = resumer_comptes(lire_colonnes(str(chemin), "DATPOS"), "DATPOS")
+    assert apercu["COMPTE"].tolist() == par_compte.index.tolist()
+    assert apercu["NB_LIGNES"].tolist() == par_compte["size"].tolist()
+    assert (apercu["DATE_MIN"].to_numpy() == par_compte["min"].to_numpy()).all()
+    assert (apercu["DATE_MAX"].to_numpy() == par_compte["max"].to_numpy()).all()
+    pd.testing.assert_frame_equal(lire_apercu(str(chemin), "DATPOS"), apercu)
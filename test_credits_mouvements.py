@@ -0,0 +1,106 @@
+"""
+Crédits cumulés des mouvements (credits_mouvements.py) comparés à un
+filtrage direct du DataFrame des mouvements.
+
+Les fenêtres sont bornées par deux recherches dichotomiques dans les dates
+de chaque compte et les totaux lus comme différences du cumul : sur des
+mouvements lacunaires, avec des opérations horodatées aux bornes des mois
+et des montants entiers, décimaux ou manquants, chaque fenêtre doit donner
+le total et le nombre des crédits (MNTDEV > 0) filtrés par pandas.
+
+    python -m pytest -q test_credits_mouvements.py
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from calculs import calculer_turnover_routed_depuis_solde
+from credits_mouvements import IndexCredits, fenetre_turnover, turnover_mouvements
+from generateur import generer_mouvements, generer_soldes
+from index_comptes import IndexComptes
+
+PERIODES = [(2023, 1), (2023, 2), (2023, 12), (2024, 1), (2024, 3), (2024, 6)]
+
+
+@pytest.fixture(scope="module")
+def mouvements():
+    """Mouvements lacunaires avec des opérations au premier et au dernier instant des mois"""
+    rng = np.random.default_rng(23)
+    df = generer_mouvements(6, 3_000, "2023-01-01", "2024-06-30", graine=23)
+    comptes = np.sort(df["COMPTE"].unique())
+    # Mois sans mouvement et compte sans opération avant 2024
+    df = df[~(df["COMPTE"].isin(comptes[:2]) & df["DATOPER"].dt.month.isin([1, 5, 12]))]
+    df = df[~((df["COMPTE"] == comptes[2]) & (df["DATOPER"] < "2024-01-01"))]
+    bornes = pd.to_datetime(["2023-11-30 23:59:59.999999999", "2023-12-01", "2024-01-31 23:59:59",
+                             "2024-02-01 00:00:00", "2024-03-31 18:00", "2022-12-31 23:00"], format="ISO8601")
+    aux_bornes = pd.DataFrame({
+        "COMPTE": rng.choice(comptes, 40),
+        "DATOPER": rng.choice(bornes, 40),
+        "MNTDEV": rng.integers(-500_000, 500_000, 40),
+    })
+    return pd.concat([df, aux_bornes], ignore_index=True)[["COMPTE", "DATOPER", "MNTDEV"]]
+
+
+def _montants(df, type_montant):
+    df = df.copy()
+    if type_montant == "manquants":
+        df["MNTDEV"] = df["MNTDEV"].astype(np.float64)
+        df.loc[df.index[::17], "MNTDEV"] = np.nan
+    else:
+        df["MNTDEV"] = df["MNTDEV"].astype(type_montant)
+    return df
+
+
+def _reference(df, compte, debut, fin):
+    """Total et nombre des crédits du compte entre début et fin inclus, par filtrage"""
+    lignes = df[(df["COMPTE"] == compte) & (df["DATOPER"] >= debut) & (df["DATOPER"] <= fin)]
+    credits = lignes.loc[lignes["MNTDEV"] > 0, "MNTDEV"].astype(np.float64)
+    return credits.sum(), len(credits)
+
+
+def test_fenetre_turnover():
+    dernier_instant = pd.Timedelta(days=1) - pd.Timedelta(1, "ns")
+    assert fenetre_turnover(2024, 1) == (pd.Timestamp("2023-11-01"), pd.Timestamp("2024-01-31") + dernier_instant)
+    assert fenetre_turnover(2024, 3, 1) == (pd.Timestamp("2024-03-01"), pd.Timestamp("2024-03-31") + dernier_instant)
+    assert fenetre_turnover(2024, 2, 12)[0] == pd.Timestamp("2023-03-01")
+
+
+@pytest.mark.parametrize("type_montant", ["int64", "int32", "float64", "float32", "manquants"])
+def test_credits_periode(mouvements, type_montant):
+    df = _montants(mouvements, type_montant)
+    credits = IndexCredits(IndexComptes(df, "DATOPER"))
+    assert credits.cumul.dtype == (np.int64 if type_montant.startswith("int") else np.float64)
+
+    rng = np.random.default_rng(0)
+    fenetres = [fenetre_turnover(annee, mois, nb_mois) for annee, mois in PERIODES for nb_mois in (1, 3, 12)]
+    fenetres += [tuple(sorted(pd.to_datetime(rng.integers(1.67e18, 1.72e18, 2)))) for _ in range(20)]
+    for compte in np.r_[df["COMPTE"].unique(), 1]:
+        for debut, fin in fenetres:
+            total, nb_credits = credits.credits_periode(compte, debut, fin)
+            total_attendu, nb_attendu = _reference(df, compte, debut, fin)
+            assert np.isclose(total, total_attendu, rtol=1e-6), (compte, debut, fin)
+            assert nb_credits == nb_attendu, (compte, debut, fin)
+
+
+def test_turnover_mouvements(mouvements):
+    """Crédits de la fenêtre de 3 mois rapportés au solde moyen du turnover sur les soldes"""
+    df_solde = generer_soldes(6, "2023-01-01", "2024-06-30", graine=23)
+    credits = IndexCredits(IndexComptes(mouvements, "DATOPER"))
+    nb_turnovers = 0
+    for compte in mouvements["COMPTE"].unique():
+        for annee, mois in PERIODES:
+            _, df_turnover = calculer_turnover_routed_depuis_solde(df_solde, compte, annee, mois)
+            moyenne = df_turnover["SOLDE"].mean() if df_turnover is not None else None
+            resultat = turnover_mouvements(credits, compte, annee, mois, moyenne)
+            total, nb_credits = _reference(mouvements, compte, *fenetre_turnover(annee, mois))
+            assert resultat["TOTAL_CREDITS_MOUVEMENTS"] == total
+            assert resultat["NB_CREDITS_MOUVEMENTS"] == nb_credits
+            if moyenne is None or moyenne == 0:
+                assert resultat["TURNOVER_MOUVEMENTS"] is None
+            else:
+                assert np.isclose(resultat["TURNOVER_MOUVEMENTS"], total / moyenne * 100)
+                nb_turnovers += 1
+    assert nb_turnovers > 20
+    for moyenne in (None, 0, np.nan):
+        assert turnover_mouvements(credits, mouvements["COMPTE"].iloc[0], 2024, 3, moyenne)[
+            "TURNOVER_MOUVEMENTS"] is None
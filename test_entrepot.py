@@ -0,0 +1,116 @@
+"""
+Ajouts successifs à l'entrepôt local (entrepot.py) comparés à une
+reconstruction complète.
+
+Deux extraits qui se chevauchent sont ajoutés l'un après l'autre : les
+soldes et mouvements relus par ``charger()`` doivent être ceux du premier
+extrait complétés des seules clés nouvelles du second, et les agrégats
+enregistrés (FLUX_ENTREE compris, y compris pour un mois comblé après coup
+entre deux mois déjà présents) ceux d'un ``CubeMensuel`` construit sur le
+DataFrame concaténé.
+
+    python -m pytest -q test_entrepot.py
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from cube_mensuel import CubeMensuel
+from entrepot import Entrepot
+from generateur import generer_mouvements, generer_soldes
+from index_comptes import IndexComptes
+from portefeuille import agreger_mensuel
+
+FIN_EXTRAIT_1 = pd.Timestamp("2024-04-15")
+DEBUT_EXTRAIT_2 = pd.Timestamp("2024-03-01")
+
+
+@pytest.fixture(scope="module")
+def extraits():
+    """Deux extraits de soldes et de mouvements qui se chevauchent de mars à mi-avril 2024"""
+    rng = np.random.default_rng(21)
+    soldes = generer_soldes(5, "2023-10-01", "2024-06-30", graine=21, taux_decouvert=0.5)
+    soldes = soldes[rng.random(len(soldes)) > 0.3]
+    mouvements = generer_mouvements(5, 2_000, "2023-10-01", "2024-06-30", graine=21)
+
+    # Février 2024 du premier compte n'arrive qu'avec le second extrait, après mars
+    compte = soldes["COMPTE"].min()
+    fevrier = (soldes["COMPTE"] == compte) & (soldes["DATPOS"].dt.to_period("M") == pd.Period("2024-02"))
+    solde_1 = soldes[(soldes["DATPOS"] < FIN_EXTRAIT_1) & ~fevrier]
+    solde_2 = soldes[(soldes["DATPOS"] >= DEBUT_EXTRAIT_2) | fevrier].copy()
+    # Les soldes déjà présents sont conservés : le second extrait les modifie
+    solde_2.loc[solde_2["DATPOS"] < FIN_EXTRAIT_1, "SOLDE"] += 1_000
+    # Un solde répété dans un extrait : la dernière ligne l'emporte
+    repete = solde_2[solde_2["DATPOS"] >= FIN_EXTRAIT_1].iloc[:1].assign(SOLDE=-123_456)
+    solde_2 = pd.concat([solde_2, repete], ignore_index=True)
+
+    mvt_1 = mouvements[mouvements["DATOPER"] < FIN_EXTRAIT_1]
+    mvt_2 = mouvements[mouvements["DATOPER"] >= DEBUT_EXTRAIT_2]
+    return solde_1, solde_2, mvt_1, mvt_2
+
+
+@pytest.fixture(scope="module")
+def attendus(extraits):
+    """Reconstruction complète : premier extrait, puis clés absentes du second"""
+    solde_1, solde_2, mvt_1, mvt_2 = extraits
+    solde_2 = solde_2.drop_duplicates(["COMPTE", "DATPOS"], keep="last")
+    soldes = pd.concat([solde_1, solde_2], ignore_index=True).drop_duplicates(["COMPTE", "DATPOS"], keep="first")
+
+    jours_1 = pd.MultiIndex.from_arrays([mvt_1["COMPTE"], mvt_1["DATOPER"].dt.normalize()])
+    nouveaux = ~pd.MultiIndex.from_arrays([mvt_2["COMPTE"], mvt_2["DATOPER"].dt.normalize()]).isin(jours_1)
+    mouvements = pd.concat([mvt_1, mvt_2[nouveaux]], ignore_index=True)
+    return soldes, mouvements
+
+
+def _triees(df, colonnes):
+    return df.sort_values(colonnes, kind="mergesort").reset_index(drop=True)
+
+
+def test_ajouts_successifs(tmp_path, extraits, attendus):
+    solde_1, solde_2, mvt_1, mvt_2 = extraits
+    soldes, mouvements = attendus
+    entrepot = Entrepot(str(tmp_path / "entrepot"))
+
+    bilan = entrepot.ajouter_extrait(solde_1, mvt_1, libelle="extrait 1")
+    assert bilan["SOLDES_AJOUTES"] == len(solde_1) and bilan["MOUVEMENTS_AJOUTES"] == len(mvt_1)
+    bilan = entrepot.ajouter_extrait(solde_2, mvt_2, libelle="extrait 2")
+    assert bilan["VERSION"] == 2
+    assert bilan["SOLDES_AJOUTES"] == len(soldes) - len(solde_1)
+    assert bilan["MOUVEMENTS_AJOUTES"] == len(mouvements) - len(mvt_1)
+    assert "2024-02" in bilan["MOIS_MODIFIES"]
+
+    donnees_solde, donnees_mvt = entrepot.charger()
+    pd.testing.assert_frame_equal(
+        _triees(donnees_solde.df, ["COMPTE", "DATPOS"]), _triees(soldes, ["COMPTE", "DATPOS"]), check_dtype=False
+    )
+    pd.testing.assert_frame_equal(
+        _triees(donnees_mvt.df, ["COMPTE", "DATOPER", "NOOPER"]),
+        _triees(mouvements, ["COMPTE", "DATOPER", "NOOPER"]),
+        check_dtype=False,
+    )
+
+    # Agrégats enregistrés et cube chargé : ceux d'une reconstruction complète
+    pd.testing.assert_frame_equal(
+        _triees(entrepot.lire_agregats(), ["COMPTE", "NUM_MOIS"]),
+        _triees(agreger_mensuel(soldes), ["COMPTE", "NUM_MOIS"]),
+        check_dtype=False,
+    )
+    reference = CubeMensuel(IndexComptes(soldes, "DATPOS"))
+    pd.testing.assert_frame_equal(donnees_solde.cube.df, reference.df, check_dtype=False)
+    # Février comblé après coup : la variation d'entrée de mars part du dernier solde de février
+    compte = soldes["COMPTE"].min()
+    agregats = reference.df[reference.df["COMPTE"] == compte].set_index("MOIS")
+    fevrier, mars = agregats.loc[pd.Period("2024-02")], agregats.loc[pd.Period("2024-03")]
+    assert np.isclose(mars["FLUX_ENTREE"], max(mars["PREMIER_SOLDE"] - fevrier["DERNIER_SOLDE"], 0.0))
+
+
+def test_ajout_repete(tmp_path, extraits):
+    """Un extrait déjà intégré n'ajoute rien et ne change pas la version"""
+    solde_1, _, mvt_1, _ = extraits
+    entrepot = Entrepot(str(tmp_path / "entrepot"))
+    entrepot.ajouter_extrait(solde_1, mvt_1)
+    agregats = entrepot.lire_agregats()
+    bilan = entrepot.ajouter_extrait(solde_1, mvt_1)
+    assert bilan["SOLDES_AJOUTES"] == bilan["MOUVEMENTS_AJOUTES"] == 0
+    assert bilan["VERSION"] == 1 and bilan["MOIS_MODIFIES"] == []
+    pd.testing.assert_frame_equal(entrepot.lire_agregats(), agregats)
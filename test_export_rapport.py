@@ -0,0 +1,91 @@
+"""
+Rapport multi-comptes exporté par lots (export_rapport.py) comparé, ligne à
+ligne, aux indicateurs de ``calculer_metriques_compte``.
+
+Le rapport est écrit en archive zip de fichiers Parquet avec des lots de
+quelques comptes, sur des soldes lacunaires : chaque ligne de
+``synthese.parquet`` doit donner les indicateurs du calcul par compte, et
+le classeur Excel la même synthèse que l'archive.
+
+    python -m pytest -q test_export_rapport.py
+"""
+import io
+import zipfile
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from calculs import calculer_metriques_compte
+from credits_mouvements import IndexCredits
+from export_rapport import exporter_rapport
+from generateur import generer_mouvements, generer_soldes
+from index_comptes import IndexComptes
+
+LIMITE = 1_000_000.0
+SEUIL = 0.0
+PERIODES = [(2024, 3), (2024, 9)]
+TAILLE_LOT = 3
+
+
+@pytest.fixture(scope="module")
+def donnees():
+    rng = np.random.default_rng(24)
+    df_solde = generer_soldes(8, "2023-01-01", "2024-09-30", graine=24, taux_decouvert=0.5)
+    df_solde = df_solde[rng.random(len(df_solde)) > 0.3]
+    comptes = np.sort(df_solde["COMPTE"].unique())
+    # Mois manquants et compte sans solde les 3 derniers mois
+    df_solde = df_solde[~(df_solde["COMPTE"].isin(comptes[:2]) & df_solde["DATPOS"].dt.month.isin([2, 8]))]
+    df_solde = df_solde[~((df_solde["COMPTE"] == comptes[2]) & (df_solde["DATPOS"] >= "2024-07-01"))]
+    df_mvt = generer_mouvements(8, 4_000, "2023-01-01", "2024-09-30", graine=24)
+    index_solde = IndexComptes(df_solde, "DATPOS")
+    index_mvt = IndexComptes(df_mvt, "DATOPER")
+    return df_solde, df_mvt, index_solde, index_mvt, IndexCredits(index_mvt)
+
+
+def _synthese_parquet(chemin):
+    with zipfile.ZipFile(chemin) as archive:
+        assert sorted(archive.namelist()) == ["soldes_mensuels.parquet", "synthese.parquet",
+                                              "turnover.parquet", "usage.parquet"]
+        return pd.read_parquet(io.BytesIO(archive.read("synthese.parquet")))
+
+
+def _egaux(valeur, reference):
+    if reference is None or pd.isna(reference):
+        return pd.isna(valeur)
+    return np.isclose(valeur, reference)
+
+
+@pytest.mark.parametrize("annee,mois", PERIODES)
+def test_synthese_egale_aux_metriques(tmp_path, donnees, annee, mois):
+    df_solde, df_mvt, index_solde, index_mvt, credits = donnees
+    chemin = tmp_path / "rapport.zip"
+    nb_comptes = exporter_rapport(str(chemin), index_solde, annee, mois, LIMITE, SEUIL, index_mvt=index_mvt,
+                                  credits=credits, format_export="zip", taille_lot=TAILLE_LOT)
+    synthese = _synthese_parquet(chemin)
+    assert nb_comptes == len(synthese) == len(index_solde.comptes)
+    assert synthese["COMPTE"].tolist() == index_solde.comptes.tolist()
+
+    for ligne in synthese.to_dict("records"):
+        reference = calculer_metriques_compte(df_solde, df_mvt, ligne["COMPTE"], annee, mois, limite_credit=LIMITE,
+                                              seuil_decouvert=SEUIL, credits=credits)
+        assert ligne.keys() == reference.keys()
+        for cle, valeur in reference.items():
+            assert _egaux(ligne[cle], valeur), (ligne["COMPTE"], cle, ligne[cle], valeur)
+
+
+def test_comptes_choisis_et_excel(tmp_path, donnees):
+    """Sélection de comptes (dont un inconnu) : même synthèse en Parquet et en Excel"""
+    _, _, index_solde, index_mvt, credits = donnees
+    comptes = list(index_solde.comptes[[6, 1, 4, 2]]) + [1]
+    parametres = dict(comptes=comptes, index_mvt=index_mvt, credits=credits, taille_lot=TAILLE_LOT)
+    nb_zip = exporter_rapport(str(tmp_path / "rapport.zip"), index_solde, 2024, 9, LIMITE, SEUIL,
+                              format_export="zip", **parametres)
+    nb_xlsx = exporter_rapport(str(tmp_path / "rapport.xlsx"), index_solde, 2024, 9, LIMITE, SEUIL,
+                               format_export="xlsx", **parametres)
+    assert nb_zip == nb_xlsx == 4
+
+    synthese = _synthese_parquet(tmp_path / "rapport.zip")
+    assert synthese["COMPTE"].tolist() == sorted(comptes[:4])
+    excel = pd.read_excel(tmp_path / "rapport.xlsx", sheet_name="SYNTHESE")
+    pd.testing.assert_frame_equal(excel, synthese, check_dtype=False)
@@ -0,0 +1,126 @@
+"""
+Indicateurs de la matrice dense des soldes (matrice_dense.py) comparés à
+``calculer_metriques_compte`` et à un calendrier reconstitué par pandas.
+
+Lorsqu'un compte a une position chaque jour, la base calendaire et la base
+des lignes présentes coïncident ; sur des soldes lacunaires, les flux
+créditeurs restent ceux des soldes observés et les moyennes portent sur
+les jours calendaires, le dernier solde connu étant reporté.
+
+    python -m pytest -q test_matrice_dense.py
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from calculs import calculer_metriques_compte
+from generateur import generer_soldes
+from index_comptes import IndexComptes
+from matrice_dense import MatriceSoldes
+
+LIMITE = 1_000_000.0
+MOIS = pd.period_range("2023-11", "2024-06", freq="M")
+
+
+def _soldes_quotidiens():
+    """Position chaque jour calendaire entre la première et la dernière date de chaque compte"""
+    rng = np.random.default_rng(11)
+    morceaux = []
+    for i, (debut, fin) in enumerate([("2023-10-01", "2024-06-30"), ("2023-12-17", "2024-06-30"),
+                                      ("2023-10-01", "2024-03-09"), ("2024-02-02", "2024-02-20")]):
+        dates = pd.date_range(debut, fin, freq="D")
+        soldes = np.cumsum(rng.normal(0, 200_000, len(dates))).astype(np.int64)
+        morceaux.append(pd.DataFrame({"COMPTE": 20000000 + i, "DATPOS": dates, "SOLDE": soldes}))
+    return pd.concat(morceaux, ignore_index=True).sample(frac=1, random_state=11)
+
+
+def _soldes_lacunaires():
+    rng = np.random.default_rng(12)
+    df = generer_soldes(6, "2023-10-01", "2024-06-30", graine=12)
+    df = df[rng.random(len(df)) > 0.35]
+    return df[~((df["COMPTE"] == df["COMPTE"].min()) & (df["DATPOS"].dt.month == 2))]
+
+
+def _egaux(valeur, reference):
+    if reference is None or pd.isna(reference):
+        return valeur is None or pd.isna(valeur)
+    return valeur is not None and np.isclose(valeur, reference)
+
+
+@pytest.mark.parametrize("cellules_bloc", [1, 2_000_000])
+def test_base_calendaire_sans_lacune(cellules_bloc):
+    """Une position chaque jour : mêmes indicateurs que calculer_metriques_compte"""
+    df = _soldes_quotidiens()
+    index = IndexComptes(df, "DATPOS")
+    matrice = MatriceSoldes(index, cellules_bloc=cellules_bloc)
+    nb_comparaisons = 0
+    for compte in index.comptes:
+        for mois in MOIS:
+            reference = calculer_metriques_compte(df, None, compte, mois.year, mois.month, limite_credit=LIMITE)
+            usage = matrice.usage(compte, mois.year, mois.month, LIMITE)
+            if reference["NB_LIGNES_SOLDE"] == 0:
+                assert usage is None
+            else:
+                for cle in ("TAUX_USAGE_MOYEN", "TAUX_USAGE_MAX", "SOLDE_MOYEN"):
+                    assert _egaux(usage[cle], reference[cle]), (compte, mois, cle)
+                assert usage["NB_JOURS_OBSERVES"] == usage["NB_JOURS_CALENDAIRES"] == reference["NB_LIGNES_SOLDE"]
+                nb_comparaisons += 1
+
+            turnover = matrice.turnover(compte, mois.year, mois.month)
+            if reference["TURNOVER_ROUTED"] is None:
+                assert turnover is None or turnover["MOYENNE_SOLDE_3M"] == 0
+            else:
+                for cle in ("TURNOVER_ROUTED", "TOTAL_FLUX_CREDITEUR", "MOYENNE_SOLDE_3M"):
+                    assert _egaux(turnover[cle], reference[cle]), (compte, mois, cle)
+    assert nb_comparaisons > 20
+
+
+@pytest.mark.parametrize("cellules_bloc", [1, 500, 2_000_000])
+def test_base_calendaire_lacunaire(cellules_bloc):
+    """Soldes lacunaires : calendrier reporté comme pandas, flux créditeurs des soldes observés"""
+    df = _soldes_lacunaires()
+    index = IndexComptes(df, "DATPOS")
+    matrice = MatriceSoldes(index, cellules_bloc=cellules_bloc)
+
+    for compte in index.comptes:
+        lignes = index.lignes_compte(compte).set_index("DATPOS")["SOLDE"]
+        calendrier = lignes.reindex(pd.date_range(lignes.index.min(), lignes.index.max(), freq="D")).ffill()
+        for mois in MOIS:
+            reference = calculer_metriques_compte(df, None, compte, mois.year, mois.month, limite_credit=LIMITE)
+            usage = matrice.usage(compte, mois.year, mois.month, LIMITE)
+            jours_mois = calendrier[calendrier.index.to_period("M") == mois]
+            if jours_mois.empty:
+                assert usage is None
+            else:
+                assert np.isclose(usage["SOLDE_MOYEN"], jours_mois.mean()), (compte, mois)
+                assert np.isclose(usage["TAUX_USAGE_MAX"], jours_mois.max() / LIMITE * 100), (compte, mois)
+                assert usage["NB_JOURS_CALENDAIRES"] == len(jours_mois)
+                assert usage["NB_JOURS_OBSERVES"] == reference["NB_LIGNES_SOLDE"]
+
+            turnover = matrice.turnover(compte, mois.year, mois.month)
+            if reference["TURNOVER_ROUTED"] is not None:
+                assert _egaux(turnover["TOTAL_FLUX_CREDITEUR"], reference["TOTAL_FLUX_CREDITEUR"]), (compte, mois)
+                fenetre = calendrier[(calendrier.index.to_period("M") >= mois - 2)
+                                     & (calendrier.index.to_period("M") <= mois)]
+                assert np.isclose(turnover["MOYENNE_SOLDE_3M"], fenetre.mean()), (compte, mois)
+
+
+def test_portefeuille_coherent_avec_comptes():
+    """Réductions sur tous les comptes égales aux résultats compte par compte"""
+    df = _soldes_lacunaires()
+    matrice = MatriceSoldes(IndexComptes(df, "DATPOS"), cellules_bloc=700)
+    usage = matrice.usage_portefeuille(LIMITE).set_index(["COMPTE", "MOIS"])
+    turnover = matrice.turnover_portefeuille(2024, 4).set_index("COMPTE")
+    for compte in matrice.comptes:
+        for mois in MOIS:
+            attendu = matrice.usage(compte, mois.year, mois.month, LIMITE)
+            if attendu is not None:
+                assert np.isclose(usage.loc[(compte, mois), "TAUX_USAGE_MOYEN"], attendu["TAUX_USAGE_MOYEN"])
+        attendu = matrice.turnover(compte, 2024, 4)
+        assert _egaux(turnover.loc[compte, "TURNOVER_ROUTED_3M"], attendu and attendu["TURNOVER_ROUTED"])
+
+
+def test_matrice_trop_volumineuse():
+    index = IndexComptes(_soldes_lacunaires(), "DATPOS")
+    with pytest.raises(ValueError, match="trop volumineuse"):
+        MatriceSoldes(index, cellules_max=100)
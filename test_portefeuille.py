@@ -0,0 +1,110 @@
+"""
+Équivalence des calculs vectorisés du portefeuille (portefeuille.py) avec
+les calculs par compte et par mois de calculs.py.
+
+Les soldes générés sont lacunaires (jours supprimés au hasard, mois
+entiers manquants, comptes démarrant ou s'arrêtant en cours de période) ;
+chaque historique est comparé au calcul de référence pour tous les
+couples (compte, mois), sans index, avec l'index par compte et avec le
+cube mensuel.
+
+    python -m pytest -q test_portefeuille.py
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from calculs import analyser_decouvert_et_credit_line_overdraft, calculer_turnover_routed_depuis_solde
+from cube_mensuel import CubeMensuel
+from generateur import generer_soldes
+from index_comptes import IndexComptes
+from portefeuille import analyser_duree_decouvert_portefeuille, historique_decouvert, historique_turnover
+
+SEUIL = 0.0
+VARIANTES = ["sans_index", "index", "cube"]
+
+
+@pytest.fixture(scope="module")
+def soldes():
+    """Soldes journaliers lacunaires de 8 comptes sur un peu plus de deux ans"""
+    rng = np.random.default_rng(7)
+    df = generer_soldes(8, "2022-11-01", "2024-12-31", graine=7, taux_decouvert=0.5)
+    comptes = np.sort(df["COMPTE"].unique())
+    mois = df["DATPOS"].dt.month
+    garder = rng.random(len(df)) > 0.3
+    # Mois entiers manquants, comptes ouverts tard ou clôturés tôt
+    garder &= ~(df["COMPTE"].isin(comptes[:3]) & mois.isin([3, 4, 7]))
+    garder &= ~((df["COMPTE"] == comptes[3]) & (df["DATPOS"] < "2023-06-15"))
+    garder &= ~((df["COMPTE"] == comptes[4]) & (df["DATPOS"] > "2024-02-10"))
+    # Une seule position de janvier à avril 2023 : fenêtres de moins de 2 soldes
+    isole = (df["COMPTE"] == comptes[5]) & (df["DATPOS"] >= "2023-01-01") & (df["DATPOS"] < "2023-05-01")
+    garder &= ~isole | (df["DATPOS"] == df.loc[isole, "DATPOS"].min())
+    # Mélange des lignes : les calculs ne doivent pas dépendre de l'ordre du fichier
+    df = df[garder].sample(frac=1, random_state=7).reset_index(drop=True)
+    return df
+
+
+@pytest.fixture(scope="module")
+def sources(soldes):
+    """Arguments index/cube de chaque variante"""
+    index = IndexComptes(soldes, "DATPOS")
+    return {
+        "sans_index": {},
+        "index": {"index": index},
+        "cube": {"index": index, "cube": CubeMensuel(index)},
+    }
+
+
+def _egaux(valeur, reference):
+    if reference is None or pd.isna(reference):
+        return valeur is None or pd.isna(valeur)
+    return valeur is not None and not pd.isna(valeur) and np.isclose(valeur, reference)
+
+
+@pytest.mark.parametrize("variante", VARIANTES)
+def test_historique_turnover(soldes, sources, variante):
+    historique = historique_turnover(soldes, **sources[variante])
+    assert 0 < historique["TURNOVER_ROUTED_3M"].isna().sum() < len(historique)
+    for ligne in historique.itertuples():
+        reference, _ = calculer_turnover_routed_depuis_solde(soldes, ligne.COMPTE, ligne.MOIS.year, ligne.MOIS.month)
+        assert _egaux(ligne.TURNOVER_ROUTED_3M, reference), (ligne.COMPTE, ligne.MOIS)
+
+
+@pytest.mark.parametrize("variante", VARIANTES)
+def test_historique_turnover_par_compte(soldes, sources, variante):
+    tous = historique_turnover(soldes, **sources[variante])
+    for compte in soldes["COMPTE"].unique():
+        historique = historique_turnover(soldes, compte, **sources[variante])
+        attendu = tous[tous["COMPTE"] == compte].reset_index(drop=True)
+        pd.testing.assert_frame_equal(historique.reset_index(drop=True), attendu)
+
+
+@pytest.mark.parametrize("variante", VARIANTES)
+def test_historique_decouvert(soldes, sources, variante):
+    historique = historique_decouvert(soldes, SEUIL, **sources[variante])
+    assert historique["NB_EPISODES_DECOUVERT"].sum() > 0
+    for ligne in historique.itertuples():
+        duree, _, _, nb_credit_line = analyser_decouvert_et_credit_line_overdraft(
+            soldes, ligne.COMPTE, ligne.MOIS.to_timestamp(), SEUIL
+        )
+        assert _egaux(ligne.DUREE_MOYENNE_DECOUVERT, duree), (ligne.COMPTE, ligne.MOIS)
+        assert ligne.NB_CREDIT_LINE_OVERDRAFT == nb_credit_line, (ligne.COMPTE, ligne.MOIS)
+
+
+@pytest.mark.parametrize("variante", VARIANTES)
+def test_historique_decouvert_par_compte(soldes, sources, variante):
+    tous = historique_decouvert(soldes, SEUIL, **sources[variante])
+    for compte in soldes["COMPTE"].unique():
+        historique = historique_decouvert(soldes, SEUIL, compte, **sources[variante])
+        attendu = tous[tous["COMPTE"] == compte].reset_index(drop=True)
+        pd.testing.assert_frame_equal(historique.reset_index(drop=True), attendu)
+
+
+@pytest.mark.parametrize("variante", ["sans_index", "index"])
+@pytest.mark.parametrize("date_position", ["2023-03-01", "2023-11-01", "2024-05-01", "2025-01-01"])
+def test_durees_decouvert_portefeuille(soldes, sources, variante, date_position):
+    date_position = pd.Timestamp(date_position)
+    durees = analyser_duree_decouvert_portefeuille(soldes, date_position, SEUIL, **sources[variante])
+    for ligne in durees.itertuples():
+        duree, _, _, _ = analyser_decouvert_et_credit_line_overdraft(soldes, ligne.COMPTE, date_position, SEUIL)
+        assert _egaux(ligne.DUREE_MOYENNE_DECOUVERT, duree), ligne.COMPTE
@@ -0,0 +1,87 @@
+"""
+Balayage des limites de crédit et des seuils de découvert (sensibilite.py)
+comparé, en quelques points des plages, aux calculs unitaires
+``calculer_usage_rate_mensuel`` et ``analyser_decouvert_et_credit_line_overdraft``.
+
+    python -m pytest -q test_sensibilite.py
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from calculs import (
+    analyser_decouvert_et_credit_line_overdraft,
+    calculer_usage_rate_mensuel,
+    filtrer_par_compte_mois_annee,
+)
+from cube_mensuel import CubeMensuel
+from generateur import generer_soldes
+from index_comptes import IndexComptes
+from sensibilite import calculer_sensibilite
+
+LIMITES = np.linspace(-500_000, 5_000_000, 23)
+SEUILS = np.linspace(-3_000_000, 3_000_000, 25)
+PERIODES = [(2024, 1), (2024, 6), (2024, 12)]
+
+
+@pytest.fixture(scope="module")
+def soldes():
+    rng = np.random.default_rng(5)
+    df = generer_soldes(6, "2023-01-01", "2024-12-31", graine=5, taux_decouvert=0.5)
+    df = df[rng.random(len(df)) > 0.3]
+    return df[~((df["COMPTE"] == df["COMPTE"].min()) & df["DATPOS"].dt.month.isin([4, 5, 9]))]
+
+
+@pytest.fixture(scope="module")
+def sources(soldes):
+    index = IndexComptes(soldes, "DATPOS")
+    return {"sans_index": {}, "index": {"index": index}, "cube": {"index": index, "cube": CubeMensuel(index)}}
+
+
+@pytest.mark.parametrize("variante", ["sans_index", "index", "cube"])
+def test_balayages(soldes, sources, variante):
+    nb_limites, nb_seuils = 0, 0
+    for compte in soldes["COMPTE"].unique():
+        for annee, mois in PERIODES:
+            resultat = calculer_sensibilite(soldes, compte, annee, mois, LIMITES, SEUILS, **sources[variante])
+            soldes_mois, _ = filtrer_par_compte_mois_annee(soldes, None, compte, annee, mois)
+
+            # Limites de crédit : seules les limites positives sont évaluées
+            if resultat["LIMITES"] is None:
+                assert soldes_mois.empty
+            else:
+                assert (resultat["LIMITES"]["LIMITE_CREDIT"] > 0).all()
+                for ligne in resultat["LIMITES"].iloc[::5].itertuples():
+                    taux_moyen, df_usage = calculer_usage_rate_mensuel(soldes_mois, ligne.LIMITE_CREDIT)
+                    assert np.isclose(ligne.TAUX_USAGE_MOYEN, taux_moyen)
+                    assert np.isclose(ligne.TAUX_USAGE_MAX, df_usage["TAUX_USAGE"].max())
+                    assert ligne.NB_JOURS_AU_DELA == (df_usage["SOLDE"] > ligne.LIMITE_CREDIT).sum()
+                    nb_limites += 1
+
+            # Seuils de découvert : mêmes mois et même durée moyenne que l'analyse du compte
+            date_position = pd.Timestamp(year=annee, month=mois, day=1)
+            for ligne in (resultat["SEUILS"].iloc[::4].itertuples() if resultat["SEUILS"] is not None else []):
+                duree, solde_decouvert, _, _ = analyser_decouvert_et_credit_line_overdraft(
+                    soldes, compte, date_position, ligne.SEUIL_DECOUVERT
+                )
+                assert np.isclose(ligne.DUREE_MOYENNE_DECOUVERT, duree)
+                assert ligne.NB_MOIS_DECOUVERT == solde_decouvert["A_DECOUVERT"].sum()
+                nb_seuils += 1
+    assert nb_limites > 20 and nb_seuils > 20
+
+
+@pytest.mark.parametrize("variante", ["sans_index", "index"])
+def test_limite_100(soldes, sources, variante):
+    """Limite de bascule : taux moyen de 100 %, absente lorsque le solde moyen est négatif ou nul"""
+    nb_negatifs = 0
+    for compte in soldes["COMPTE"].unique():
+        for annee, mois in PERIODES:
+            resultat = calculer_sensibilite(soldes, compte, annee, mois, LIMITES, SEUILS, **sources[variante])
+            soldes_mois, _ = filtrer_par_compte_mois_annee(soldes, None, compte, annee, mois)
+            if soldes_mois.empty or soldes_mois["SOLDE"].mean() <= 0:
+                assert resultat["LIMITE_100"] is None
+                nb_negatifs += not soldes_mois.empty
+            else:
+                taux_moyen, _ = calculer_usage_rate_mensuel(soldes_mois, resultat["LIMITE_100"])
+                assert np.isclose(taux_moyen, 100)
+    assert nb_negatifs > 0